@@ -0,0 +1,331 @@
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+import config
+import metrics
+import process_pool
+
+"""
+构建各阶段的规模基准测试
+
+按给定规模生成合成的 Source 规则（混合规则、domainset、ipcidr 各一份），
+每个阶段在独立的子进程中运行，分别记录墙钟时间、CPU 时间与峰值内存（RSS）增量，
+结果写入 JSON，并与保存的基线比较，超过阈值的退化会使进程以非零状态退出。
+"""
+
+BENCH_DIR = os.path.join(config.CACHE_DIR, "bench")
+DEFAULT_SIZES = ["10k", "100k", "1M", "5M"]
+STAGE_MODULES = {
+    "clash": "build_clash",
+    "singbox": "build_singbox",
+    "surge": "build_surge",
+    "smartdns": "build_smartdns",
+    "mrs": "build_mrs",
+    "web": "build_web",
+}
+STAGES = list(STAGE_MODULES)
+# 生成器改变后需要更新，以免复用旧的合成数据
+DATA_VERSION = 1
+
+# 混合规则集中各类型的占比
+RULE_MIX = [
+    ("DOMAIN-SUFFIX", 0.55),
+    ("DOMAIN", 0.25),
+    ("DOMAIN-KEYWORD", 0.02),
+    ("IP-CIDR", 0.13),
+    ("IP-CIDR6", 0.02),
+    ("PROCESS-NAME", 0.03),
+]
+TLDS = ["com", "net", "org", "cn", "io", "jp", "co.uk", "com.cn", "dev", "app"]
+LABEL_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789"
+
+
+def parse_size(text: str) -> int:
+    units = {"k": 1_000, "m": 1_000_000}
+    text = text.strip().lower()
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def _domain(rng: random.Random) -> str:
+    labels = [
+        "".join(rng.choices(LABEL_CHARS, k=rng.randint(3, 12)))
+        for _ in range(rng.choice((1, 1, 2, 2, 3)))
+    ]
+    return ".".join(labels + [rng.choice(TLDS)])
+
+
+def _ipv4(rng: random.Random) -> str:
+    prefix = rng.choice((8, 12, 16, 20, 22, 24, 24, 24, 28, 32))
+    value = rng.getrandbits(32) & ~((1 << (32 - prefix)) - 1)
+    return (
+        f"{value >> 24}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}/{prefix}"
+    )
+
+
+def _ipv6(rng: random.Random) -> str:
+    prefix = rng.choice((32, 36, 40, 48, 64))
+    value = (0x2000 << 112 | rng.getrandbits(125)) & ~((1 << (128 - prefix)) - 1)
+    groups = [f"{value >> (112 - 16 * i) & 0xFFFF:x}" for i in range(8)]
+    return f"{':'.join(groups)}/{prefix}"
+
+
+def _mixed_rule(rng: random.Random, rule_type: str) -> str:
+    if rule_type == "DOMAIN-KEYWORD":
+        return f"{rule_type},{''.join(rng.choices(LABEL_CHARS, k=rng.randint(4, 10)))}"
+    if rule_type == "IP-CIDR":
+        return f"{rule_type},{_ipv4(rng)},no-resolve"
+    if rule_type == "IP-CIDR6":
+        return f"{rule_type},{_ipv6(rng)},no-resolve"
+    if rule_type == "PROCESS-NAME":
+        return f"{rule_type},{''.join(rng.choices(LABEL_CHARS, k=8))}.exe"
+    return f"{rule_type},{_domain(rng)}"
+
+
+def generate(source_dir: str, size: int, seed: int = 0) -> None:
+    """生成 Mixed.conf、Domainset.conf 与 CIDR.conf，每个文件 size 条规则。"""
+    os.makedirs(source_dir, exist_ok=True)
+    rng = random.Random(seed)
+    types, weights = zip(*RULE_MIX)
+
+    writers = {
+        "Mixed.conf": lambda: _mixed_rule(rng, rng.choices(types, weights)[0]),
+        "Domainset.conf": lambda: (
+            f".{_domain(rng)}" if rng.random() < 0.6 else _domain(rng)
+        ),
+        "CIDR.conf": lambda: _ipv4(rng) if rng.random() < 0.9 else _ipv6(rng),
+    }
+    for filename, make_line in writers.items():
+        path = os.path.join(source_dir, filename)
+        with open(path + ".tmp", "w", encoding="utf-8", newline="\n") as f:
+            f.write(f"# Synthetic {filename} ({size} rules)\n")
+            batch = []
+            for _ in range(size):
+                batch.append(make_line())
+                if len(batch) >= 10_000:
+                    f.write("\n".join(batch) + "\n")
+                    batch.clear()
+            if batch:
+                f.write("\n".join(batch) + "\n")
+        os.replace(path + ".tmp", path)
+
+
+def prepare(size: int) -> str:
+    """返回该规模的工作目录（其中 Public/List/Source 为合成数据），数据已存在时直接复用。"""
+    work_dir = os.path.join(BENCH_DIR, f"data-v{DATA_VERSION}", str(size))
+    source_dir = os.path.join(work_dir, "Public", "List", "Source")
+    stamp = os.path.join(work_dir, ".complete")
+    if not os.path.exists(stamp):
+        print(f"[Bench] Generating {size} rules per list...")
+        generate(source_dir, size)
+        open(stamp, "w").close()
+    return work_dir
+
+
+def run_stage(stage: str, work_dir: str) -> None:
+    public_dir = os.path.join(work_dir, "Public")
+    source_dir = os.path.join(public_dir, "List", "Source")
+
+    def out(name: str) -> str:
+        path = os.path.join(public_dir, "List", name)
+        shutil.rmtree(path, ignore_errors=True)
+        return path
+
+    if stage == "clash":
+        import build_clash
+
+        build_clash.build(source_dir, out("Clash"))
+    elif stage == "singbox":
+        import build_singbox
+
+        build_singbox.build(source_dir, out("sing-box"))
+    elif stage == "surge":
+        import build_surge
+
+        build_surge.build(source_dir, out("Surge"))
+    elif stage == "smartdns":
+        import build_smartdns
+
+        smartdns_dir = out("smartdns")
+        build_smartdns.build(
+            {
+                os.path.join(source_dir, "Domainset.conf"): os.path.join(
+                    smartdns_dir, "Domainset.conf"
+                )
+            },
+            smartdns_dir,
+        )
+    elif stage == "mrs":
+        import build_mrs
+
+        # 使用内置编码器，不依赖 mihomo 可执行文件，也不使用编译缓存
+        build_mrs.build(source_dir, out("mihomo"), workers=1, encoder="native")
+    elif stage == "web":
+        import build_web
+
+        build_web.generate_file_tree_html(public_dir)
+    else:
+        raise ValueError(f"unknown stage: {stage}")
+
+
+def _peak_rss_kib() -> int:
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KiB 为单位
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(stage: str, work_dir: str) -> dict:
+    """在当前进程中运行一个阶段并返回其指标，由 bench 的子进程调用。"""
+    # 模块导入不计入阶段的内存与耗时
+    importlib.import_module(STAGE_MODULES[stage])
+    rss_before = _peak_rss_kib()
+    started = time.perf_counter()
+    # CPU 时间取自构建指标，包括工作线程与进程池子进程中的部分
+    with contextlib.redirect_stdout(open(os.devnull, "w")), metrics.stage(stage) as m:
+        run_stage(stage, work_dir)
+        # 等待进程池退出；子进程的内存不计入
+        process_pool.shutdown()
+    return {
+        "wall": round(time.perf_counter() - started, 4),
+        "cpu": round(m.cpu, 4),
+        "peak_rss_kib": _peak_rss_kib() - rss_before,
+    }
+
+
+def run_isolated(stage: str, work_dir: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, __file__, "--measure", stage, work_dir],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{stage} failed:\n{result.stderr}")
+    # 进程池的子进程直接写入标准输出，结果是最后一个 JSON 行
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    return json.loads(lines[-1])
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """返回超过阈值的退化项；过小的绝对差值（计时噪声）不计入。"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric, floor in (("wall", 0.05), ("peak_rss_kib", 4096)):
+            before, after = previous[metric], current[metric]
+            if after > before * (1 + threshold) and after - before > floor:
+                regressions.append(
+                    f"{key} {metric}: {before} -> {after} (+{(after / before - 1) * 100 if before else float('inf'):.0f}%)"
+                )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark each build stage")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(DEFAULT_SIZES),
+        help=f"comma separated rules per list (default: {','.join(DEFAULT_SIZES)})",
+    )
+    parser.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help=f"comma separated stages (default: {','.join(STAGES)})",
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join(BENCH_DIR, "results.json"),
+        help="where to write the results",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=os.path.join(BENCH_DIR, "baseline.json"),
+        help="results to compare against",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed slowdown or memory growth before failing (default: 0.2 = 20%%)",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="save these results as the new baseline",
+    )
+    parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return 0
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for label in args.sizes.split(","):
+        size = parse_size(label)
+        work_dir = prepare(size)
+        # web 统计各阶段产物，需要排在最后
+        for stage in sorted(stages, key=STAGES.index):
+            key = f"{stage}@{label.strip()}"
+            results[key] = run_isolated(stage, work_dir)
+            r = results[key]
+            print(
+                f"[Bench] {key}: {r['wall']:.3f}s wall, {r['cpu']:.3f}s cpu, {r['peak_rss_kib'] / 1024:.1f} MiB peak RSS"
+            )
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "created_at": time.time(),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[Bench] Results written to {args.output}")
+
+    if args.update_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"[Bench] Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(
+            "[Bench] No baseline to compare against, use --update-baseline to save one"
+        )
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    for line in regressions:
+        print(f"[Bench] Regression: {line}")
+    if regressions:
+        return 1
+    print(f"[Bench] No regressions over {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import argparse
+import contextlib
+import os
+import re
+import tempfile
+import time
+
+import bench
+import ruleset
+import until
+
+"""
+逐行读取的微基准测试
+
+在 bench 生成的合成规则上，比较 until 中基于 mmap 按字节处理的行读取与之前按 str 逐行处理的实现，
+两者结果必须相同，输出每个函数取多次运行中最快一次的耗时与加速比。
+"""
+
+DEFAULT_SIZES = ["100k", "1M"]
+
+
+def legacy_read_clean_lines(file_path: str) -> list[str]:
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        return [
+            line.strip()
+            for line in f
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+def legacy_parse(file_path: str) -> ruleset.Ruleset:
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        raw_lines = f.read().splitlines(keepends=True)
+
+    header_lines: list[str] = []
+    for line in raw_lines:
+        if line.strip().startswith("#"):
+            header_lines.append(line)
+        else:
+            break
+
+    lines = [
+        stripped
+        for line in raw_lines
+        if (stripped := line.strip()) and not stripped.startswith("#")
+    ]
+    return ruleset.Ruleset(
+        name=os.path.basename(file_path).rsplit(".", 1)[0],
+        path=file_path,
+        header="".join(header_lines) if header_lines else None,
+        lines=lines,
+        kind=ruleset.detect_kind(lines),
+    )
+
+
+def legacy_clear_comment(src_file, dest_file) -> None:
+    with open(src_file, "r", encoding="utf-8") as src:
+        lines = src.readlines()
+
+    cleaned_lines = []
+    for line in lines:
+        match = re.match(r"^[^#]*", line)
+        if match:
+            cleaned_lines.append(match.group(0).rstrip() + "\n")
+        else:
+            cleaned_lines.append("\n")
+
+    cleaned_lines = [line for line in cleaned_lines if line.strip()]
+
+    with open(dest_file, "w", encoding="utf-8", newline="\n") as dest:
+        dest.writelines(filter(None, cleaned_lines))
+
+
+def legacy_deduplicate(src_file, dest_file) -> None:
+    lines_seen = set()
+    output_lines = []
+
+    with open(src_file, "r", encoding="utf-8") as file:
+        for line in file:
+            stripped_line = line.strip()
+            if (
+                stripped_line == ""
+                or stripped_line.startswith("#")
+                or stripped_line not in lines_seen
+            ):
+                output_lines.append(line)
+                if stripped_line != "":
+                    lines_seen.add(stripped_line)
+
+    with open(dest_file, "w", encoding="utf-8", newline="\n") as file:
+        file.writelines(output_lines)
+
+
+def _quiet(func):
+    # clear_comment 与 deduplicate 每次调用都会打印一行
+    def run(*args):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return func(*args)
+
+    return run
+
+
+def _best(func, args, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def run(path: str, out_dir: str, repeat: int) -> dict[str, tuple[float, float]]:
+    """返回 {函数名: (之前的耗时, 现在的耗时)}，结果不一致时抛出 AssertionError。"""
+    results = {}
+
+    for name, legacy, current in (
+        ("read_clean_lines", legacy_read_clean_lines, until.read_clean_lines),
+        ("ruleset.parse", legacy_parse, ruleset.parse),
+    ):
+        assert legacy(path) == current(path), f"{name} differs on {path}"
+        results[name] = (
+            _best(legacy, (path,), repeat),
+            _best(current, (path,), repeat),
+        )
+
+    for name, legacy, current in (
+        ("clear_comment", legacy_clear_comment, _quiet(until.clear_comment)),
+        ("deduplicate", legacy_deduplicate, _quiet(until.deduplicate)),
+    ):
+        legacy_out = os.path.join(out_dir, f"{name}.legacy")
+        current_out = os.path.join(out_dir, f"{name}.current")
+        legacy(path, legacy_out)
+        current(path, current_out)
+        assert _read(legacy_out) == _read(current_out), f"{name} differs on {path}"
+        results[name] = (
+            _best(legacy, (path, legacy_out), repeat),
+            _best(current, (path, current_out), repeat),
+        )
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare the byte-level line helpers with the previous ones"
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(DEFAULT_SIZES),
+        help=f"comma separated rules per list (default: {','.join(DEFAULT_SIZES)})",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per function (default: 3)"
+    )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        for label in args.sizes.split(","):
+            source_dir = os.path.join(
+                bench.prepare(bench.parse_size(label)), "Public", "List", "Source"
+            )
+            for filename in sorted(os.listdir(source_dir)):
+                path = os.path.join(source_dir, filename)
+                for name, (before, after) in run(path, out_dir, args.repeat).items():
+                    print(
+                        f"[Bench] {name} {filename}@{label.strip()}: "
+                        f"{before:.3f}s -> {after:.3f}s ({before / after:.1f}x)"
+                    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,10 +2,17 @@ import datetime
 
 start_time = datetime.datetime.now()
 
+import argparse
 import config
+import download
+import metrics
 import os
+import process_pool
+import scheduler
 import shutil
+import sys
 import until
+from incremental import Manifest
 
 OUT_DIR: str = config.OUT_DIR
 INIT_DIR_NAME: tuple = config.INIT_DIR_NAME
@@ -16,109 +23,273 @@ RULESET_DIR: str = config.RULESET_DIR
 OUT_RULESET_DIR: str = config.OUT_RULESET_DIR
 OUT_SOURCE_RULESET_DIR: str = config.OUT_SOURCE_RULESET_DIR
 
+parser = argparse.ArgumentParser(description="Build all rulesets into Public")
+parser.add_argument(
+    "--clean",
+    action="store_true",
+    help="remove the last generated files and rebuild everything",
+)
+parser.add_argument(
+    "--offline",
+    action="store_true",
+    help="build upstream lists only from previously cached downloads",
+)
+parser.add_argument(
+    "--deterministic",
+    action="store_true",
+    help="only bump Last Updated when the content of a list actually changes",
+)
+
 
-def init() -> None:
-    if os.path.exists(OUT_DIR):
-        print("[Build] Clear the last generated files…")
-        shutil.rmtree(OUT_DIR)
+def init(options: argparse.Namespace, manifest: Manifest) -> None:
+    """options: parser 解析出的命令行参数"""
+    if options.clean:
+        if os.path.exists(OUT_DIR):
+            print("[Build] Clear the last generated files…")
+            shutil.rmtree(OUT_DIR)
+        manifest.entries.clear()
     for dir_name in INIT_DIR_NAME:
-        os.makedirs(os.path.join(OUT_DIR, dir_name))
+        os.makedirs(os.path.join(OUT_DIR, dir_name), exist_ok=True)
+
+
+def sync_copy(src, dest) -> list[str]:
+    """复制文件或目录，只复制大小或修改时间不同的文件，返回目标文件列表。"""
+    if os.path.isdir(src):
+        pairs = [
+            (
+                os.path.join(root, file),
+                os.path.join(dest, os.path.relpath(root, src), file),
+            )
+            for root, _, files in os.walk(src)
+            for file in files
+        ]
+    else:
+        pairs = [(src, dest)]
+
+    for src_file, dest_file in pairs:
+        src_stat = os.stat(src_file)
+        if os.path.exists(dest_file):
+            dest_stat = os.stat(dest_file)
+            if (
+                dest_stat.st_size == src_stat.st_size
+                and int(dest_stat.st_mtime) == int(src_stat.st_mtime)
+            ):
+                continue
+        os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+        shutil.copy2(src_file, dest_file)
+
+    return [os.path.normpath(dest_file) for _, dest_file in pairs]
 
 
 def copy_files() -> None:
     print("[Build] Copy files that do not need to be generated…")
     for path in COPY_PATH:
         src, dest = os.path.join(PROCESS_DIR, path), os.path.join(OUT_DIR, path)
-        (
-            shutil.copytree(src, dest, dirs_exist_ok=True)
-            if os.path.isdir(src)
-            else shutil.copy2(src, dest)
-        )
+        MANIFEST.record(f"copy:{path}", output_paths=sync_copy(src, dest))
 
     for src, dest in COPY_SOURCE_PATH.items():
-        shutil.copytree(
-            os.path.join(PROCESS_DIR, src),
-            os.path.join(OUT_SOURCE_RULESET_DIR, dest),
-            dirs_exist_ok=True,
+        MANIFEST.record(
+            f"copy:{os.path.relpath(src, PROCESS_DIR)}",
+            output_paths=sync_copy(
+                os.path.join(PROCESS_DIR, src),
+                os.path.join(OUT_SOURCE_RULESET_DIR, dest),
+            ),
         )
 
+    for src, dest in config.COPY_FILE.items():
+        MANIFEST.record(f"copy:{os.path.basename(src)}", output_paths=sync_copy(src, dest))
+    for src, dest in config.README_FILE.items():
+        shutil.move(src, dest)
+
+
+def run_stage(key, func, input_paths, output_paths, stage_config) -> None:
+    """输入、配置与产物都未变化时跳过整个阶段。"""
+    if MANIFEST.is_fresh(key, input_paths, stage_config):
+        print(f"[Build] {key} is up to date, skipped")
+        return
+    func()
+    MANIFEST.record(key, input_paths, output_paths, stage_config)
+
+
+def run_upstream_stage(key, func, module, urls, output_paths) -> None:
+    """先获取（或从缓存读取）上游内容，以其内容哈希判断是否需要重新生成。"""
+    body_paths = download.fetch_all(urls)
+    run_stage(key, func, [module.__file__, *body_paths], output_paths, list(urls))
+
 
 def clear_config_comment() -> None:
     print("[Build] Start clearing config comment…")
 
     for src, dest in config.CONFIG_FILE_CLEAR.items():
-        until.clear_comment(src, dest)
+        run_stage(
+            f"config:{os.path.basename(dest)}",
+            lambda src=src, dest=dest: until.clear_comment(src, dest),
+            [src, until.__file__],
+            [dest],
+            None,
+        )
 
     print("[Build] End clearing config comment")
 
 
-def build_form_dnsmasq_china_list() -> None:
+def build_form_dnsmasq_china_list(output_paths) -> None:
     import build_form_dnsmasq_china_list
 
-    build_form_dnsmasq_china_list.build(
-        config.DNSMASQ_CHINA_LIST, OUT_SOURCE_RULESET_DIR
+    run_upstream_stage(
+        "upstream:dnsmasq",
+        lambda: build_form_dnsmasq_china_list.build(
+            config.DNSMASQ_CHINA_LIST, OUT_SOURCE_RULESET_DIR
+        ),
+        build_form_dnsmasq_china_list,
+        config.DNSMASQ_CHINA_LIST.values(),
+        output_paths,
     )
 
 
-def build_smartdns() -> None:
+def build_smartdns(smartdns_files) -> None:
     import build_smartdns
 
-    build_smartdns.build(config.SMARTDNS_FILE, OUT_SOURCE_RULESET_DIR)
+    build_smartdns.build(smartdns_files, OUT_SOURCE_RULESET_DIR, MANIFEST)
 
 
-def build_china_ip() -> None:
+def build_china_ip(output_paths) -> None:
     import build_china_ip
 
-    build_china_ip.build(config.CHINA_IP_SOURCES, OUT_SOURCE_RULESET_DIR)
+    run_upstream_stage(
+        "upstream:ChinaIP",
+        lambda: build_china_ip.build(config.CHINA_IP_SOURCES, OUT_SOURCE_RULESET_DIR),
+        build_china_ip,
+        config.CHINA_IP_SOURCES,
+        output_paths,
+    )
 
 
-def build_china_ipv6() -> None:
+def build_china_ipv6(output_paths) -> None:
     import build_china_ipv6
 
-    build_china_ipv6.build(config.CHINA_IPV6_SOURCES, OUT_SOURCE_RULESET_DIR)
+    run_upstream_stage(
+        "upstream:ChinaIPv6",
+        lambda: build_china_ipv6.build(
+            config.CHINA_IPV6_SOURCES, OUT_SOURCE_RULESET_DIR
+        ),
+        build_china_ipv6,
+        config.CHINA_IPV6_SOURCES,
+        output_paths,
+    )
 
 
-def build_guard() -> None:
+def build_guard(output_paths) -> None:
     import build_guard
 
-    build_guard.build(config.GUARD_SOURCES, OUT_SOURCE_RULESET_DIR)
+    run_upstream_stage(
+        "upstream:Guard",
+        lambda: build_guard.build(
+            config.GUARD_SOURCES, OUT_SOURCE_RULESET_DIR, config.GUARD_SORT_MEMORY
+        ),
+        build_guard,
+        config.GUARD_SOURCES,
+        output_paths,
+    )
+
+
+def build_bankhk(output_paths) -> None:
+    import build_bankhk
+
+    run_stage(
+        "bankhk",
+        lambda: build_bankhk.build(
+            config.BANKHK_SOURCES, RULESET_DIR, OUT_SOURCE_RULESET_DIR
+        ),
+        [
+            build_bankhk.__file__,
+            *[os.path.join(RULESET_DIR, source) for source in config.BANKHK_SOURCES],
+        ],
+        output_paths,
+        config.BANKHK_SOURCES,
+    )
 
 
-def build_singbox() -> None:
+def build_singbox(filenames) -> None:
     import build_singbox
 
-    build_singbox.build(OUT_SOURCE_RULESET_DIR, config.OUT_SINGBOX_RULESET_DIR)
+    build_singbox.build(
+        OUT_SOURCE_RULESET_DIR,
+        config.OUT_SINGBOX_RULESET_DIR,
+        MANIFEST,
+        filenames=filenames,
+    )
 
 
-def build_surge() -> None:
+def build_surge(filenames) -> None:
     import build_surge
 
-    build_surge.build(OUT_SOURCE_RULESET_DIR, config.OUT_SURGE_RULESET_DIR)
+    build_surge.build(
+        OUT_SOURCE_RULESET_DIR,
+        config.OUT_SURGE_RULESET_DIR,
+        MANIFEST,
+        filenames=filenames,
+    )
 
 
-def build_clash() -> None:
+def build_clash(filenames) -> None:
     import build_clash
 
-    build_clash.build(OUT_SOURCE_RULESET_DIR, config.OUT_CLASH_RULESET_DIR)
+    build_clash.build(
+        OUT_SOURCE_RULESET_DIR,
+        config.OUT_CLASH_RULESET_DIR,
+        MANIFEST,
+        filenames=filenames,
+    )
 
 
-def build_mrs() -> None:
+def build_mrs(filenames) -> None:
     import build_mrs
 
-    build_mrs.build(OUT_SOURCE_RULESET_DIR, config.OUT_MIHOMO_RULESET_DIR)
+    build_mrs.build(
+        OUT_SOURCE_RULESET_DIR,
+        config.OUT_MIHOMO_RULESET_DIR,
+        MANIFEST,
+        workers=config.MRS_WORKERS,
+        cache_dir=config.MRS_CACHE_DIR,
+        encoder=config.MRS_ENCODER,
+        filenames=filenames,
+    )
 
 
-def build_bankhk() -> None:
-    import build_bankhk
+def prune_mrs_cache() -> None:
+    import build_mrs
 
-    build_bankhk.build(config.BANKHK_SOURCES, RULESET_DIR, OUT_SOURCE_RULESET_DIR)
+    build_mrs.prune_cache(
+        config.MRS_CACHE_DIR,
+        [f for f in os.listdir(OUT_SOURCE_RULESET_DIR) if f.endswith(".conf")],
+    )
 
 
 def convert_markdown() -> None:
     import build_web
 
     build_web.convert_all_markdown_files(
-        config.OUT_DIR, github_token=config.GITHUB_TOKEN
+        config.OUT_DIR,
+        github_token=config.GITHUB_TOKEN,
+        manifest=MANIFEST,
+        renderer=config.MARKDOWN_RENDERER,
+        cache_dir=config.MARKDOWN_CACHE_DIR,
+    )
+
+
+def build_changelog() -> None:
+    import build_changelog
+
+    build_changelog.build(
+        OUT_RULESET_DIR, config.OUT_DELTA_DIR, config.SNAPSHOT_DIR, MANIFEST
+    )
+
+
+def build_compress() -> None:
+    import build_compress
+
+    build_compress.build(
+        config.OUT_RULESET_DIR, formats=config.COMPRESS_FORMATS, manifest=MANIFEST
     )
 
 
@@ -130,40 +301,177 @@ def build_web() -> None:
         os.path.join(config.OUT_DIR, "index.html"),
         github_token=config.GITHUB_TOKEN,
         rule_extensions=config.WEB_RULE_EXTENSIONS,
+        manifest=MANIFEST,
+        renderer=config.MARKDOWN_RENDERER,
     )
 
 
-init()
-copy_files()
-for src, dest in config.COPY_FILE.items():
-    shutil.copy2(src, dest)
-for src, dest in config.README_FILE.items():
-    shutil.move(src, dest)
-
-until.run_in_threads(
-    [
-        clear_config_comment,
+# 生成 Source 规则的阶段及其产出的文件
+UPSTREAM_STAGES = {
+    "dnsmasq": (
         build_form_dnsmasq_china_list,
-        build_china_ip,
-        build_china_ipv6,
-        build_guard,
-        build_bankhk,
+        [f"{name}.conf" for name in config.DNSMASQ_CHINA_LIST],
+    ),
+    "ChinaIP": (build_china_ip, ["ChinaIP.conf"]),
+    "ChinaIPv6": (build_china_ipv6, ["ChinaIPv6.conf"]),
+    "Guard": (build_guard, ["Guard.conf"]),
+    "BankHK": (build_bankhk, ["BankHK.conf"]),
+}
+
+# 由 Source 规则生成各格式的阶段：(函数, 输出目录, 每个规则集产出的文件扩展名)
+TARGET_STAGES = {
+    "sing-box": (build_singbox, config.OUT_SINGBOX_RULESET_DIR, (".json", ".srs")),
+    "Surge": (build_surge, config.OUT_SURGE_RULESET_DIR, (".conf",)),
+    "Clash": (build_clash, config.OUT_CLASH_RULESET_DIR, (".conf",)),
+    "mihomo": (build_mrs, config.OUT_MIHOMO_RULESET_DIR, (".conf", ".mrs")),
+}
+
+
+def plan() -> scheduler.Scheduler:
+    """
+    声明各阶段的输入与输出
+    各格式按 Source 规则的来源分组生成：List 中的静态规则无需等待任何下载，
+    上游规则集生成后，对应的各格式立即开始生成
+    """
+    stages = scheduler.Scheduler(config.BUILD_WORKERS)
+
+    def source_paths(filenames) -> list[str]:
+        return [os.path.join(OUT_SOURCE_RULESET_DIR, f) for f in filenames]
+
+    stages.add(
+        "config",
+        clear_config_comment,
+        config.CONFIG_FILE_CLEAR.keys(),
+        config.CONFIG_FILE_CLEAR.values(),
+    )
+
+    for name, (func, filenames) in UPSTREAM_STAGES.items():
+        outputs = source_paths(filenames)
+        stages.add(
+            f"upstream:{name}",
+            lambda func=func, outputs=outputs: func(outputs),
+            outputs=outputs,
+        )
+
+    generated = {f for _, filenames in UPSTREAM_STAGES.values() for f in filenames}
+    groups = {
+        "List": sorted(
+            f
+            for f in os.listdir(OUT_SOURCE_RULESET_DIR)
+            if f.endswith(".conf") and f not in generated
+        ),
+        **{name: filenames for name, (_, filenames) in UPSTREAM_STAGES.items()},
+    }
+
+    for target, (func, out_dir, extensions) in TARGET_STAGES.items():
+        for group, filenames in groups.items():
+            if not filenames:
+                continue
+            stages.add(
+                f"{target}:{group}",
+                lambda func=func, filenames=filenames: func(filenames),
+                source_paths(filenames),
+                [
+                    os.path.join(out_dir, f.rsplit(".", 1)[0] + extension)
+                    for f in filenames
+                    for extension in extensions
+                ],
+            )
+
+    # smartdns 只转换部分规则集
+    for group, filenames in groups.items():
+        files = {
+            src: dest
+            for src, dest in config.SMARTDNS_FILE.items()
+            if os.path.basename(src) in filenames
+        }
+        if files:
+            stages.add(
+                f"smartdns:{group}",
+                lambda files=files: build_smartdns(files),
+                files.keys(),
+                files.values(),
+            )
+
+    markdown_paths = [
+        os.path.join(root, file)
+        for root, _, files in os.walk(OUT_DIR)
+        for file in files
+        if file.endswith(".md") and not file.startswith(".")
     ]
-)
+    stages.add(
+        "markdown",
+        convert_markdown,
+        markdown_paths,
+        [path[:-3] + ".html" for path in markdown_paths],
+    )
 
-until.run_in_threads(
-    [
-        build_singbox,
-        build_smartdns,
-        build_surge,
-        build_clash,
-        build_mrs,
+    list_paths = [
+        path
+        for path in stages.outputs()
+        if os.path.commonpath([path, OUT_RULESET_DIR]) == OUT_RULESET_DIR
     ]
-)
 
-convert_markdown()
-build_web()
+    # 增删文件与 changelog 在所有规则产物生成后比较
+    changelog_path = os.path.join(config.OUT_DELTA_DIR, "changelog.json")
+    stages.add("changelog", build_changelog, list_paths, [changelog_path])
 
-end_time = datetime.datetime.now()
+    # 索引页列出所有产物，最后生成
+    stages.add(
+        "web", build_web, stages.outputs(), [os.path.join(OUT_DIR, "index.html")]
+    )
 
-print(f"Total time: {end_time - start_time}")
+    # 压缩文件不列入索引页，与索引页同时生成
+    if config.COMPRESS_FORMATS:
+        stages.add("compress", build_compress, [*list_paths, changelog_path])
+    return stages
+
+
+# 进程池的子进程会重新导入本模块，只有直接运行时才进行构建
+if __name__ == "__main__":
+    args = parser.parse_args()
+    config.OFFLINE = config.OFFLINE or args.offline
+    config.DETERMINISTIC = config.DETERMINISTIC or args.deterministic
+
+    MANIFEST = Manifest(config.BUILD_MANIFEST, PROCESS_DIR, config.DETERMINISTIC)
+
+    status = {}
+    try:
+        with metrics.stage("init"):
+            init(args, MANIFEST)
+            copy_files()
+
+        status = plan().run()
+
+        # 有阶段失败时保留旧的产物与记录，不做清理
+        if all(value == scheduler.STATUS_OK for value in status.values()):
+            MANIFEST.prune()
+            prune_mrs_cache()
+    finally:
+        process_pool.shutdown()
+        # 即使中途失败，也保留已完成部分的记录，下次构建无需重做
+        MANIFEST.save()
+        report = metrics.write_report(
+            config.BUILD_REPORT, config.BUILD_HISTORY or None
+        )
+        for stage in report["stages"]:
+            print(
+                f"[Metrics] {stage['name']}: {stage['status']}, {stage['wall']:.2f}s wall, "
+                f"{stage['cpu']:.2f}s cpu, {stage['files_out']} files / {stage['bytes_out']} bytes out, "
+                f"{stage['rules_in']} rules in / {stage['rules_out']} out, {stage['unchanged']} unchanged"
+            )
+            for fmt, entry in stage.get("compression", {}).items():
+                print(
+                    f"[Metrics] {stage['name']}: .{fmt} {entry['files']} files, "
+                    f"{entry['bytes']} -> {entry['compressed_bytes']} bytes, {entry['saved_bytes']} saved"
+                )
+        print(f"[Metrics] Build report written to {config.BUILD_REPORT}")
+
+    end_time = datetime.datetime.now()
+
+    print(f"Total time: {end_time - start_time}")
+
+    failed = [name for name, value in status.items() if value != scheduler.STATUS_OK]
+    if failed:
+        print(f"[Build] {len(failed)} stages failed or skipped: {', '.join(failed)}")
+        sys.exit(1)
@@ -1,5 +1,6 @@
 import os
 
+import metrics
 import until
 
 
@@ -16,13 +17,14 @@ def build(bankhk_sources, ruleset_dir, out_ruleset_dir) -> None:
         if os.path.exists(source_path):
             with open(source_path, "r", encoding="utf-8") as f:
                 content = f.read()
-                # 去除每个文件中的空行(注释还是不删掉吧)
+                # 去除每个文件中的空行(注释还是不删掉吧)，同时去掉 CRLF 中的 \r
                 lines = [
                     line
-                    for line in content.split("\n")
+                    for line in content.splitlines()
                     if line # and not line.startswith("#")
                 ]
                 all_rules.extend(lines)
+                metrics.add(rules_in=len(lines))
                 print(f"[BankHK] Processed {source}")
         else:
             print(f"[BankHK] Warning: Source file {source} not found")
@@ -35,6 +37,8 @@ def build(bankhk_sources, ruleset_dir, out_ruleset_dir) -> None:
     with open(output_path, "w", encoding="utf-8", newline="\n") as f:
         f.write(update_info)
         f.write("\n".join(all_rules))
+        f.write("\n")
+    metrics.add(rules_out=len(all_rules))
 
     print(f"[BankHK] Successfully built BankHK.conf with {len(all_rules)} rules")
     print("[BankHK] End building BankHK rules")
@@ -0,0 +1,203 @@
+import gzip
+import json
+import os
+import shutil
+import incremental
+import process_pool
+import ruleset
+
+"""
+各规则集在两次构建之间的变化
+
+每次构建把各格式产物中的规则与上次构建的快照（保存在构建缓存中）比较，
+为有变化的产物输出只含增删规则的 .diff 文件，并在 changelog.json 中记录每个产物的
+规则数、增删数以及本次与上次的文件哈希。使用方确认本地文件的哈希等于 previous_hash 后
+即可直接应用增删，不必重新下载整个列表；哈希不一致时（例如错过了某次构建）再完整下载。
+增删按规则集合计算（changelog.json 中的 delta_semantics 为 "set"）：同一列表内的规则
+不分先后，只调整顺序或增减重复行不产生 .diff，应用增删后得到的是与本次相同的规则集合，
+而不是逐字节相同的文件，使用方应把 hash 记为本地列表的新版本。
+规则数与各格式生成器的统计一致，包括重复行。
+"""
+
+CHANGELOG_VERSION = 1
+DELTA_SEMANTICS = "set"
+RULE_EXTENSIONS = (".conf", ".txt", ".json")
+SNAPSHOT_INDEX = "index.json"
+
+
+def read_rules(path) -> list[str]:
+    """读取产物中的规则（保留顺序与重复行）；sing-box JSON 的每条规则表示为 "类型,值"。"""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [
+            f"{rule_type},{value}"
+            for rule_set in data.get("rules", [])
+            for rule_type, values in rule_set.items()
+            if isinstance(values, list)
+            for value in values
+        ]
+    return ruleset.load(path, cache=False).lines
+
+
+def read_snapshot(snapshot_path) -> set[str] | None:
+    try:
+        with gzip.open(snapshot_path, "rt", encoding="utf-8") as f:
+            return set(f.read().splitlines())
+    except FileNotFoundError:
+        return None
+
+
+def write_snapshot(snapshot_path, rules) -> None:
+    os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+    data = "".join(f"{rule}\n" for rule in sorted(rules)).encode("utf-8")
+    tmp_path = snapshot_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(gzip.compress(data, compresslevel=1, mtime=0))
+    os.replace(tmp_path, snapshot_path)
+
+
+def diff_file(
+    path, snapshot_path, delta_path, name, previous_hash, current_hash
+) -> tuple[int, int, int, bool]:
+    """
+    与快照比较并更新快照，在进程池中运行
+    返回 (规则数, 新增数, 删除数, 是否写出了 .diff 文件)
+    """
+    lines = read_rules(path)
+    rules = set(lines)
+    previous = read_snapshot(snapshot_path)
+    write_snapshot(snapshot_path, rules)
+    if previous is None:
+        return len(lines), 0, 0, False
+
+    added = sorted(rules - previous)
+    removed = sorted(previous - rules)
+    if not added and not removed:
+        return len(lines), 0, 0, False
+
+    os.makedirs(os.path.dirname(delta_path), exist_ok=True)
+    with open(delta_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(f"# {name}\n")
+        f.write(f"# Previous: {previous_hash}\n")
+        f.write(f"# Current: {current_hash}\n")
+        f.writelines(f"-{rule}\n" for rule in removed)
+        f.writelines(f"+{rule}\n" for rule in added)
+    return len(lines), len(added), len(removed), True
+
+
+def scan_files(dir_path, exclude_dir) -> list[str]:
+    files = []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                if entry.path != exclude_dir:
+                    files.extend(scan_files(entry.path, exclude_dir))
+            elif entry.name.endswith(RULE_EXTENSIONS):
+                files.append(entry.path)
+    return files
+
+
+def build(list_dir, delta_dir, snapshot_dir, manifest=None) -> None:
+    print("[Changelog] Start comparing rulesets with the last build...")
+
+    index_path = os.path.join(snapshot_dir, SNAPSHOT_INDEX)
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    # 只保留相对上次构建的变化
+    if os.path.exists(delta_dir):
+        shutil.rmtree(delta_dir)
+
+    lists = {}
+    jobs = {}
+    for path in scan_files(list_dir, delta_dir):
+        name = os.path.relpath(path, list_dir).replace(os.sep, "/")
+        current_hash = (
+            manifest.digest(path) if manifest else incremental.file_digest(path)
+        )
+        previous = index.get(name)
+
+        # 文件未变化则不必读取
+        if previous and previous["hash"] == current_hash:
+            lists[name] = {
+                "rules": previous["rules"],
+                "added": 0,
+                "removed": 0,
+                "hash": current_hash,
+                "previous_hash": current_hash,
+            }
+            continue
+
+        job = (
+            path,
+            os.path.join(snapshot_dir, *name.split("/")) + ".gz",
+            os.path.join(delta_dir, *name.split("/")) + ".diff",
+            name,
+            previous and previous["hash"],
+            current_hash,
+        )
+        jobs[job] = name
+
+    for job, (rules, added, removed, has_delta) in process_pool.run(diff_file, jobs):
+        name = jobs[job]
+        lists[name] = {
+            "rules": rules,
+            "added": added,
+            "removed": removed,
+            "hash": job[5],
+            "previous_hash": job[4],
+            **({"delta": f"{name}.diff"} if has_delta else {}),
+        }
+        if added or removed:
+            print(f"[Changelog] {name}: +{added} -{removed}")
+
+    # 本次不再产出的列表
+    for name in index.keys() - lists.keys():
+        lists[name] = {
+            "rules": 0,
+            "added": 0,
+            "removed": index[name]["rules"],
+            "hash": None,
+            "previous_hash": index[name]["hash"],
+        }
+        snapshot_path = os.path.join(snapshot_dir, *name.split("/")) + ".gz"
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        print(f"[Changelog] {name}: removed")
+
+    changelog = {
+        "version": CHANGELOG_VERSION,
+        "delta_semantics": DELTA_SEMANTICS,
+        "lists": {name: lists[name] for name in sorted(lists)},
+    }
+    os.makedirs(delta_dir, exist_ok=True)
+    with open(
+        os.path.join(delta_dir, "changelog.json"), "w", encoding="utf-8", newline="\n"
+    ) as f:
+        json.dump(changelog, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+    index = {
+        name: {"hash": entry["hash"], "rules": entry["rules"]}
+        for name, entry in lists.items()
+        if entry["hash"] is not None
+    }
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+
+    changed = sum(1 for entry in lists.values() if entry["added"] or entry["removed"])
+    print(f"[Changelog] Completed: {changed} of {len(lists)} lists changed")
+    print("[Changelog] End comparing rulesets")
+
+
+if __name__ == "__main__":
+    import config
+
+    build(config.OUT_RULESET_DIR, config.OUT_DELTA_DIR, config.SNAPSHOT_DIR)
@@ -1,20 +1,20 @@
-import ipaddress
 import os
-import requests
 
+import cidr
+import download
+import metrics
 import until
 from until import run_in_threads
 
 
-def download_and_process(link, exclude) -> list[str]:
+def download_and_process(link):
+    """逐行读取并清洗上游内容，返回生成器，调用方直接收集到结果集合中。"""
     print(f"[ChinaIP] Downloading and processing {link} ...")
-    content = requests.get(link).text
-    lines = [
+    return (
         processed
-        for line in content.splitlines()  # splitlines 处理换行符更通用
-        if (processed := line.split("#", 1)[0].strip()) and processed not in exclude
-    ]
-    return lines
+        for line in download.iter_lines(link)
+        if (processed := line.split("#", 1)[0].strip())
+    )
 
 
 def build(china_ip_sources, out_dir) -> None:
@@ -41,38 +41,36 @@ def build(china_ip_sources, out_dir) -> None:
         "103.246.246.0/23",
         "45.199.166.0/24",
         "45.199.167.0/24",
-        # Space
-        "",
     )
 
     all_lines = set()
 
-    def download_and_process_wrapper(link, exclude) -> None:
-        lines = download_and_process(link, exclude)
+    def download_and_process_wrapper(link) -> None:
+        lines = metrics.Counted(download_and_process(link))
         all_lines.update(lines)
+        metrics.add(rules_in=lines.count)
 
     download_functions = [
-        lambda link=link: download_and_process_wrapper(link, exclude)
+        lambda link=link: download_and_process_wrapper(link)
         for link in china_ip_sources
     ]
 
     run_in_threads(download_functions)
 
-    all_networks = set()
-
-    for line in all_lines:
-        try:
-            network = ipaddress.ip_network(line.strip(), strict=False)
-            all_networks.add(network)
-        except ValueError:
-            print(f"[ChinaIP] Invalid network format: {line}")
-
-    merged_networks = ipaddress.collapse_addresses(all_networks)
+    # 合并网段，并从中减去排除的网段（覆盖排除网段的大网段会被拆开）
+    merged_networks = cidr.collapse(
+        all_lines,
+        exclude,
+        on_invalid=lambda line: print(f"[ChinaIP] Invalid network format: {line}"),
+    )
 
-    with open(os.path.join(out_dir, "ChinaIP.conf"), "w", newline="\n") as f:
+    with open(
+        os.path.join(out_dir, "ChinaIP.conf"), "w", encoding="utf-8", newline="\n"
+    ) as f:
         f.write(update_info)
         for network in merged_networks:
             f.write(f"IP-CIDR,{network}\n")
+    metrics.add(rules_out=len(merged_networks))
 
     print("[ChinaIP] End building from china IP sources")
 
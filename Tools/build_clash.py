@@ -1,26 +1,15 @@
 import os
+import metrics
+import process_pool
+import ruleset
 import until
+from incremental import SHARED_CODE
 
 
-def is_domainset(content) -> bool:
-    lines = content.strip().split("\n")
-    non_comment_lines = [line for line in lines if line and not line.startswith("#")]
-
-    if not non_comment_lines:
-        return False
-
-    if any("," in line for line in non_comment_lines):
-        return False
-    return True
-
-
-def process_domainset(content) -> list[str]:
-    lines = content.split("\n")
+def process_domainset(lines) -> list[str]:
     result = []
 
     for line in lines:
-        if line.startswith("#") or not line.strip():
-            continue
         # 如果以 . 开头，添加 + 前缀
         if line.startswith("."):
             result.append(f"+{line}")
@@ -31,19 +20,41 @@ def process_domainset(content) -> list[str]:
     return result
 
 
-def process_non_domainset(content) -> list[str]:
-    lines = content.split("\n")
-    result = []
+def process_non_domainset(lines) -> list[str]:
+    return list(lines)
 
-    for line in lines:
-        if not line.strip() or line.startswith("#"):
-            continue
-        result.append(line)
 
-    return result
+def convert(rs: ruleset.Ruleset, dest_path) -> int:
+    # 创建文件头
+    update_info = until.make_ruleset_header(rs.name)
+    # 判断是否为 domainset 格式
+    if rs.is_domainset:
+        # 处理 domainset 格式
+        processed_rules = process_domainset(rs.lines)
+    else:
+        # 处理非 domainset 格式
+        processed_rules = process_non_domainset(rs.lines)
+
+    # 写入处理后的内容
+    with open(dest_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(update_info)
+        # processed_rules.sort()
+        f.write("\n".join(processed_rules))
+        f.write("\n")
+    metrics.add(rules_out=len(processed_rules))
+    return len(processed_rules)
+
+
+def convert_file(rs: ruleset.Ruleset, dest_path) -> tuple[bool, dict[str, int]]:
+    """转换单个规则集（在进程池中运行），返回是否为 domainset 以及两个文件中的规则条数。"""
+    count = convert(rs, dest_path)
+    return rs.is_domainset, {rs.path: len(rs.lines), dest_path: count}
 
 
-def build(out_ruleset_dir, out_clash_ruleset_dir) -> None:
+def build(
+    out_ruleset_dir, out_clash_ruleset_dir, manifest=None, filenames=None
+) -> None:
+    """filenames: 只处理其中的这些文件，默认为目录中所有 .conf 文件"""
     print("[Clash] Start processing ruleset files for Clash...")
 
     # 确保输出目录存在
@@ -51,40 +62,40 @@ def build(out_ruleset_dir, out_clash_ruleset_dir) -> None:
         os.makedirs(out_clash_ruleset_dir)
 
     # 获取所有 .conf 文件
-    conf_files = [f for f in os.listdir(out_ruleset_dir) if f.endswith(".conf")]
+    conf_files = (
+        filenames
+        if filenames is not None
+        else [f for f in os.listdir(out_ruleset_dir) if f.endswith(".conf")]
+    )
     processed_count = 0
+    unchanged_count = 0
 
+    jobs, pending = [], {}
     for filename in conf_files:
         source_path = os.path.join(out_ruleset_dir, filename)
         dest_path = os.path.join(out_clash_ruleset_dir, filename)
 
-        # 读取文件内容
-        with open(source_path, "r", encoding="utf-8") as f:
-            content = f.read()
-
-        # 创建文件头
-        rule_name = filename.replace(".conf", "")
-        update_info = until.make_ruleset_header(rule_name)
-        domainset_flag = is_domainset(content)
-        # 判断是否为 domainset 格式
-        if domainset_flag:
-            # 处理 domainset 格式
-            processed_rules = process_domainset(content)
-        else:
-            # 处理非 domainset 格式
-            processed_rules = process_non_domainset(content)
+        # 源文件未变化则跳过
+        key, inputs = f"clash:{filename}", [source_path, __file__, *SHARED_CODE]
+        if manifest and manifest.is_fresh(key, inputs):
+            unchanged_count += 1
+            continue
+
+        # 在主进程中解析，其他格式复用同一份解析结果
+        jobs.append((ruleset.load(source_path), dest_path))
+        pending[dest_path] = (filename, key, inputs)
 
-        # 写入处理后的内容
-        with open(dest_path, "w", encoding="utf-8", newline="\n") as f:
-            f.write(update_info)
-            # processed_rules.sort()
-            f.write("\n".join(processed_rules))
-            f.write("\n")
+    for job, (is_domainset, rules) in process_pool.run(convert_file, jobs):
+        filename, key, inputs = pending[job[1]]
+        if manifest:
+            manifest.record(key, inputs, [job[1]], rules=rules)
 
-        print(f"[Clash] Processed{' domainset' if domainset_flag else ''} file: {filename}")
+        print(f"[Clash] Processed{' domainset' if is_domainset else ''} file: {filename}")
         processed_count += 1
 
-    print(f"[Clash] Completed processing: {processed_count} files processed")
+    print(
+        f"[Clash] Completed processing: {processed_count} files processed, {unchanged_count} unchanged"
+    )
     print("[Clash] End processing ruleset files for Clash")
 
 
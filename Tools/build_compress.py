@@ -0,0 +1,148 @@
+import gzip
+import os
+import metrics
+import process_pool
+
+try:
+    # Python 3.14+ 自带 zstd
+    from compression import zstd as _zstd
+
+    def _zstd_compress(data: bytes) -> bytes:
+        return _zstd.compress(data, level=22)
+
+except ImportError:
+    import zstandard as _zstd
+
+    def _zstd_compress(data: bytes) -> bytes:
+        return _zstd.ZstdCompressor(level=22).compress(data)
+
+
+try:
+    import brotli
+except ImportError:  # 未安装时不生成 .br
+    brotli = None
+
+"""
+预压缩产物
+
+为输出目录中的每个文件生成最高压缩率的 .gz / .br / .zst 同名文件，
+静态托管与镜像可以直接返回压缩后的内容，无需在请求时压缩。
+各文件在进程池中并行压缩，内容未变化的文件跳过；gzip 头中的 mtime 固定为 0，
+相同的输入总是得到相同的输出。
+本身已经压缩过的格式不再处理，压缩后不比原文件小的结果也不保留。
+"""
+
+# 格式 -> 文件扩展名
+EXTENSIONS = {"gz": ".gz", "br": ".br", "zst": ".zst"}
+# 已经压缩过的产物：mihomo .mrs（zstd）与 sing-box .srs（zlib）
+PRECOMPRESSED = (".mrs", ".srs")
+
+
+def _gzip_compress(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli_compress(data: bytes) -> bytes:
+    return brotli.compress(data, quality=11)
+
+
+COMPRESSORS = {"gz": _gzip_compress, "br": _brotli_compress, "zst": _zstd_compress}
+
+
+def compress_file(path, formats) -> list[str]:
+    """
+    按 formats 生成 path 的压缩文件（在进程池中运行），返回实际保留的格式；
+    压缩后不比原文件小的不写出，并删除上次留下的同名文件
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    kept = []
+    for fmt in formats:
+        output = path + EXTENSIONS[fmt]
+        compressed = COMPRESSORS[fmt](data)
+        if len(compressed) >= len(data):
+            if os.path.exists(output):
+                os.remove(output)
+            continue
+        with open(output, "wb") as f:
+            f.write(compressed)
+        kept.append(fmt)
+    return kept
+
+
+def is_compressed(filename: str) -> bool:
+    return filename.endswith(tuple(EXTENSIONS.values()))
+
+
+def scan_files(dir_path) -> list[str]:
+    files = []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                files.extend(scan_files(entry.path))
+            elif not is_compressed(entry.name) and not entry.name.endswith(
+                PRECOMPRESSED
+            ):
+                files.append(entry.path)
+    return files
+
+
+def build(out_dir, formats=tuple(EXTENSIONS), manifest=None) -> None:
+    print("[Compress] Start precompressing files...")
+
+    unknown = [fmt for fmt in formats if fmt not in EXTENSIONS]
+    if unknown:
+        raise ValueError(f"unknown compression formats: {', '.join(unknown)}")
+    if "br" in formats and brotli is None:
+        print("[Compress] Warning: brotli is not installed, skip .br files")
+        formats = tuple(fmt for fmt in formats if fmt != "br")
+    if not formats:
+        return
+
+    processed_count = 0
+    unchanged_count = 0
+
+    jobs = {}
+    done = []
+    for path in scan_files(out_dir):
+        rel_path = os.path.relpath(path, out_dir).replace(os.sep, "/")
+
+        # 内容未变化则跳过
+        key, inputs = f"compress:{rel_path}", [path, __file__]
+        if manifest and manifest.is_fresh(key, inputs, formats):
+            unchanged_count += 1
+            kept = [fmt for fmt in formats if os.path.exists(path + EXTENSIONS[fmt])]
+            done.append((path, kept))
+            continue
+
+        jobs[(path, formats)] = (key, inputs)
+
+    for job, kept in process_pool.run(compress_file, jobs):
+        key, inputs = jobs[job]
+        path = job[0]
+        if manifest:
+            outputs = [path + EXTENSIONS[fmt] for fmt in kept]
+            manifest.record(key, inputs, outputs, formats)
+        done.append((path, kept))
+        processed_count += 1
+
+    # 未变化的文件同样计入节省的大小，报告反映全部产物
+    for path, kept in done:
+        size = os.path.getsize(path)
+        for fmt in kept:
+            metrics.record_compression(
+                fmt, size, os.path.getsize(path + EXTENSIONS[fmt])
+            )
+
+    print(
+        f"[Compress] Completed: {processed_count} files compressed, {unchanged_count} unchanged"
+    )
+    print("[Compress] End precompressing files")
+
+
+if __name__ == "__main__":
+    import config
+
+    build(config.OUT_RULESET_DIR, config.COMPRESS_FORMATS)
@@ -1,23 +1,40 @@
 import os
-import re
-import requests
-
+import domain_trie
+import download
+import metrics
+import source_parsers
 import until
 from until import run_in_threads
 
 
 def download_and_process(name, link, out_dir) -> None:
     print(f"[dnsmasq] Start download and process {name}")
-    content = requests.get(link).text
 
     update_info = until.make_build_header(f"{name} List", [link])
 
-    pattern = re.compile(r"^server=/(.+?)/", re.MULTILINE)
-    matches = pattern.findall(content)
+    # 逐行解析，不再把整个文件读入内存后做正则匹配
+    matches = [
+        domain
+        for line in download.iter_lines(link)
+        for domain in source_parsers.dnsmasq_domains(line)
+    ]
+
+    # 产物中的 example.com 在 domainset 中只匹配自身，不能按 dnsmasq 的后缀语义
+    # 去掉子域名；只去掉被 '.' 开头的后缀条目覆盖的条目与重复的条目
+    metrics.add(rules_in=len(matches))
+    matches, dropped = domain_trie.minimize_domainset(matches)
+    print(f"[dnsmasq] {name}: dropped {dropped} covered or duplicate entries")
+
+    # 按域名排序，上游调整顺序时产物不变
+    matches.sort()
 
-    with open(os.path.join(out_dir, f"{name}.conf"), "w", newline="\n") as outfile:
+    with open(
+        os.path.join(out_dir, f"{name}.conf"), "w", encoding="utf-8", newline="\n"
+    ) as outfile:
         outfile.write(update_info)
         outfile.write("\n".join(matches))
+        outfile.write("\n")
+    metrics.add(rules_out=len(matches))
 
     print(f"[dnsmasq] End downloading and processing {name}")
 
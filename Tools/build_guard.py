@@ -1,35 +1,86 @@
 import os
-import requests
-
+import domain_trie
+import download
+import external_sort
+import metrics
+import source_parsers
 import until
 from until import run_in_threads
 
 
-def download_and_process(link, exclude) -> list[str]:
+def download_and_process(link, exclude, exceptions):
+    """
+    按探测到的格式解析上游内容，返回生成器，调用方直接收集到结果集合中
+    例外规则放行的域名加入 exceptions
+    """
     print(f"[Guard] Downloading and processing {link} ...")
 
-    # 替换不可见字符表
-    trans_table = str.maketrans({"\u200b": None, "\u200c": None})
-
-    lines = []
-    for line in requests.get(link).text.splitlines():
-        line = line.translate(trans_table).split("#", 1)[0].strip()
-        if line and line not in exclude:
-            lines.append(line)
-    return lines
-
-
-def build(guard_sources, out_dir) -> None:
+    fmt = source_parsers.detect(download.read_head(link, source_parsers.DETECT_BYTES))
+    if fmt != source_parsers.DEFAULT_FORMAT:
+        print(f"[Guard] Parsing {link} as {fmt}")
+
+    for line in source_parsers.parse(fmt, download.iter_line_batches(link), exceptions):
+        if line not in exclude:
+            yield line
+
+
+def exception_filter(exceptions):
+    """返回判断条目是否被例外规则放行（例外域名本身或其子域名）的函数。"""
+    trie = domain_trie.SuffixTrie()
+    for domain in exceptions:
+        trie.insert(domain)
+    return lambda line: trie.covers(line.lstrip("."))
+
+
+def note_overridden(entries, exceptions, overridden):
+    """
+    原样返回 entries，同时把被更宽的拦截后缀覆盖的例外域名加入 overridden
+    例外只移除它本身及其子域名的条目，'.example.com' 仍然拦截 a.example.com，
+    '@@||a.example.com^' 这样比拦截后缀更窄的例外实际不生效
+    """
+    broader: dict[str, list[str]] = {}
+    for domain in exceptions:
+        labels = domain.split(".")
+        for i in range(1, len(labels)):
+            broader.setdefault(".".join(labels[i:]), []).append(domain)
+    for entry in entries:
+        if entry[:1] == "." and entry[1:] in broader:
+            overridden.update(broader[entry[1:]])
+        yield entry
+
+
+def report_overridden(overridden) -> None:
+    if overridden:
+        examples = sorted(overridden)
+        print(
+            f"[Guard] {len(examples)} exceptions have no effect, a broader blocking suffix covers them: "
+            + ", ".join(examples[:5])
+            + (", ..." if len(examples) > 5 else "")
+        )
+
+
+def build(guard_sources, out_dir, sort_memory: int = 0) -> None:
+    """sort_memory 为外部排序的内存上限（字节），为 0 时在内存中合并所有来源。"""
     print("[Guard] Start building from Guard sources…")
 
     update_info = until.make_build_header("Guard List", guard_sources)
     exclude = ("", "switch.cup.com.cn", ".amazonaws.com")
     include = ("msmp.abchina.com.cn",)
+    out_path = os.path.join(out_dir, "Guard.conf")
+
+    if sort_memory:
+        build_external(
+            guard_sources, out_path, update_info, exclude, include, sort_memory
+        )
+        return
+
     all_lines: set[str] = set() if not include else set(include)
+    exceptions: set[str] = set()
 
     def download_and_process_wrapper(link, exclude):
-        lines = download_and_process(link, exclude)
+        lines = metrics.Counted(download_and_process(link, exclude, exceptions))
         all_lines.update(lines)
+        metrics.add(rules_in=lines.count)
 
     download_functions = [
         lambda link=link: download_and_process_wrapper(link, exclude)
@@ -38,16 +89,98 @@ def build(guard_sources, out_dir) -> None:
 
     run_in_threads(download_functions)
 
-    with open(os.path.join(out_dir, "Guard.conf"), "w", newline="\n") as f:
+    # 例外规则作用于所有来源
+    if exceptions:
+        is_allowed = exception_filter(exceptions)
+        overridden: set[str] = set()
+        allowed = set(
+            note_overridden(
+                (line for line in all_lines if not is_allowed(line)),
+                exceptions,
+                overridden,
+            )
+        )
+        print(
+            f"[Guard] Removed {len(all_lines) - len(allowed)} entries allowed by "
+            f"{len(exceptions)} exceptions"
+        )
+        report_overridden(overridden)
+        all_lines = allowed
+
+    # 去掉已被更宽后缀覆盖的条目
+    minimized_lines, dropped = domain_trie.minimize_domainset(all_lines)
+    print(f"[Guard] Dropped {dropped} entries covered by a broader suffix")
+
+    with open(out_path, "w", encoding="utf-8", newline="\n") as f:
         f.write(update_info)
-        sorted_lines = sorted(all_lines)
+        sorted_lines = sorted(minimized_lines)
         f.write("\n".join(sorted_lines))
         f.write("\n")
 
-    print(f"[Guard] End building from Guard sources, {len(all_lines)} lines")
+    metrics.add(rules_out=len(sorted_lines))
+    print(f"[Guard] End building from Guard sources, {len(sorted_lines)} lines")
+
+
+def build_external(
+    guard_sources, out_path, update_info, exclude, include, sort_memory
+) -> None:
+    """
+    以有界内存合并所有来源，产物与在内存中合并时相同
+    先按反转标签外部排序，以便流式去掉被更宽后缀覆盖的条目，再按字符串顺序外部排序后写出
+    """
+    print(f"[Guard] Using external sort, {sort_memory >> 20} MiB per pass")
+
+    with external_sort.ExternalSorter(
+        sort_memory, key=domain_trie.suffix_sort_key
+    ) as by_suffix, external_sort.ExternalSorter(sort_memory) as by_name:
+        by_suffix.update(include)
+        exceptions: set[str] = set()
+
+        def download_and_process_wrapper(link, exclude):
+            lines = download_and_process(link, exclude, exceptions)
+            metrics.add(rules_in=by_suffix.update(lines))
+
+        download_functions = [
+            lambda link=link: download_and_process_wrapper(link, exclude)
+            for link in guard_sources
+        ]
+
+        run_in_threads(download_functions)
+
+        entries = by_suffix
+        overridden: set[str] = set()
+        if exceptions:
+            is_allowed = exception_filter(exceptions)
+            entries = note_overridden(
+                (line for line in by_suffix if not is_allowed(line)),
+                exceptions,
+                overridden,
+            )
+
+        kept = by_name.update(domain_trie.minimize_sorted(entries))
+        if exceptions:
+            print(f"[Guard] Applied {len(exceptions)} exceptions")
+            report_overridden(overridden)
+        print(
+            f"[Guard] Dropped {by_suffix.count - kept} entries covered by a broader suffix"
+            + (" or allowed by an exception" if exceptions else "")
+        )
+        print(
+            f"[Guard] Merged {by_suffix.count} entries from "
+            f"{len(by_suffix.runs)} + {len(by_name.runs)} sorted runs"
+        )
+
+        with open(out_path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(update_info)
+            f.writelines(f"{line}\n" for line in by_name)
+            if not kept:
+                f.write("\n")
+
+    metrics.add(rules_out=kept)
+    print(f"[Guard] End building from Guard sources, {kept} lines")
 
 
 if __name__ == "__main__":
     import config
 
-    build(config.GUARD_SOURCES, config.OUT_SOURCE_RULESET_DIR)
+    build(config.GUARD_SOURCES, config.OUT_SOURCE_RULESET_DIR, config.GUARD_SORT_MEMORY)
@@ -1,11 +1,76 @@
+import concurrent.futures
+import hashlib
+import json
 import os
+import shutil
 import subprocess
 import tempfile
+import threading
+
+import metrics
+import mrs
+import ruleset
 import until
+from incremental import SHARED_CODE
+
+# 编译缓存目录中记录每个 .mrs 最近一次所用缓存条目的文件
+CACHE_INDEX = "index.json"
+
+# {缓存目录: {.mrs 文件名: 缓存键}}
+_cache_indexes: dict[str, dict[str, str]] = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_index(cache_dir: str) -> dict[str, str]:
+    """调用方须持有 _cache_lock。"""
+    index = _cache_indexes.get(cache_dir)
+    if index is None:
+        try:
+            with open(os.path.join(cache_dir, CACHE_INDEX), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        _cache_indexes[cache_dir] = index
+    return index
+
 
+def _use_cache_entry(cache_dir: str, output_path: str, digest: str) -> None:
+    with _cache_lock:
+        _cache_index(cache_dir)[os.path.basename(output_path)] = digest
 
-def _looks_like_cidr(s: str) -> bool:
-    return "/" in s and any(c.isdigit() for c in s)
+
+def save_cache_index(cache_dir: str) -> None:
+    with _cache_lock:
+        index = dict(_cache_index(cache_dir))
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, CACHE_INDEX)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def prune_cache(cache_dir: str, filenames) -> None:
+    """
+    删除当前规则文件都不再使用的缓存条目（例如规则已修改或文件已删除）
+    filenames: 当前所有的 .conf 文件名；未变化而跳过编译的文件保留上次的缓存条目
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    names = {filename.rsplit(".", 1)[0] + ".mrs" for filename in filenames}
+    with _cache_lock:
+        index = _cache_index(cache_dir)
+        for name in [name for name in index if name not in names]:
+            del index[name]
+        live = {f"{digest}.mrs" for digest in index.values()}
+
+    removed = 0
+    for name in os.listdir(cache_dir):
+        if name.endswith(".mrs") and name not in live:
+            os.remove(os.path.join(cache_dir, name))
+            removed += 1
+    save_cache_index(cache_dir)
+    if removed:
+        print(f"[mihomo] Removed {removed} unused cache entries")
 
 
 def _parse_value_after_type(line: str) -> str | None:
@@ -15,25 +80,21 @@ def _parse_value_after_type(line: str) -> str | None:
     return rest.split(",", 1)[0].strip()
 
 
-def _detect_convert_kind(clean_lines: list[str]) -> str | None:
+def _detect_convert_kind(rs: ruleset.Ruleset) -> str | None:
     """返回 'domain' / 'ipcidr' / None(不可转换)"""
-    if not clean_lines:
+    if not rs.lines:
         return None
 
-    has_comma = any("," in line for line in clean_lines)
-    if not has_comma:
-        # domainset / ipcidr 纯文本
-        if all(_looks_like_cidr(line) for line in clean_lines):
-            return "ipcidr"
+    # domainset / ipcidr 纯文本
+    if rs.kind == ruleset.KIND_DOMAINSET:
         return "domain"
+    if rs.kind == ruleset.KIND_IPCIDR:
+        return "ipcidr"
 
     # 逗号分隔规则（如 Surge/Clash 常见格式）
-    allowed_domain_prefixes = ("DOMAIN,", "DOMAIN-SUFFIX,")
-    allowed_ip_prefixes = ("IP-CIDR,", "IP-CIDR6,")
-
-    if all(line.startswith(allowed_domain_prefixes) for line in clean_lines):
+    if rs.rule_types <= {"DOMAIN", "DOMAIN-SUFFIX"}:
         return "domain"
-    if all(line.startswith(allowed_ip_prefixes) for line in clean_lines):
+    if rs.rule_types <= {"IP-CIDR", "IP-CIDR6"}:
         return "ipcidr"
     return None
 
@@ -112,9 +173,77 @@ def convert_with_mihomo(input_file: str, output_file: str, rule_type: str) -> bo
         return False
 
 
-def build(ruleset_dir, mihomo_dir) -> None:
+def encode_native(normalized_lines: list[str], output_path: str, rule_type: str) -> bool:
+    """使用内置编码器生成 .mrs，不依赖 mihomo 可执行文件"""
+    try:
+        mrs.write(normalized_lines, rule_type, output_path)
+        return True
+    except mrs.MrsError as e:
+        print(f"[mihomo] Error encoding {os.path.basename(output_path)}: {e}")
+        return False
+
+
+def compile_mrs(
+    normalized_lines: list[str],
+    kind: str,
+    output_path: str,
+    cache_dir=None,
+    encoder: str = "native",
+) -> tuple[bool, bool]:
+    """
+    把规范化后的规则编译为 .mrs，返回 (是否成功, 是否命中缓存)
+    encoder: "native" 使用内置编码器，"mihomo" 调用 mihomo convert-ruleset
+    缓存以规范化内容的哈希为键，内容不变时直接复用上次的 .mrs
+    """
+    text = "\n".join(normalized_lines) + "\n"
+    digest = hashlib.sha256(f"{encoder}\n{kind}\n{text}".encode("utf-8")).hexdigest()
+    cached_path = os.path.join(cache_dir, f"{digest}.mrs") if cache_dir else None
+
+    if cached_path and os.path.exists(cached_path):
+        shutil.copyfile(cached_path, output_path)
+        _use_cache_entry(cache_dir, output_path, digest)
+        return True, True
+
+    if encoder == "native":
+        if not encode_native(normalized_lines, output_path, kind):
+            return False, False
+    else:
+        with tempfile.NamedTemporaryFile(
+            mode="w", encoding="utf-8", delete=False, suffix=".txt"
+        ) as tmp:
+            tmp.write(text)
+            tmp_path = tmp.name
+
+        try:
+            if not convert_with_mihomo(tmp_path, output_path, kind):
+                return False, False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    if cached_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        shutil.copyfile(output_path, cached_path + ".tmp")
+        os.replace(cached_path + ".tmp", cached_path)
+        _use_cache_entry(cache_dir, output_path, digest)
+    return True, False
+
+
+def build(
+    ruleset_dir,
+    mihomo_dir,
+    manifest=None,
+    workers=None,
+    cache_dir=None,
+    encoder="native",
+    filenames=None,
+) -> None:
     """
     从 Source 文件夹转换规则到 mihomo 文件夹
+    workers: 同时进行的转换数，默认为 CPU 核数
+    cache_dir: .mrs 编译缓存目录，为 None 时不使用缓存
+    encoder: .mrs 编码方式，"native"（内置）或 "mihomo"
+    filenames: 只处理其中的这些文件，默认为目录中所有 .conf 文件
     """
     print("[mihomo] Start processing ruleset files for mihomo...")
 
@@ -122,7 +251,11 @@ def build(ruleset_dir, mihomo_dir) -> None:
     os.makedirs(mihomo_dir, exist_ok=True)
 
     # 获取所有 .conf 文件
-    conf_files = [f for f in os.listdir(ruleset_dir) if f.endswith(".conf")]
+    conf_files = (
+        filenames
+        if filenames is not None
+        else [f for f in os.listdir(ruleset_dir) if f.endswith(".conf")]
+    )
 
     if not conf_files:
         print(f"[mihomo] No rule files found in {ruleset_dir}")
@@ -131,64 +264,93 @@ def build(ruleset_dir, mihomo_dir) -> None:
     print(f"[mihomo] Found {len(conf_files)} rule files, starting conversion...")
 
     success_count = 0
+    cached_count = 0
     skip_count = 0
     copy_count = 0
-
-    for filename in conf_files:
-        source_path = os.path.join(ruleset_dir, filename)
-        rule_name = filename.replace(".conf", "")
-
-        # 先输出清洗后的 .conf（“原文件复制排序保留”）
-        clean_lines = until.read_clean_lines(source_path)
-        clean_lines_sorted = sorted(clean_lines)
-        until.write_lines_with_header(
-            os.path.join(mihomo_dir, filename),
-            until.make_ruleset_header(rule_name),
-            clean_lines_sorted,
-            sort_lines=False,
-        )
-
-        kind = _detect_convert_kind(clean_lines)
-        if kind is None:
-            copy_count += 1
-            print(f"[mihomo] ✓ Processed non-convertible: {filename} -> .conf")
-            continue
-
-        # 生成 .mrs
-        output_path = os.path.join(mihomo_dir, filename.rsplit(".", 1)[0] + ".mrs")
-
-        try:
-            normalized = (
-                _normalize_for_domain(clean_lines)
-                if kind == "domain"
-                else _normalize_for_ipcidr(clean_lines)
+    unchanged_count = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        jobs = {}
+
+        for filename in conf_files:
+            source_path = os.path.join(ruleset_dir, filename)
+            rule_name = filename.replace(".conf", "")
+            conf_path = os.path.join(mihomo_dir, filename)
+
+            # 源文件未变化则跳过
+            key = f"mihomo:{filename}"
+            inputs = [source_path, __file__, mrs.__file__, *SHARED_CODE]
+            if manifest and manifest.is_fresh(key, inputs, encoder):
+                unchanged_count += 1
+                continue
+
+            # 先输出清洗后的 .conf（“原文件复制排序保留”）
+            rs = ruleset.load(source_path)
+            clean_lines = rs.lines
+            until.write_lines_with_header(
+                conf_path,
+                until.make_ruleset_header(rule_name),
+                rs.sorted_lines,
+                sort_lines=False,
             )
-        except Exception as e:
-            skip_count += 1
-            print(f"[mihomo] Skip {filename}: {e}")
-            continue
+            metrics.add(rules_out=len(rs.lines))
+            rules = {source_path: len(rs.lines), conf_path: len(rs.lines)}
+
+            kind = _detect_convert_kind(rs)
+            if kind is None:
+                copy_count += 1
+                print(f"[mihomo] ✓ Processed non-convertible: {filename} -> .conf")
+                if manifest:
+                    manifest.record(key, inputs, [conf_path], encoder, rules)
+                continue
+
+            # 生成 .mrs
+            output_path = os.path.join(mihomo_dir, filename.rsplit(".", 1)[0] + ".mrs")
+
+            try:
+                normalized = (
+                    _normalize_for_domain(clean_lines)
+                    if kind == "domain"
+                    else _normalize_for_ipcidr(clean_lines)
+                )
+            except Exception as e:
+                skip_count += 1
+                print(f"[mihomo] Skip {filename}: {e}")
+                if manifest:
+                    manifest.record(key, inputs, [conf_path], encoder, rules)
+                continue
+
+            future = executor.submit(
+                metrics.bind(compile_mrs),
+                sorted(normalized),
+                kind,
+                output_path,
+                cache_dir,
+                encoder,
+            )
+            jobs[future] = (filename, key, inputs, [conf_path, output_path], rules)
 
-        normalized_sorted = sorted(normalized)
+        for future in concurrent.futures.as_completed(jobs):
+            filename, key, inputs, outputs, rules = jobs[future]
+            converted, from_cache = future.result()
+            if not converted:
+                skip_count += 1
+                continue
 
-        with tempfile.NamedTemporaryFile(
-            mode="w", encoding="utf-8", delete=False, suffix=".txt"
-        ) as tmp:
-            tmp.write("\n".join(normalized_sorted))
-            tmp.write("\n")
-            tmp_path = tmp.name
+            success_count += 1
+            if from_cache:
+                cached_count += 1
+            print(
+                f"[mihomo] ✓ Converted{' (cached)' if from_cache else ''}: {filename} -> .mrs & .conf"
+            )
+            if manifest:
+                manifest.record(key, inputs, outputs, encoder, rules)
 
-        try:
-            if convert_with_mihomo(tmp_path, output_path, kind):
-                success_count += 1
-                print(f"[mihomo] ✓ Converted: {filename} -> .mrs & .conf")
-            else:
-                skip_count += 1
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+    if cache_dir:
+        save_cache_index(cache_dir)
 
     print(
-        f"[mihomo] Conversion completed: {success_count} converted, {copy_count} copied, {skip_count} skipped"
+        f"[mihomo] Conversion completed: {success_count} converted ({cached_count} from cache), {copy_count} copied, {skip_count} skipped, {unchanged_count} unchanged"
     )
     print("[mihomo] End processing ruleset files for mihomo")
 
@@ -196,4 +358,14 @@ def build(ruleset_dir, mihomo_dir) -> None:
 if __name__ == "__main__":
     import config
 
-    build(config.OUT_SOURCE_RULESET_DIR, config.OUT_MIHOMO_RULESET_DIR)
+    build(
+        config.OUT_SOURCE_RULESET_DIR,
+        config.OUT_MIHOMO_RULESET_DIR,
+        workers=config.MRS_WORKERS,
+        cache_dir=config.MRS_CACHE_DIR,
+        encoder=config.MRS_ENCODER,
+    )
+    prune_cache(
+        config.MRS_CACHE_DIR,
+        [f for f in os.listdir(config.OUT_SOURCE_RULESET_DIR) if f.endswith(".conf")],
+    )
@@ -2,6 +2,12 @@ import glob
 import json
 import os
 
+import metrics
+import process_pool
+import ruleset
+import srs
+from incremental import SHARED_CODE
+
 RULE_TYPE_MAPPING = {
     "DOMAIN": "domain",
     "DOMAIN-SUFFIX": "domain_suffix",
@@ -16,28 +22,15 @@ RULE_TYPE_MAPPING = {
 }
 
 
-def is_domainset(file_path) -> bool:
-    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-        for _ in range(10):
-            try:
-                line = f.readline().strip()
-                if not line or line.startswith("#"):
-                    continue
-
-                if "," not in line and ("." in line or line.startswith("this_ruleset")):
-                    return True
-
-                if any(
-                    line.startswith(prefix)
-                    for prefix in ["DOMAIN", "IP-CIDR", "PROCESS"]
-                ):
-                    return False
-            except UnicodeDecodeError:
-                continue
-    return False
-
-
-def parse_conf_to_singbox(conf_path, output_path) -> bool:
+def parse_conf_to_singbox(
+    rs: ruleset.Ruleset, output_path, binary_path=None
+) -> dict[str, int] | None:
+    """
+    转换为 sing-box JSON 规则集（source 格式）
+    binary_path 不为空时同时输出编译后的二进制规则集 (.srs)
+    成功时返回源文件与 JSON 文件中的规则条数，未生成时返回 None
+    """
+    conf_path = rs.path
 
     rules_container = {
         "domain": [],
@@ -52,38 +45,21 @@ def parse_conf_to_singbox(conf_path, output_path) -> bool:
     }
 
     try:
-        if is_domainset(conf_path):
+        if rs.is_domainset:
             print(
                 f"[sing-box] {conf_path} is domainset format, processing as domain_suffix"
             )
-            with open(conf_path, "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    line = line.strip()
-
-                    if not line or line.startswith("#"):
-                        continue
-
-                    rules_container["domain_suffix"].append(line)
+            rules_container["domain_suffix"].extend(rs.lines)
         else:
-            with open(conf_path, "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    line = line.strip()
-
-                    if not line or line.startswith("#"):
-                        continue
-
-                    parts = line.split(",")
-                    if len(parts) < 2:
-                        continue
-
-                    rule_type, value = parts[0], parts[1]
-                    value = value.strip()
+            for rule in rs.rules:
+                if not rule.value:
+                    continue
 
-                    if rule_type in RULE_TYPE_MAPPING:
-                        sing_box_type = RULE_TYPE_MAPPING[rule_type]
-                        rules_container[sing_box_type].append(value)
-                    else:
-                        print(f"[sing-box] Unknown rule type: {rule_type}")
+                if rule.type in RULE_TYPE_MAPPING:
+                    sing_box_type = RULE_TYPE_MAPPING[rule.type]
+                    rules_container[sing_box_type].append(rule.value)
+                else:
+                    print(f"[sing-box] Unknown rule type: {rule.type}")
 
         rules_dict = {k: sorted(v) for k, v in sorted(rules_container.items()) if v}
 
@@ -91,20 +67,32 @@ def parse_conf_to_singbox(conf_path, output_path) -> bool:
             print(
                 f"[sing-box] Warning: No rules were resolved for {conf_path}, skipped generation"
             )
-            return False
+            return None
 
         singbox_rules = {"version": 2, "rules": [rules_dict]}
 
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-        with open(output_path, "w", encoding="utf-8") as f:
+        with open(output_path, "w", encoding="utf-8", newline="\n") as f:
             json.dump(singbox_rules, f, separators=(",", ":"), ensure_ascii=False)
+        rule_count = sum(len(v) for v in rules_dict.values())
+        metrics.add(rules_out=rule_count)
 
         print(f"[sing-box] {conf_path} successfully converted to minimized JSON.")
-        return True
+
+        if binary_path:
+            try:
+                srs.write(singbox_rules["rules"], binary_path)
+                print(f"[sing-box] {conf_path} successfully compiled to binary rule-set.")
+            except srs.SrsError as e:
+                print(f"[sing-box] Failed to compile {conf_path} to binary rule-set: {e}")
+                # 不保留上次构建的 .srs，以免与新的 JSON 不一致
+                if os.path.exists(binary_path):
+                    os.remove(binary_path)
+        return {conf_path: len(rs.lines), output_path: rule_count}
     except Exception as e:
         print(f"[sing-box] Error processing {conf_path}: {e}")
-        return False
+        return None
 
 
 def get_all_rule_files(dir_path) -> list[str]:
@@ -118,10 +106,15 @@ def get_all_rule_files(dir_path) -> list[str]:
     return rule_files
 
 
-def build(ruleset_dir, singbox_dir) -> None:
+def build(ruleset_dir, singbox_dir, manifest=None, filenames=None) -> None:
+    """filenames: 只处理其中的这些文件，默认为目录中所有 .conf 文件"""
     os.makedirs(singbox_dir, exist_ok=True)
 
-    rule_files = get_all_rule_files(ruleset_dir)
+    rule_files = (
+        [os.path.join(ruleset_dir, filename) for filename in filenames]
+        if filenames is not None
+        else get_all_rule_files(ruleset_dir)
+    )
 
     if not rule_files:
         print(f"[sing-box] The rule file was not found in {ruleset_dir}.")
@@ -131,21 +124,56 @@ def build(ruleset_dir, singbox_dir) -> None:
 
     success_count = 0
     skip_count = 0
+    unchanged_count = 0
 
+    jobs, pending = [], {}
     for rule_file in rule_files:
 
         file_name = os.path.basename(rule_file)
 
         output_file = os.path.join(singbox_dir, file_name.rsplit(".", 1)[0] + ".json")
-
-        result = parse_conf_to_singbox(rule_file, output_file)
-        if result:
+        binary_file = os.path.join(singbox_dir, file_name.rsplit(".", 1)[0] + ".srs")
+
+        # 源文件未变化则跳过
+        key = f"sing-box:{file_name}"
+        inputs = [rule_file, __file__, srs.__file__, *SHARED_CODE]
+        if manifest and manifest.is_fresh(key, inputs, RULE_TYPE_MAPPING):
+            unchanged_count += 1
+            continue
+
+        # 在主进程中解析，其他格式复用同一份解析结果
+        try:
+            rs = ruleset.load(rule_file)
+        except Exception as e:
+            print(f"[sing-box] Error processing {rule_file}: {e}")
+            skip_count += 1
+            if manifest:
+                # 与转换失败时相同，不保留上次构建的产物
+                manifest.record(key, inputs, [], RULE_TYPE_MAPPING)
+            continue
+        jobs.append((rs, output_file, binary_file))
+        pending[output_file] = (key, inputs)
+
+    for job, result in process_pool.run(parse_conf_to_singbox, jobs):
+        _, output_file, binary_file = job
+        key, inputs = pending[output_file]
+        if result is not None:
             success_count += 1
         else:
             skip_count += 1
+        if manifest:
+            outputs = [output_file, binary_file] if result is not None else []
+            # 编译 .srs 失败时只记录 JSON
+            manifest.record(
+                key,
+                inputs,
+                [path for path in outputs if os.path.exists(path)],
+                RULE_TYPE_MAPPING,
+                rules=result,
+            )
 
     print(
-        f"[sing-box] Conversion completed: {success_count} succeeded, {skip_count} skiped."
+        f"[sing-box] Conversion completed: {success_count} succeeded, {skip_count} skiped, {unchanged_count} unchanged."
     )
 
 
@@ -1,8 +1,37 @@
 import os
+import metrics
+import process_pool
+import ruleset
 import until
+from incremental import SHARED_CODE
 
 
-def build(smartdns_files, ruleset_dir) -> None:
+def convert(rs: ruleset.Ruleset, output_file) -> int:
+    # 获取文件头部信息
+    update_info = rs.header or until.make_ruleset_header(rs.name)
+
+    # 去掉 domainset 的后缀标记并排序
+    content_lines = sorted(
+        line[1:] if line.startswith(".") else line for line in rs.lines
+    )
+
+    # 写入目标文件
+    with open(output_file, "w", encoding="utf-8", newline="\n") as f:
+        f.write(update_info)
+        f.write("\n".join(content_lines))
+        f.write("\n")
+    metrics.add(rules_out=len(content_lines))
+    # 只有 "." 的行去掉标记后为空行，不算作规则
+    return ruleset.count_rules(content_lines)
+
+
+def convert_file(rs: ruleset.Ruleset, output_file) -> tuple[str, dict[str, int]]:
+    """转换单个规则集（在进程池中运行），返回规则集名称以及两个文件中的规则条数。"""
+    count = convert(rs, output_file)
+    return rs.name, {rs.path: len(rs.lines), output_file: count}
+
+
+def build(smartdns_files, ruleset_dir, manifest=None) -> None:
     print("[SmartDNS] Start building smartdns rules...")
 
     # 确保目标目录存在
@@ -11,46 +40,37 @@ def build(smartdns_files, ruleset_dir) -> None:
         os.makedirs(smartdns_dir)
 
     processed_count = 0
+    unchanged_count = 0
 
     # 处理所有文件
+    jobs, pending = [], {}
     for input_file, output_file in smartdns_files.items():
         if not os.path.exists(input_file):
             print(f"[SmartDNS] Warning: {input_file} does not exist, skipping...")
             continue
 
-        rule_name = os.path.basename(input_file).replace(".conf", "")
-        print(f"[SmartDNS] Processing {rule_name}...")
-
-        # 读取源文件内容
-        with open(input_file, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-
-        # 获取文件头部信息
-        update_info = until.extract_leading_comment_header(lines) or until.make_ruleset_header(
-            rule_name
-        )
-
-        # 获取非注释内容
-        content_lines = []
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith("#"):
-                if line.startswith("."):
-                    line = line.replace(".", "", 1)
-                content_lines.append(line)
+        # 源文件未变化则跳过
+        key = f"smartdns:{os.path.basename(output_file)}"
+        inputs = [input_file, __file__, *SHARED_CODE]
+        if manifest and manifest.is_fresh(key, inputs):
+            unchanged_count += 1
+            continue
 
-        # 排序内容
-        content_lines.sort()
+        # 在主进程中解析，其他格式复用同一份解析结果
+        jobs.append((ruleset.load(input_file), output_file))
+        pending[output_file] = (key, inputs)
 
-        # 写入目标文件
-        with open(output_file, "w", encoding="utf-8", newline="\n") as f:
-            f.write(update_info)
-            f.write("\n".join(content_lines))
-            f.write("\n")
+    for job, (name, rules) in process_pool.run(convert_file, jobs):
+        key, inputs = pending[job[1]]
+        print(f"[SmartDNS] Processed {name}")
+        if manifest:
+            manifest.record(key, inputs, [job[1]], rules=rules)
 
         processed_count += 1
 
-    print(f"[SmartDNS] Completed: {processed_count} files processed")
+    print(
+        f"[SmartDNS] Completed: {processed_count} files processed, {unchanged_count} unchanged"
+    )
     print("[SmartDNS] End building smartdns rules")
 
 
@@ -1,8 +1,33 @@
 import os
+import metrics
+import process_pool
+import ruleset
 import until
+from incremental import SHARED_CODE
 
 
-def build(out_ruleset_dir, out_surge_ruleset_dir) -> None:
+def convert(rs: ruleset.Ruleset, dest_file) -> int:
+    update_info = until.make_ruleset_header(rs.name)
+
+    # 写入目标文件
+    with open(dest_file, "w", encoding="utf-8", newline="\n") as f:
+        f.write(update_info)
+        # content_lines.sort()
+        f.write("\n".join(rs.lines))
+        f.write("\n")
+    metrics.add(rules_out=len(rs.lines))
+    return len(rs.lines)
+
+
+def convert_file(rs: ruleset.Ruleset, dest_file) -> dict[str, int]:
+    """转换单个规则集（在进程池中运行），返回两个文件中的规则条数。"""
+    return {rs.path: len(rs.lines), dest_file: convert(rs, dest_file)}
+
+
+def build(
+    out_ruleset_dir, out_surge_ruleset_dir, manifest=None, filenames=None
+) -> None:
+    """filenames: 只处理其中的这些文件，默认为目录中所有 .conf 文件"""
     print("[Surge] Start copying surge rules...")
 
     # 确保目标目录存在
@@ -10,40 +35,40 @@ def build(out_ruleset_dir, out_surge_ruleset_dir) -> None:
         os.makedirs(out_surge_ruleset_dir)
 
     # 获取所有 .conf 文件
-    conf_files = [f for f in os.listdir(out_ruleset_dir) if f.endswith(".conf")]
+    conf_files = (
+        filenames
+        if filenames is not None
+        else [f for f in os.listdir(out_ruleset_dir) if f.endswith(".conf")]
+    )
     processed_count = 0
+    unchanged_count = 0
 
     # 处理文件
+    jobs, pending = [], {}
     for filename in conf_files:
         source_file = os.path.join(out_ruleset_dir, filename)
         dest_file = os.path.join(out_surge_ruleset_dir, filename)
 
-        # 读取源文件内容
-        with open(source_file, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-
-        # 过滤掉注释行并获取非空行
-        content_lines = [
-            line.strip()
-            for line in lines
-            if line.strip() and not line.strip().startswith("#")
-        ]
+        # 源文件未变化则跳过
+        key, inputs = f"surge:{filename}", [source_file, __file__, *SHARED_CODE]
+        if manifest and manifest.is_fresh(key, inputs):
+            unchanged_count += 1
+            continue
 
-        rule_name = filename.replace(".conf", "")
-        update_info = until.make_ruleset_header(rule_name)
+        # 在主进程中解析，其他格式复用同一份解析结果
+        jobs.append((ruleset.load(source_file), dest_file))
+        pending[dest_file] = (filename, key, inputs)
 
-        # 写入目标文件
-        with open(dest_file, "w", encoding="utf-8", newline="\n") as f:
-            f.write(update_info)
-            # content_lines.sort()
-            f.write("\n".join(content_lines))
-            f.write("\n")
+    for job, rules in process_pool.run(convert_file, jobs):
+        filename, key, inputs = pending[job[1]]
+        if manifest:
+            manifest.record(key, inputs, [job[1]], rules=rules)
 
         processed_count += 1
         print(f"[Surge] Processed {filename} to Surge ruleset directory")
 
     print(
-        f"[Surge] Completed: {processed_count} files processed to Surge ruleset directory"
+        f"[Surge] Completed: {processed_count} files processed to Surge ruleset directory, {unchanged_count} unchanged"
     )
     print("[Surge] End processing surge rules")
 
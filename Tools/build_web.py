@@ -1,9 +1,34 @@
+import concurrent.futures
+import functools
+import hashlib
 import os
-import requests
+import threading
+import build_compress
+import download
+import metrics
+import ruleset
 import until
 
+try:
+    from markdown_it import MarkdownIt
+except ImportError:  # Only the GitHub API renderer is available
+    MarkdownIt = None
 
-def render_markdown_to_html(md_content, github_token=None) -> str | None:
+# Files generated next to the index that are not listed in it
+HIDDEN_FILES = ("index.html", "build-report.json")
+
+RENDERERS = ("local", "github")
+
+
+@functools.cache
+def _local_markdown():
+    # CommonMark plus the GFM extensions GitHub renders: tables, strikethrough, autolinks
+    return MarkdownIt("commonmark", {"html": True, "linkify": True}).enable(
+        ["table", "strikethrough", "linkify"]
+    )
+
+
+def render_with_github(md_content, github_token=None) -> str | None:
     github_api_url = "https://api.github.com/markdown"
     headers = {
         "Accept": "application/vnd.github+json",
@@ -15,7 +40,7 @@ def render_markdown_to_html(md_content, github_token=None) -> str | None:
 
     payload = {"text": md_content, "mode": "gfm"}
 
-    response = requests.post(github_api_url, headers=headers, json=payload)
+    response = download.request("POST", github_api_url, headers=headers, json=payload)
 
     if response.status_code == 200:
         return response.text
@@ -25,11 +50,54 @@ def render_markdown_to_html(md_content, github_token=None) -> str | None:
         return None
 
 
-def convert_markdown_to_html(md_file_path, output_html_path, github_token=None) -> bool:
+def render_markdown_to_html(
+    md_content, github_token=None, renderer="local", cache_dir=None
+) -> str | None:
+    """Render Markdown to an HTML fragment.
+
+    Args:
+        md_content: Markdown text
+        github_token: GitHub token for API requests
+        renderer: "local" (markdown-it-py) or "github" (GitHub Markdown API)
+        cache_dir: Cache rendered HTML here by content hash, None to disable
+    """
+    if renderer not in RENDERERS:
+        raise ValueError(f"unknown markdown renderer: {renderer}")
+    if renderer == "local" and MarkdownIt is None:
+        print("[Web] markdown-it-py is not installed, rendering with the GitHub API")
+        renderer = "github"
+
+    cache_path = None
+    if cache_dir:
+        digest = hashlib.sha256(f"{renderer}\n{md_content}".encode("utf-8")).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{digest}.html")
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return f.read()
+
+    if renderer == "local":
+        html_content = _local_markdown().render(md_content)
+    else:
+        html_content = render_with_github(md_content, github_token)
+
+    if html_content is not None and cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(html_content)
+        os.replace(tmp_path, cache_path)
+    return html_content
+
+
+def convert_markdown_to_html(
+    md_file_path, output_html_path, github_token=None, renderer="local", cache_dir=None
+) -> bool:
     with open(md_file_path, "r", encoding="utf-8") as f:
         md_content = f.read()
 
-    html_content = render_markdown_to_html(md_content, github_token)
+    html_content = render_markdown_to_html(
+        md_content, github_token, renderer, cache_dir
+    )
 
     if html_content is None:
         print(f"[Web] Failed to convert: {md_file_path}")
@@ -41,64 +109,104 @@ def convert_markdown_to_html(md_file_path, output_html_path, github_token=None)
 
     full_html = template.replace("{{CONTENT}}", html_content)
 
-    with open(output_html_path, "w", encoding="utf-8") as f:
+    with open(output_html_path, "w", encoding="utf-8", newline="\n") as f:
         f.write(full_html)
 
     return True
 
 
-def convert_all_markdown_files(directory, github_token=None) -> None:
-    """Recursively convert all Markdown files to HTML in a directory and delete original MD files."""
+def convert_all_markdown_files(
+    directory, github_token=None, manifest=None, renderer="local", cache_dir=None
+) -> None:
+    """Recursively convert all Markdown files to HTML in a directory and delete original MD files.
+
+    Files are converted concurrently. When a build manifest is given, Markdown files
+    whose content is unchanged since the last build keep their existing HTML; with a
+    cache_dir, rendered HTML is reused for any Markdown content seen before.
+    """
     print("[Web] Start converting Markdown files to HTML...")
     converted_count = 0
     failed_count = 0
+    unchanged_count = 0
+    template_path = os.path.join(os.path.dirname(__file__), "web_template.html")
 
+    pending = []
     for root, _, files in os.walk(directory):
         for file in files:
             if file.endswith(".md") and not file.startswith("."):
                 md_path = os.path.join(root, file)
                 html_path = md_path[:-3] + ".html"
 
-                print(f"[Web] Converting: {md_path}")
-                if convert_markdown_to_html(md_path, html_path, github_token):
-                    converted_count += 1
+                key = f"markdown:{os.path.relpath(md_path, directory)}"
+                inputs = [md_path, template_path]
+                if manifest and manifest.is_fresh(key, inputs, renderer):
+                    unchanged_count += 1
                     os.remove(md_path)
-                    print(f"[Web] Generated: {html_path}, deleted: {md_path}")
-                else:
-                    failed_count += 1
-                    print(f"[Web] Failed: {md_path}")
+                    continue
+
+                pending.append((md_path, html_path, key, inputs))
+
+    def convert(item) -> bool:
+        md_path, html_path = item[:2]
+        print(f"[Web] Converting: {md_path}")
+        return convert_markdown_to_html(
+            md_path, html_path, github_token, renderer, cache_dir
+        )
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        results = list(executor.map(metrics.bind(convert), pending))
+
+    for (md_path, html_path, key, inputs), converted in zip(pending, results):
+        if converted:
+            converted_count += 1
+            if manifest:
+                manifest.record(key, inputs, [html_path], renderer)
+            os.remove(md_path)
+            print(f"[Web] Generated: {html_path}, deleted: {md_path}")
+        else:
+            failed_count += 1
+            print(f"[Web] Failed: {md_path}")
 
     print(
-        f"[Web] Conversion complete: {converted_count} succeeded, {failed_count} failed"
+        f"[Web] Conversion complete: {converted_count} succeeded, {failed_count} failed, {unchanged_count} unchanged"
     )
     print("[Web] End converting Markdown files to HTML")
 
 
-def generate_file_tree_html(public_dir, base_url=".", rule_extensions=None) -> str:
+def generate_file_tree_html(
+    public_dir, base_url=".", rule_extensions=None, manifest=None
+) -> str:
     """Generate HTML file tree.
 
     Args:
         public_dir: Directory to scan
         base_url: Base URL for file links
         rule_extensions: List of file extensions to count rules for (e.g., ['.conf', '.json'])
+        manifest: Build manifest holding the rule counts recorded by the emitters;
+            only files it has no up-to-date count for are read
     """
     if rule_extensions is None:
         rule_extensions = [".conf", ".json"]
 
-    def get_file_size(filepath):
-        size = os.path.getsize(filepath)
+    def get_file_size(size):
         for unit in ["B", "KiB", "MiB", "GiB"]:
             if size < 1024.0:
                 return f"{size:.2f} {unit}"
             size /= 1024.0
         return f"{size:.2f} TiB"
 
-    def count_rules(filepath):
+    def count_rules(filepath, st):
         """Count non-comment, non-empty lines in a file.
 
         For .conf files: counts non-comment, non-empty lines
-        For .json files (sing-box format): counts total rule entries across all rule types
+        For .json files (sing-box format): counts total rule entries across all rule types,
+        returns None for other JSON files (e.g. the changelog)
         """
+        if manifest:
+            count = manifest.rule_count(filepath, st)
+            if count is not None:
+                return count
+
         try:
             file_ext = os.path.splitext(filepath)[1].lower()
 
@@ -108,6 +216,8 @@ def generate_file_tree_html(public_dir, base_url=".", rule_extensions=None) -> s
 
                 with open(filepath, "r", encoding="utf-8") as f:
                     data = json.load(f)
+                    if not isinstance(data.get("rules"), list):
+                        return None
                     count = 0
                     # sing-box format: {"version": 2, "rules": [{"domain": [...], "domain_suffix": [...], ...}]}
                     if "rules" in data and isinstance(data["rules"], list):
@@ -119,15 +229,11 @@ def generate_file_tree_html(public_dir, base_url=".", rule_extensions=None) -> s
                                         count += len(values)
                     return count
             else:
-                # Handle .conf and other text-based formats
-                with open(filepath, "r", encoding="utf-8") as f:
-                    count = 0
-                    for line in f:
-                        line = line.strip()
-                        # Skip empty lines and comment lines
-                        if line and not line.startswith("#"):
-                            count += 1
-                    return count
+                # Handle .conf and other text-based formats. Only files without a
+                # recorded count get here (e.g. copied lists); count the lines directly
+                # rather than through ruleset.load, which would add them to rules_in
+                with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+                    return ruleset.count_rules(f)
         except Exception as e:
             print(f"Error counting rules in {filepath}: {e}")
             return 0
@@ -135,39 +241,48 @@ def generate_file_tree_html(public_dir, base_url=".", rule_extensions=None) -> s
     def scan_directory(dir_path, relative_path="") -> list[str]:
         items = []
         try:
-            entries = sorted(os.listdir(dir_path))
+            with os.scandir(dir_path) as entries:
+                entries = list(entries)
             for entry in entries:
-                if entry.startswith(".") or entry == "index.html":
+                if (
+                    entry.name.startswith(".")
+                    or entry.name in HIDDEN_FILES
+                    or build_compress.is_compressed(entry.name)
+                ):
                     continue
 
-                full_path = os.path.join(dir_path, entry)
                 rel_path = (
-                    os.path.join(relative_path, entry) if relative_path else entry
+                    os.path.join(relative_path, entry.name)
+                    if relative_path
+                    else entry.name
                 )
 
-                if os.path.isdir(full_path):
+                if entry.is_dir():
                     items.append(
                         {
                             "type": "dir",
-                            "name": entry,
+                            "name": entry.name,
                             "path": rel_path,
-                            "items": scan_directory(full_path, rel_path),
+                            "items": scan_directory(entry.path, rel_path),
                         }
                     )
                 else:
+                    st = entry.stat()
                     file_info = {
                         "type": "file",
-                        "name": entry,
+                        "name": entry.name,
                         "path": rel_path,
-                        "size": get_file_size(full_path),
+                        "size": get_file_size(st.st_size),
                     }
                     # Add rule count for files in List directory with supported extensions
                     if rel_path.startswith("List" + os.sep) or rel_path.startswith(
                         "List/"
                     ):
-                        file_ext = os.path.splitext(entry)[1].lower()
+                        file_ext = os.path.splitext(entry.name)[1].lower()
                         if file_ext in rule_extensions:
-                            file_info["rules"] = count_rules(full_path)
+                            count = count_rules(entry.path, st)
+                            if count is not None:
+                                file_info["rules"] = count
                     items.append(file_info)
         except Exception as e:
             print(f"Error scanning {dir_path}: {e}")
@@ -255,7 +370,13 @@ def generate_file_tree_html(public_dir, base_url=".", rule_extensions=None) -> s
 
 
 def build_file_list_page(
-    public_dir, output_path, base_url=".", github_token=None, rule_extensions=None
+    public_dir,
+    output_path,
+    base_url=".",
+    github_token=None,
+    rule_extensions=None,
+    manifest=None,
+    renderer="local",
 ) -> None:
     """Build the file list page.
 
@@ -265,10 +386,25 @@ def build_file_list_page(
         base_url: Base URL for file links
         github_token: GitHub token for API requests
         rule_extensions: List of file extensions to count rules for
+        manifest: Build manifest, the page is kept as is when the file tree is unchanged
+        renderer: Markdown renderer, "local" or "github"
     """
     print("[Web] Start building file list page...")
 
     template_path = os.path.join(os.path.dirname(__file__), "web_index_template.md")
+    html_template_path = os.path.join(
+        os.path.dirname(__file__), "web_index_template.html"
+    )
+
+    file_tree_html = generate_file_tree_html(
+        public_dir, base_url, rule_extensions, manifest
+    )
+
+    key, inputs = "web:index", [template_path, html_template_path]
+    if manifest and manifest.is_fresh(key, inputs, [renderer, file_tree_html]):
+        print("[Web] File tree unchanged, keep the existing file list page")
+        return
+
     with open(template_path, "r", encoding="utf-8") as f:
         template_content = f.read()
 
@@ -276,19 +412,16 @@ def build_file_list_page(
 
     md_content = template_content.replace("{{UPDATE_TIME}}", update_time)
 
-    html_content = render_markdown_to_html(md_content, github_token)
+    # The page embeds the update time, so it is never worth caching
+    html_content = render_markdown_to_html(md_content, github_token, renderer)
 
     if html_content is None:
         print("[Web] Failed to build file list page")
         return
 
-    file_tree_html = generate_file_tree_html(public_dir, base_url, rule_extensions)
     html_content = html_content.replace("{{FILE_TREE}}", file_tree_html)
 
     # Use web_index_template.html (special template for index page)
-    html_template_path = os.path.join(
-        os.path.dirname(__file__), "web_index_template.html"
-    )
     with open(html_template_path, "r", encoding="utf-8") as f:
         html_template = f.read()
 
@@ -296,9 +429,12 @@ def build_file_list_page(
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    with open(output_path, "w", encoding="utf-8") as html_file:
+    with open(output_path, "w", encoding="utf-8", newline="\n") as html_file:
         html_file.write(full_html)
 
+    if manifest:
+        manifest.record(key, inputs, [output_path], [renderer, file_tree_html])
+
     print(f"[Web] File list page generated: {output_path}")
     print("[Web] End building file list page")
 
@@ -311,4 +447,5 @@ if __name__ == "__main__":
         os.path.join(config.OUT_DIR, "index.html"),
         github_token=config.GITHUB_TOKEN,
         rule_extensions=config.WEB_RULE_EXTENSIONS,
+        renderer=config.MARKDOWN_RENDERER,
     )
@@ -0,0 +1,108 @@
+import socket
+
+"""
+基于整数区间的 CIDR 处理
+
+把每个网段转换成 [start, end] 整数区间，排序后一次扫描完成合并与排除，
+再把结果区间拆成最少数量的 CIDR 前缀。IPv4 与 IPv6 分开处理。
+"""
+
+BITS = {4: 32, 6: 128}
+_FAMILY = {4: socket.AF_INET, 6: socket.AF_INET6}
+
+
+def parse_network(text: str) -> tuple[int, int, int]:
+    """解析 '1.2.3.0/24' 或单个地址，返回 (版本, 起始, 结束)，主机位会被清零（同 strict=False）。"""
+    addr, sep, prefix = text.strip().partition("/")
+    version = 6 if ":" in addr else 4
+    bits = BITS[version]
+    try:
+        value = int.from_bytes(socket.inet_pton(_FAMILY[version], addr), "big")
+    except OSError:
+        raise ValueError(f"invalid address: {text}") from None
+
+    prefix_len = int(prefix) if sep else bits
+    if not 0 <= prefix_len <= bits:
+        raise ValueError(f"invalid prefix length: {text}")
+
+    host_mask = (1 << (bits - prefix_len)) - 1
+    start = value & ~host_mask
+    return version, start, start | host_mask
+
+
+def merge_ranges(ranges) -> list[tuple[int, int]]:
+    """合并重叠或相邻的区间。"""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_ranges(ranges, excluded) -> list[tuple[int, int]]:
+    """从区间中减去排除区间，覆盖排除区间的大网段会被拆开。"""
+    ranges = merge_ranges(ranges)
+    excluded = merge_ranges(excluded)
+
+    result: list[tuple[int, int]] = []
+    i = 0
+    for start, end in ranges:
+        # 跳过完全位于当前区间之前的排除区间
+        while i < len(excluded) and excluded[i][1] < start:
+            i += 1
+        j = i
+        while j < len(excluded) and excluded[j][0] <= end:
+            ex_start, ex_end = excluded[j]
+            if ex_start > start:
+                result.append((start, ex_start - 1))
+            start = max(start, ex_end + 1)
+            j += 1
+        if start <= end:
+            result.append((start, end))
+    return result
+
+
+def range_to_prefixes(start: int, end: int, bits: int) -> list[tuple[int, int]]:
+    """把区间拆成最少的 (网络地址, 前缀长度) 列表。"""
+    prefixes = []
+    while start <= end:
+        # 起始地址对齐允许的最大块，与剩余长度允许的最大块取较小者
+        align = (start & -start).bit_length() - 1 if start else bits
+        span = (end - start + 1).bit_length() - 1
+        size = min(align, span)
+        prefixes.append((start, bits - size))
+        start += 1 << size
+    return prefixes
+
+
+def format_network(version: int, network: int, prefix_len: int) -> str:
+    packed = network.to_bytes(BITS[version] // 8, "big")
+    return f"{socket.inet_ntop(_FAMILY[version], packed)}/{prefix_len}"
+
+
+def collapse(networks, exclude=(), on_invalid=None) -> list[str]:
+    """合并网段并减去 exclude，返回最少的 CIDR 列表（先 IPv4 后 IPv6，各自升序）。"""
+    ranges: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+    excluded: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+
+    for target, items in ((ranges, networks), (excluded, exclude)):
+        for item in items:
+            try:
+                version, start, end = parse_network(item)
+            except ValueError:
+                if on_invalid is not None:
+                    on_invalid(item)
+                continue
+            target[version].append((start, end))
+
+    result = []
+    for version in (4, 6):
+        for start, end in subtract_ranges(ranges[version], excluded[version]):
+            result.extend(
+                format_network(version, network, prefix_len)
+                for network, prefix_len in range_to_prefixes(start, end, BITS[version])
+            )
+    return result
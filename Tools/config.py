@@ -20,6 +20,53 @@ OUT_CLASH_RULESET_DIR = os.path.join(OUT_RULESET_DIR, "Clash")
 OUT_SURGE_RULESET_DIR = os.path.join(OUT_RULESET_DIR, "Surge")
 OUT_SMARTDNS_RULESET_DIR = os.path.join(OUT_RULESET_DIR, "smartdns")
 OUT_MIHOMO_RULESET_DIR = os.path.join(OUT_RULESET_DIR, "mihomo")
+# 相对上次构建的增删文件与 changelog.json
+OUT_DELTA_DIR = os.path.join(OUT_RULESET_DIR, "Delta")
+
+# 构建缓存（增量构建清单等），不会被发布
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(PROCESS_DIR, ".cache"))
+BUILD_MANIFEST = os.path.join(CACHE_DIR, "build-manifest.json")
+# 上次构建各产物中的规则，用于生成增删文件
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, "snapshots")
+
+# 上游来源下载缓存，超过 HTTP_CACHE_TTL 秒后使用条件请求重新验证
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, "http")
+HTTP_CACHE_TTL = int(os.getenv("HTTP_CACHE_TTL", 60 * 60))
+# 上游请求：全局与单个主机的并发上限、连接与读取超时（秒）
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 8))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", 4))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+# 连接失败、超时、429 与 5xx 时的重试次数，以及指数退避的初始与最长等待（秒）
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", 1))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 30))
+# mihomo .mrs 编译：并发转换数与编译缓存
+MRS_WORKERS = int(os.getenv("MRS_WORKERS", os.cpu_count() or 1))
+MRS_CACHE_DIR = os.path.join(CACHE_DIR, "mrs")
+# .mrs 编码方式：native 使用内置编码器，mihomo 调用 mihomo convert-ruleset
+MRS_ENCODER = os.getenv("MRS_ENCODER", "native")
+# 离线模式，只使用已缓存的上游内容
+OFFLINE = os.getenv("OFFLINE", "False").lower() in ("true", "1")
+# 确定性模式，产物的 "Last Updated" 只在规则内容变化时更新，内容不变的产物字节不变
+DETERMINISTIC = os.getenv("DETERMINISTIC", "False").lower() in ("true", "1")
+# 逐文件转换（Clash / sing-box / Surge / smartdns）使用的进程数，设为 1 时在线程中串行转换
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", os.cpu_count() or 1))
+# 同时运行的构建阶段数
+BUILD_WORKERS = int(os.getenv("BUILD_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+# 各阶段的构建指标报告；每次构建同时追加到历史文件，BUILD_HISTORY 设为空时不记录
+BUILD_REPORT = os.path.join(OUT_DIR, "build-report.json")
+BUILD_HISTORY = os.getenv(
+    "BUILD_HISTORY", os.path.join(CACHE_DIR, "build-history.jsonl")
+)
+# Guard 合并来源时外部排序的内存上限（MiB），超过后排序写入临时文件再归并；设为 0 时在内存中合并
+GUARD_SORT_MEMORY = int(os.getenv("GUARD_SORT_MEMORY", 0)) << 20
+# List 中产物的预压缩格式（gz / br / zst，逗号分隔），设为空时不生成
+COMPRESS_FORMATS = tuple(
+    fmt.strip()
+    for fmt in os.getenv("COMPRESS_FORMATS", "gz,br,zst").split(",")
+    if fmt.strip()
+)
 
 DNSMASQ_CHINA_LIST = {
     "ChinaDomain": "https://github.com/felixonmars/dnsmasq-china-list/raw/master/accelerated-domains.china.conf",
@@ -116,6 +163,10 @@ Web相关
 """
 
 WEB_RULE_EXTENSIONS = [".conf", ".json", ".txt"]
+# Markdown 渲染方式：local 使用 markdown-it-py 在本地渲染，github 调用 GitHub Markdown API
+MARKDOWN_RENDERER = os.getenv("MARKDOWN_RENDERER", "local")
+# 渲染结果按内容哈希缓存，内容未变的 Markdown 不会重新渲染
+MARKDOWN_CACHE_DIR = os.path.join(CACHE_DIR, "markdown")
 
 """
 处理相关
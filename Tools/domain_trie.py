@@ -0,0 +1,95 @@
+"""
+按反转标签（com -> example -> www）组织的域名后缀树
+
+用于判断某个域名是否已被更宽的后缀规则覆盖，以及去掉 domainset 中的冗余条目。
+"""
+
+# 节点中表示“此处存在后缀规则”的键，不会与任何标签冲突
+_END = None
+
+
+class SuffixTrie:
+    __slots__ = ("root", "size")
+
+    def __init__(self) -> None:
+        self.root: dict = {}
+        self.size = 0
+
+    def insert(self, domain: str, value=True) -> None:
+        """插入后缀 domain（匹配 domain 本身及其所有子域名），已存在时保留先插入的值。"""
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        if _END not in node:
+            node[_END] = value
+            self.size += 1
+
+    def match(self, domain: str, *, include_self: bool = True):
+        """返回覆盖 domain 的最短后缀所对应的值，没有则返回 None。
+
+        include_self 为 False 时只查找 domain 的上级后缀（不含其本身）。
+        """
+        node = self.root
+        labels = domain.split(".")
+        last = len(labels) - 1
+        for depth, label in enumerate(reversed(labels)):
+            node = node.get(label)
+            if node is None:
+                return None
+            if _END in node and (include_self or depth < last):
+                return node[_END]
+        return None
+
+    def covers(self, domain: str, *, include_self: bool = True) -> bool:
+        return self.match(domain, include_self=include_self) is not None
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def minimize_domainset(domains) -> tuple[list[str], int]:
+    """去掉已被更宽后缀覆盖的条目，返回 (保留的条目, 去掉的条目数)，保留条目维持原顺序。
+
+    domainset 语义：'.example.com' 匹配 example.com 及其所有子域名，'example.com' 只匹配自身。
+    """
+    entries = list(dict.fromkeys(domains))
+
+    trie = SuffixTrie()
+    for entry in entries:
+        if entry.startswith("."):
+            trie.insert(entry.lstrip("."))
+
+    kept = []
+    for entry in entries:
+        is_suffix = entry.startswith(".")
+        # 后缀条目只会被上级后缀覆盖；完整域名还会被同名后缀覆盖
+        if not trie.covers(entry.lstrip("."), include_self=not is_suffix):
+            kept.append(entry)
+
+    return kept, len(entries) - len(kept)
+
+
+def suffix_sort_key(entry: str) -> tuple[str, bool]:
+    """按反转标签排序 domainset 条目的键。
+
+    标签之间用 '\\0' 连接：某个后缀覆盖的所有条目在排序结果中紧跟在它之后且连续，
+    同名的后缀条目排在完整域名之前。
+    """
+    return "\0".join(reversed(entry.lstrip(".").split("."))), not entry.startswith(".")
+
+
+def minimize_sorted(entries):
+    """minimize_domainset 的流式版本，entries 须已按 suffix_sort_key 排序并去重。
+
+    被覆盖的条目总是紧跟在覆盖它的后缀之后，只需记住当前的后缀，内存占用与条目数无关。
+    """
+    cover = None
+    for entry in entries:
+        labels, is_domain = suffix_sort_key(entry)
+        if cover is not None and (
+            labels.startswith(cover) or (is_domain and labels == cover[:-1])
+        ):
+            continue
+        if not is_domain:
+            cover = labels + "\0"
+        yield entry
@@ -0,0 +1,371 @@
+import contextlib
+import email.utils
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+import metrics
+from until import run_in_threads
+
+"""
+上游来源下载与缓存
+
+下载内容保存在 config.HTTP_CACHE_DIR，过期（config.HTTP_CACHE_TTL 秒）后使用
+ETag / Last-Modified 发起条件请求，上游未变化时服务器返回 304，不再传输内容。
+config.OFFLINE 为 True 时只使用缓存，不发起任何网络请求。
+
+所有请求共用一个按主机复用连接（keep-alive）的会话，并同时受全局与单个主机的并发上限约束，
+各阶段各自的线程池再多也不会超过这两个上限。每次请求都有连接与读取超时；连接失败、超时、
+429 与 5xx 时按指数退避（带随机抖动）重试。
+"""
+
+
+CHUNK_SIZE = 1 << 16
+
+
+# 需要重试的状态码
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+# 需要重试的异常：连接失败、超时、读取内容时连接中断
+RETRY_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class OfflineError(RuntimeError):
+    pass
+
+
+class RetryableStatus(requests.HTTPError):
+    """服务器返回了 429 或 5xx。"""
+
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+_global_slots = threading.BoundedSemaphore(config.HTTP_MAX_CONNECTIONS)
+_host_slots: dict[str, threading.BoundedSemaphore] = {}
+
+
+def session() -> requests.Session:
+    """共享的会话，每个主机的连接池大小与单个主机的并发上限相同。"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=32, pool_maxsize=config.HTTP_MAX_PER_HOST
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+@contextlib.contextmanager
+def _slot(url: str):
+    host = urlsplit(url).netloc
+    with _session_lock:
+        host_slots = _host_slots.setdefault(
+            host, threading.BoundedSemaphore(config.HTTP_MAX_PER_HOST)
+        )
+    # 先取主机名额再取全局名额，等待某个主机时不占用其他主机可用的全局名额
+    with host_slots, _global_slots:
+        yield
+
+
+def _retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(
+            0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """第 attempt 次（从 0 开始）重试前的等待秒数：指数退避加随机抖动，不超过上限。"""
+    delay = min(config.HTTP_BACKOFF_MAX, config.HTTP_BACKOFF * (2**attempt))
+    delay = random.uniform(delay / 2, delay)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, config.HTTP_BACKOFF_MAX))
+    return delay
+
+
+def call_with_retries(func, url: str):
+    """调用 func()，抛出可重试的错误时等待后重试，超过 config.HTTP_RETRIES 次后抛出最后的错误。"""
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except (RetryableStatus, *RETRY_EXCEPTIONS) as e:
+            if attempt >= config.HTTP_RETRIES:
+                raise
+            delay = backoff_delay(attempt, _retry_after(e))
+            attempt += 1
+            print(
+                f"[Download] {url} failed ({e.__class__.__name__}), "
+                f"retry {attempt}/{config.HTTP_RETRIES} in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+@contextlib.contextmanager
+def open_url(method: str, url: str, **kwargs):
+    """
+    在并发名额内发起一次请求（不重试），退出 with 时关闭响应并释放名额
+    流式读取内容（stream=True）时名额一直保留到读取结束；返回 429 或 5xx 时抛出 RetryableStatus
+    """
+    kwargs.setdefault(
+        "timeout", (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+    )
+    with _slot(url):
+        response = session().request(method, url, **kwargs)
+        with response:
+            if response.status_code in RETRY_STATUS:
+                raise RetryableStatus(
+                    f"{response.status_code} for {url}", response=response
+                )
+            yield response
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """带重试的请求，返回已读取全部内容的响应。"""
+
+    def attempt() -> requests.Response:
+        started = time.perf_counter()
+        try:
+            with open_url(method, url, **kwargs) as response:
+                size = len(response.content)
+        except RetryableStatus as e:
+            metrics.record_http(
+                url, 0, time.perf_counter() - started, e.response.status_code
+            )
+            raise
+        except requests.RequestException:
+            metrics.record_http(url, 0, time.perf_counter() - started, None)
+            raise
+        metrics.record_http(
+            url, size, time.perf_counter() - started, response.status_code
+        )
+        return response
+
+    return call_with_retries(attempt, url)
+
+
+# 本次构建中已经验证过的 URL，同一次构建内不再重复请求
+_validated: set[str] = set()
+_url_locks: dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+
+def _cache_paths(url: str) -> tuple[str, str]:
+    name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return (
+        os.path.join(config.HTTP_CACHE_DIR, f"{name}.body"),
+        os.path.join(config.HTTP_CACHE_DIR, f"{name}.json"),
+    )
+
+
+def _load_meta(meta_path: str) -> dict | None:
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _save_meta(meta_path: str, meta: dict) -> None:
+    _write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+
+def fetch_path(url: str) -> str:
+    """返回 URL 内容在缓存中的文件路径，必要时下载或重新验证。"""
+    with _locks_lock:
+        url_lock = _url_locks.setdefault(url, threading.Lock())
+
+    with url_lock:
+        return _fetch_path(url)
+
+
+def _fetch_path(url: str) -> str:
+    body_path, meta_path = _cache_paths(url)
+    meta = _load_meta(meta_path)
+    cached = meta is not None and os.path.exists(body_path)
+
+    if config.OFFLINE:
+        if not cached:
+            raise OfflineError(f"{url} is not cached, cannot build offline")
+        print(f"[Download] Offline, using cached {url}")
+        return body_path
+
+    if cached and (
+        url in _validated or time.time() - meta["checked_at"] < config.HTTP_CACHE_TTL
+    ):
+        return body_path
+
+    headers = {}
+    if cached:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    def attempt():
+        started = time.perf_counter()
+        tmp_path = f"{body_path}.{threading.get_ident()}.tmp"
+        try:
+            with open_url("GET", url, headers=headers, stream=True) as response:
+                if response.status_code == 304:
+                    metrics.record_http(url, 0, time.perf_counter() - started, 304)
+                    if cached:
+                        return None
+                    # 没有发送条件请求却收到 304，不能用空内容覆盖缓存
+                    raise requests.HTTPError(
+                        f"Unexpected 304 for {url} without a cached copy",
+                        response=response,
+                    )
+
+                if not response.ok:
+                    metrics.record_http(
+                        url, 0, time.perf_counter() - started, response.status_code
+                    )
+                response.raise_for_status()
+
+                # 边下载边写入缓存文件，内存中只保留一个数据块
+                os.makedirs(config.HTTP_CACHE_DIR, exist_ok=True)
+                digest = hashlib.sha256()
+                size = 0
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                os.replace(tmp_path, body_path)
+                metrics.record_http(
+                    url, size, time.perf_counter() - started, response.status_code
+                )
+                return response.headers, digest.hexdigest(), size
+        except RetryableStatus as e:
+            metrics.record_http(
+                url, 0, time.perf_counter() - started, e.response.status_code
+            )
+            raise
+        except requests.HTTPError:
+            raise
+        except requests.RequestException:
+            metrics.record_http(url, 0, time.perf_counter() - started, None)
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    try:
+        result = call_with_retries(attempt, url)
+    except requests.RequestException as e:
+        # 其他 4xx 说明来源本身有问题，不使用缓存掩盖
+        if not cached or (
+            isinstance(e, requests.HTTPError) and not isinstance(e, RetryableStatus)
+        ):
+            raise
+        print(f"[Download] Failed to revalidate {url}, using cached copy: {e}")
+        return body_path
+
+    if result is None:
+        print(f"[Download] Not modified: {url}")
+        meta["checked_at"] = time.time()
+        _save_meta(meta_path, meta)
+        _validated.add(url)
+        return body_path
+
+    response_headers, sha256, size = result
+    _save_meta(
+        meta_path,
+        {
+            "url": url,
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "checked_at": time.time(),
+            "sha256": sha256,
+            "size": size,
+        },
+    )
+    _validated.add(url)
+    print(f"[Download] Downloaded {url} ({size} bytes)")
+    return body_path
+
+
+def fetch_text(url: str) -> str:
+    with open(fetch_path(url), "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def read_head(url: str, size: int) -> str:
+    """读取 URL 内容开头的 size 个字节，用于探测格式。"""
+    with open(fetch_path(url), "rb") as f:
+        return f.read(size).decode("utf-8", errors="replace")
+
+
+def iter_lines(url: str):
+    """逐行读取 URL 内容（已去掉行尾换行符），不会把整个内容读入内存。"""
+    with open(fetch_path(url), "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+def iter_line_batches(url: str, size: int = CHUNK_SIZE * 16):
+    """按块读取 URL 内容，每次返回一批行（已去掉换行符），比逐行读取的开销小得多。"""
+    with open(
+        fetch_path(url), "r", encoding="utf-8", errors="replace", newline=""
+    ) as f:
+        pending = ""
+        while chunk := f.read(size):
+            # 与逐行读取一致，\r\n 与单独的 \r 都视为换行（跨块的 \r\n 会多出一个空行）
+            if "\r" in chunk:
+                chunk = chunk.replace("\r\n", "\n").replace("\r", "\n")
+            lines = (pending + chunk).split("\n")
+            pending = lines.pop()
+            yield lines
+        if pending:
+            yield [pending]
+
+
+def fetch_all(urls) -> list[str]:
+    """并发获取多个 URL，返回对应的缓存文件路径（顺序与 urls 一致）。"""
+    urls = list(urls)
+    paths: list[str | None] = [None] * len(urls)
+
+    def fetch_one(index, url) -> None:
+        paths[index] = fetch_path(url)
+
+    run_in_threads(
+        [
+            lambda index=index, url=url: fetch_one(index, url)
+            for index, url in enumerate(urls)
+        ]
+    )
+
+    missing = [url for url, path in zip(urls, paths) if path is None]
+    if missing:
+        raise RuntimeError(f"Failed to fetch {', '.join(missing)}")
+    return paths
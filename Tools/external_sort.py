@@ -0,0 +1,123 @@
+import heapq
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+"""
+有界内存的外部排序
+
+加入的行在内存中累计到给定字节数后排序去重，写入临时分段文件；输出时 k 路归并所有分段，
+同时去掉相邻的重复行。内存占用只取决于设定的上限与同时归并的分段数，与输入总量无关。
+"""
+
+# 每行除字符串本身外的内存开销（列表槽位、排序与去重时的临时对象）的粗略估计
+LINE_OVERHEAD = 64
+# 一次归并同时打开的分段文件数上限，超过时先分批归并
+MAX_FANIN = 64
+# 多线程加入时每次加锁处理的行数
+BATCH_SIZE = 4096
+
+
+def _read_run(path: str):
+    with open(path, "r", encoding="utf-8", newline="\n") as f:
+        for line in f:
+            yield line[:-1]
+
+
+def _unique(lines):
+    previous = None
+    for line in lines:
+        if line != previous:
+            yield line
+            previous = line
+
+
+class ExternalSorter:
+    """
+    去重排序，用法：
+        with ExternalSorter(64 << 20) as sorter:
+            sorter.update(lines)
+            for line in sorter: ...
+    可以在多个线程中同时调用 update；行中不能含有换行符。
+    """
+
+    def __init__(self, memory_limit: int, key=None, tmp_dir=None) -> None:
+        self.memory_limit = memory_limit
+        # 用原始行补全排序键，相同的行在归并结果中一定相邻
+        self.key = None if key is None else (lambda line: (key(line), line))
+        self.tmp_dir = tempfile.mkdtemp(prefix="sort-", dir=tmp_dir)
+        self.runs: list[str] = []
+        self.run_ids = itertools.count()
+        self.buffer: list[str] = []
+        self.buffer_size = 0
+        self.lock = threading.Lock()
+        # 迭代时已输出的（去重后的）行数
+        self.count = 0
+
+    def __enter__(self) -> "ExternalSorter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.buffer = []
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def update(self, lines) -> int:
+        """加入行，返回加入的行数。"""
+        added = 0
+        iterator = iter(lines)
+        while batch := list(itertools.islice(iterator, BATCH_SIZE)):
+            size = sum(map(sys.getsizeof, batch)) + LINE_OVERHEAD * len(batch)
+            with self.lock:
+                self.buffer.extend(batch)
+                self.buffer_size += size
+                if self.buffer_size >= self.memory_limit:
+                    self._spill()
+            added += len(batch)
+        return added
+
+    def _new_run_path(self) -> str:
+        path = os.path.join(self.tmp_dir, f"{next(self.run_ids):06d}.run")
+        self.runs.append(path)
+        return path
+
+    def _write_run(self, lines) -> None:
+        with open(self._new_run_path(), "w", encoding="utf-8", newline="\n") as f:
+            f.writelines(f"{line}\n" for line in lines)
+
+    def _spill(self) -> None:
+        lines = sorted(set(self.buffer), key=self.key)
+        self.buffer = []
+        self.buffer_size = 0
+        self._write_run(lines)
+
+    def _merge(self, paths):
+        return _unique(heapq.merge(*map(_read_run, paths), key=self.key))
+
+    def __iter__(self):
+        with self.lock:
+            if not self.runs:
+                # 全部内容都在内存中，不必写入分段文件
+                lines = sorted(set(self.buffer), key=self.key)
+            else:
+                if self.buffer:
+                    self._spill()
+                runs = self.runs
+                while len(runs) > MAX_FANIN:
+                    self.runs = []
+                    for i in range(0, len(runs), MAX_FANIN):
+                        group = runs[i : i + MAX_FANIN]
+                        self._write_run(self._merge(group))
+                        for path in group:
+                            os.remove(path)
+                    runs = self.runs
+                lines = self._merge(runs)
+
+        for line in lines:
+            self.count += 1
+            yield line
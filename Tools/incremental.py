@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import metrics
+
+"""
+增量构建
+
+构建清单记录每个产物的输入文件哈希、所用配置以及输出文件哈希，
+下次构建时输入、配置和输出都没有变化的产物直接跳过，不再重新生成。
+生成规则文件时同时记下其中的规则条数（连同文件的大小与 mtime），
+生成索引页时据此直接取用，不必再把每个产物重新读一遍。
+确定性模式下，文件头中的 "Last Updated" 只在其余内容变化时才更新，
+内容不变的产物每次构建都得到完全相同的字节，客户端与 CDN 可以继续使用缓存。
+"""
+
+MANIFEST_VERSION = 1
+
+# 决定所有规则产物内容的共用代码（解析、文件头、配置），改动后各格式的产物都要重新生成
+SHARED_CODE = tuple(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ("ruleset.py", "until.py", "config.py")
+)
+
+# 规则文件头与索引页中的更新时间（until.now_cn_iso8601 的格式，长度固定），只处理第一处
+UPDATED_PATTERN = re.compile(
+    rb"Last Updated: (\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\+08:00)"
+)
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def value_digest(value) -> str:
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    def __init__(self, path: str, base_dir: str, deterministic: bool = False) -> None:
+        self.path = path
+        self.base_dir = base_dir
+        self.deterministic = deterministic
+        self.entries: dict[str, dict] = {}
+        self.digests: dict[str, list] = {}
+        self.rules: dict[str, list] = {}
+        # 产物路径 -> [去掉更新时间后的内容哈希, 该内容第一次出现时的更新时间]
+        self.updated: dict[str, list] = {}
+        self.touched: set[str] = set()
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    self.entries = data.get("entries", {})
+                    self.digests = data.get("digests", {})
+                    self.rules = data.get("rules", {})
+                    self.updated = data.get("updated", {})
+            except (OSError, ValueError) as e:
+                print(f"[Incremental] Ignore broken manifest {path}: {e}")
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.base_dir).replace(os.sep, "/")
+
+    def _abs(self, rel_path: str) -> str:
+        return os.path.join(self.base_dir, *rel_path.split("/"))
+
+    def digest(self, path: str) -> str | None:
+        """文件哈希，按 (大小, mtime) 缓存，未改动的文件不会重复读取。"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        rel_path = self._rel(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            cached = self.digests.get(rel_path)
+        if cached and cached[:2] == stamp:
+            return cached[2]
+        digest = file_digest(path)
+        with self._lock:
+            self.digests[rel_path] = stamp + [digest]
+        return digest
+
+    def stabilize(self, path: str) -> None:
+        """
+        确定性模式：文件除更新时间外与上次记录的内容相同时，把更新时间改回上次的时间，
+        否则记下新的内容与时间；没有更新时间的文件不做处理
+        """
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        match = UPDATED_PATTERN.search(data)
+        if match is None:
+            return
+
+        start, end = match.span(1)
+        content = hashlib.sha256(data[:start] + data[end:]).hexdigest()
+        updated = match.group(1).decode()
+        rel_path = self._rel(path)
+        with self._lock:
+            previous = self.updated.get(rel_path)
+            if previous is None or previous[0] != content:
+                self.updated[rel_path] = [content, updated]
+                return
+
+        if previous[1] != updated:
+            # 时间长度固定，直接在原位置覆盖
+            with open(path, "r+b") as f:
+                f.seek(start)
+                f.write(previous[1].encode())
+
+    def note_rules(self, rule_counts) -> None:
+        """记录文件中的规则条数，rule_counts 为 {文件路径: 条数}。"""
+        for path, count in rule_counts.items():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                self.rules[self._rel(path)] = [st.st_size, st.st_mtime_ns, count]
+
+    def rule_count(self, path: str, st: os.stat_result | None = None) -> int | None:
+        """返回记录的规则条数，文件在记录之后被改动过或没有记录时返回 None。"""
+        if st is None:
+            st = os.stat(path)
+        with self._lock:
+            cached = self.rules.get(self._rel(path))
+        if cached and cached[:2] == [st.st_size, st.st_mtime_ns]:
+            return cached[2]
+        return None
+
+    def _input_digests(self, input_paths) -> dict[str, str | None]:
+        return {self._rel(path): self.digest(path) for path in input_paths}
+
+    def is_fresh(self, key: str, input_paths=(), config=None) -> bool:
+        """输入、配置未变且上次的输出仍完好时返回 True。"""
+        with self._lock:
+            self.touched.add(key)
+            entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if entry.get("config") != value_digest(config):
+            return False
+        if entry.get("inputs") != self._input_digests(input_paths):
+            return False
+        fresh = all(
+            self.digest(self._abs(rel_path)) == output["hash"]
+            for rel_path, output in entry.get("outputs", {}).items()
+        )
+        if fresh:
+            metrics.add(unchanged=1)
+        return fresh
+
+    def record(
+        self, key: str, input_paths=(), output_paths=(), config=None, rules=None
+    ) -> None:
+        """rules: 本次读取或生成的规则文件中的规则条数，{文件路径: 条数}"""
+        if self.deterministic:
+            for path in output_paths:
+                self.stabilize(path)
+        metrics.record_files(input_paths, output_paths)
+        if rules:
+            self.note_rules(rules)
+        outputs = {}
+        for path in output_paths:
+            digest = self.digest(path)
+            if digest is not None:
+                outputs[self._rel(path)] = {"hash": digest}
+
+        entry = {
+            "inputs": self._input_digests(input_paths),
+            "config": value_digest(config),
+            "outputs": outputs,
+            "built_at": time.time(),
+        }
+        with self._lock:
+            self.touched.add(key)
+            previous = self.entries.get(key)
+            self.entries[key] = entry
+
+        # 本次不再产出的旧文件需要删除
+        if previous:
+            for rel_path in previous.get("outputs", {}).keys() - outputs.keys():
+                self._remove_output(rel_path)
+
+    def _remove_output(self, rel_path: str) -> None:
+        with self._lock:
+            still_used = any(
+                rel_path in entry.get("outputs", {})
+                for key, entry in self.entries.items()
+                if key in self.touched
+            )
+        if still_used:
+            return
+        path = self._abs(rel_path)
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"[Incremental] Removed stale output {rel_path}")
+
+    def prune(self) -> None:
+        """删除本次构建没有涉及的条目（例如源文件已被删除）及其产物。"""
+        with self._lock:
+            stale = [key for key in self.entries if key not in self.touched]
+            removed = [self.entries.pop(key) for key in stale]
+        for entry in removed:
+            for rel_path in entry.get("outputs", {}):
+                self._remove_output(rel_path)
+
+    def save(self) -> None:
+        with self._lock:
+            live_paths = {
+                rel_path
+                for entry in self.entries.values()
+                for rel_path in (*entry.get("inputs", {}), *entry.get("outputs", {}))
+            }
+            data = {
+                "version": MANIFEST_VERSION,
+                "entries": self.entries,
+                "digests": {k: v for k, v in self.digests.items() if k in live_paths},
+                "rules": {k: v for k, v in self.rules.items() if k in live_paths},
+                # 更新时间的记录跨越 --clean 保留，只去掉已不再产出的文件
+                "updated": {k: v for k, v in self.updated.items() if k in live_paths},
+            }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,304 @@
+import contextlib
+import contextvars
+import datetime
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+"""
+构建指标
+
+每个阶段（build.py 中的各个构建函数）记录自己的墙钟时间、CPU 时间、峰值内存（RSS）增量、
+读写的文件数与字节数、输入输出的规则数、每个上游 URL 的 HTTP 字节数与耗时，
+以及预压缩文件相对原文件节省的字节数。
+当前阶段保存在上下文变量中，until.run_in_threads 与 bind() 会把它带到工作线程里，
+各模块只需调用 add() / record_http() 等，无需传递任何对象；不在阶段内时这些调用不做任何事。
+"""
+
+REPORT_VERSION = 1
+# 历史文件最多保留的构建次数
+HISTORY_LIMIT = 500
+
+COUNTERS = (
+    "files_in",
+    "files_out",
+    "bytes_in",
+    "bytes_out",
+    "rules_in",
+    "rules_out",
+    "unchanged",
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss_kib() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KiB 为单位
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class StageMetrics:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.status = "running"
+        self.error: str | None = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss_kib: int | None = None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.http: dict[str, dict] = {}
+        self.compression: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def add(self, **counters) -> None:
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] += value
+
+    def add_cpu(self, seconds: float) -> None:
+        with self._lock:
+            self.cpu += seconds
+
+    def add_http(self, url: str, size: int, seconds: float, status: int | None) -> None:
+        with self._lock:
+            entry = self.http.setdefault(
+                url, {"requests": 0, "bytes": 0, "seconds": 0.0, "status": None}
+            )
+            entry["requests"] += 1
+            entry["bytes"] += size
+            entry["seconds"] += seconds
+            entry["status"] = status
+
+    def add_compression(self, fmt: str, size: int, compressed_size: int) -> None:
+        with self._lock:
+            entry = self.compression.setdefault(
+                fmt, {"files": 0, "bytes": 0, "compressed_bytes": 0}
+            )
+            entry["files"] += 1
+            entry["bytes"] += size
+            entry["compressed_bytes"] += compressed_size
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "status": self.status,
+                **({"error": self.error} if self.error else {}),
+                "wall": round(self.wall, 4),
+                "cpu": round(self.cpu, 4),
+                # 并发阶段共享同一进程，增量只反映该阶段运行期间进程峰值的增长
+                "peak_rss_kib": self.peak_rss_kib,
+                **self.counters,
+                "http": {
+                    url: {**entry, "seconds": round(entry["seconds"], 4)}
+                    for url, entry in sorted(self.http.items())
+                },
+                **(
+                    {
+                        "compression": {
+                            fmt: {
+                                **entry,
+                                "saved_bytes": entry["bytes"]
+                                - entry["compressed_bytes"],
+                            }
+                            for fmt, entry in sorted(self.compression.items())
+                        }
+                    }
+                    if self.compression
+                    else {}
+                ),
+            }
+
+
+_current: contextvars.ContextVar[StageMetrics | None] = contextvars.ContextVar(
+    "metrics_stage", default=None
+)
+_stages: list[StageMetrics] = []
+_stages_lock = threading.Lock()
+_started_at = time.time()
+_started = time.perf_counter()
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """记录一个阶段的指标，阶段失败时同样记录并继续抛出异常。"""
+    metrics = StageMetrics(name)
+    with _stages_lock:
+        _stages.append(metrics)
+    token = _current.set(metrics)
+    rss_before = _peak_rss_kib()
+    cpu_before = time.thread_time()
+    started = time.perf_counter()
+    try:
+        yield metrics
+        metrics.status = "ok"
+    except BaseException as e:
+        metrics.status = "failed"
+        metrics.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        metrics.wall = time.perf_counter() - started
+        metrics.add_cpu(time.thread_time() - cpu_before)
+        if rss_before is not None:
+            metrics.peak_rss_kib = _peak_rss_kib() - rss_before
+        _current.reset(token)
+
+
+def track(func, name: str | None = None):
+    """包装 func，调用时作为一个阶段记录指标，阶段名默认为函数名。"""
+
+    @functools.wraps(func)
+    def run():
+        with stage(name or func.__name__):
+            return func()
+
+    return run
+
+
+def _run_counted(func, args, kwargs):
+    metrics = _current.get()
+    cpu_before = time.thread_time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if metrics is not None:
+            metrics.add_cpu(time.thread_time() - cpu_before)
+
+
+def bind(func):
+    """返回在当前上下文的副本中运行 func 的函数，用于提交到线程池，线程的 CPU 时间计入当前阶段。"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(_run_counted, func, args, kwargs)
+
+    return run
+
+
+def capture(func, *args):
+    """在不登记的临时阶段中运行 func，返回 (结果, 指标)，用于把子进程中的指标带回父进程。"""
+    metrics = StageMetrics(func.__name__)
+    token = _current.set(metrics)
+    cpu_before = time.thread_time()
+    try:
+        result = func(*args)
+    finally:
+        _current.reset(token)
+    return result, {"cpu": time.thread_time() - cpu_before, **metrics.counters}
+
+
+def merge(captured: dict) -> None:
+    """把 capture() 返回的指标计入当前阶段。"""
+    metrics = _current.get()
+    if metrics is not None:
+        counters = dict(captured)
+        metrics.add_cpu(counters.pop("cpu"))
+        metrics.add(**counters)
+
+
+def add(**counters) -> None:
+    """累加当前阶段的计数，如 add(rules_in=100, rules_out=80)。"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add(**counters)
+
+
+class Counted:
+    """
+    迭代时统计元素个数，流式处理时统计输入的规则数，不必先收集到列表中
+        lines = metrics.Counted(lines)
+        all_lines.update(lines)
+        metrics.add(rules_in=lines.count)
+    """
+
+    def __init__(self, iterable) -> None:
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            self.count += 1
+            yield item
+
+
+def _total_size(paths) -> tuple[int, int]:
+    count = size = 0
+    for path in paths:
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            continue
+        count += 1
+    return count, size
+
+
+def record_files(input_paths=(), output_paths=()) -> None:
+    metrics = _current.get()
+    if metrics is None:
+        return
+    files_in, bytes_in = _total_size(input_paths)
+    files_out, bytes_out = _total_size(output_paths)
+    metrics.add(
+        files_in=files_in, bytes_in=bytes_in, files_out=files_out, bytes_out=bytes_out
+    )
+
+
+def record_http(url: str, size: int, seconds: float, status: int | None) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_http(url, size, seconds, status)
+
+
+def record_compression(fmt: str, size: int, compressed_size: int) -> None:
+    """记录一个预压缩文件：原文件大小与压缩后的大小。"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_compression(fmt, size, compressed_size)
+
+
+def report() -> dict:
+    with _stages_lock:
+        stages = [metrics.to_dict() for metrics in _stages]
+    return {
+        "version": REPORT_VERSION,
+        "started_at": datetime.datetime.fromtimestamp(
+            _started_at, datetime.timezone.utc
+        ).isoformat(timespec="seconds"),
+        "total": {
+            "wall": round(time.perf_counter() - _started, 4),
+            "cpu": round(time.process_time(), 4),
+            "peak_rss_kib": _peak_rss_kib(),
+            "status": ("failed" if any(s["status"] != "ok" for s in stages) else "ok"),
+        },
+        "stages": stages,
+    }
+
+
+def write_report(path: str, history_path: str | None = None) -> dict:
+    """写入本次构建的报告；给出 history_path 时同时追加到历史文件（JSON Lines）。"""
+    data = report()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+    if history_path:
+        lines = []
+        if os.path.exists(history_path):
+            with open(history_path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        lines.append(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        os.makedirs(os.path.dirname(history_path), exist_ok=True)
+        tmp_path = history_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+            f.write("\n".join(lines[-HISTORY_LIMIT:]) + "\n")
+        os.replace(tmp_path, history_path)
+    return data
@@ -0,0 +1,316 @@
+import array
+import collections
+import struct
+
+import cidr
+
+try:
+    # Python 3.14+ 自带 zstd
+    from compression import zstd as _zstd
+
+    def _compress(data: bytes) -> bytes:
+        return _zstd.compress(data, level=19)
+
+    def _decompress(data: bytes) -> bytes:
+        return _zstd.decompress(data)
+
+except ImportError:
+    import zstandard as _zstd
+
+    def _compress(data: bytes) -> bytes:
+        return _zstd.ZstdCompressor(level=19).compress(data)
+
+    def _decompress(data: bytes) -> bytes:
+        return _zstd.ZstdDecompressor().decompressobj().decompress(data)
+
+
+"""
+mihomo .mrs 规则集的读写
+
+文件为 zstd 压缩流，内容依次为：
+    魔数 b"MRS\\x01" | behavior(1 字节) | 规则数(int64) | 扩展数据长度(int64) + 扩展数据 | 规则数据
+均为大端序。domain 的规则数据是按反转域名构建的 LOUDS 简洁字典树（mihomo DomainSet），
+ipcidr 的规则数据是合并后的地址区间列表（IPv4 以 ::ffff:a.b.c.d 形式存储为 16 字节）。
+"""
+
+MAGIC = b"MRS\x01"
+BEHAVIORS = {"domain": 0, "ipcidr": 1}
+SET_VERSION = 1
+
+
+class MrsError(ValueError):
+    pass
+
+
+def _pack_bits(bits: bytearray) -> bytes:
+    """把逐位记录的 b"0" / b"1" 序列打包为 mihomo / sing-box 的 []uint64（大端）布局。"""
+    words = array.array(
+        "Q", int(bits[::-1] or b"0", 2).to_bytes((len(bits) + 63) // 64 * 8, "little")
+    )
+    words.byteswap()
+    return words.tobytes()
+
+
+def _unpack_bits(data: bytes) -> bytes:
+    """_pack_bits 的逆操作，返回长度为 64 * 字数的 b"0" / b"1" 序列。"""
+    words = array.array("Q", data)
+    words.byteswap()
+    value = int.from_bytes(words.tobytes(), "little")
+    return format(value, f"0{len(data) * 8}b").encode("ascii")[::-1] if data else b""
+
+
+def _domain_keys(domain: str) -> list[str] | None:
+    """返回 domain 在 mihomo 域名树中对应的键，无效时返回 None。
+
+    '+.example.com' 同时匹配自身与子域名，对应 'example.com' 与 '+.example.com' 两个键；
+    '.example.com' 只匹配子域名，对应 '+.example.com'。
+    """
+    if not domain or domain.endswith(".") or domain != domain.strip():
+        return None
+    domain = domain.lower()
+    parts = domain.split(".")
+    if parts[0] == "+":
+        if len(parts) < 2 or "" in parts[1:]:
+            return None
+        rest = ".".join(parts[1:])
+        return [rest, f"+.{rest}"]
+    if parts[0] == "":
+        if len(parts) < 2 or "" in parts[1:]:
+            return None
+        return [f"+{domain}"]
+    if "" in parts:
+        return None
+    return [domain]
+
+
+def build_succinct_set(keys: list[bytes]) -> tuple[bytes, bytes, bytes]:
+    """
+    按 mihomo / sing-box 共用的广度优先算法构建 LOUDS 简洁字典树，keys 必须已排序去重
+    返回 (leaves, labelBitmap, labels)，前两者为大端 uint64 数组
+    """
+    # 位图先按每位一个 b"0" / b"1" 记录，最后一次性打包，避免逐位运算
+    leaves = bytearray()
+    label_bits = bytearray()
+    labels = bytearray()
+
+    queue = collections.deque([(0, len(keys), 0)])
+    popleft, push = queue.popleft, queue.append
+    while queue:
+        start, end, col = popleft()
+        if col == len(keys[start]):
+            # 叶子节点
+            start += 1
+            leaves.append(49)
+        else:
+            leaves.append(48)
+
+        if end - start == 1:
+            # 只剩一个键时节点只有一个子节点，不必分组
+            push((start, end, col + 1))
+            labels.append(keys[start][col])
+            label_bits += b"01"
+            continue
+
+        j = start
+        while j < end:
+            first = j
+            label = keys[j][col]
+            j += 1
+            while j < end and keys[j][col] == label:
+                j += 1
+            push((first, j, col + 1))
+            labels.append(label)
+            label_bits.append(48)
+        label_bits.append(49)
+
+    # mihomo 的 leaves 只延伸到最后一个叶子所在的字
+    return _pack_bits(leaves.rstrip(b"0")), _pack_bits(label_bits), bytes(labels)
+
+
+def succinct_set_keys(leaves: bytes, label_bitmap: bytes, labels: bytes) -> list[bytes]:
+    """还原 build_succinct_set 的全部键（按广度优先顺序）。"""
+    leaves, label_bits = _unpack_bits(leaves), _unpack_bits(label_bitmap)
+    keys = []
+    queue = collections.deque([b""])
+    node = 0
+    label_index = 0
+    bit_index = 0
+    while queue:
+        prefix = queue.popleft()
+        if node < len(leaves) and leaves[node] == 49:
+            keys.append(prefix)
+        # 当前节点的子节点数即下一个 1 之前 0 的个数
+        node_end = label_bits.find(b"1", bit_index)
+        if node_end < 0 or label_index + node_end - bit_index > len(labels):
+            raise ValueError("corrupted succinct set")
+        for label in labels[label_index : label_index + node_end - bit_index]:
+            queue.append(prefix + bytes((label,)))
+        label_index += node_end - bit_index
+        bit_index = node_end + 1
+        node += 1
+    return keys
+
+
+def _encode_domain_set(keys: list[bytes]) -> bytes:
+    leaves, label_bitmap, labels = build_succinct_set(keys)
+    return b"".join(
+        [
+            bytes([SET_VERSION]),
+            struct.pack(">q", len(leaves) // 8),
+            leaves,
+            struct.pack(">q", len(label_bitmap) // 8),
+            label_bitmap,
+            struct.pack(">q", len(labels)),
+            labels,
+        ]
+    )
+
+
+def _encode_ip_set(ranges: list[tuple[int, int, int]]) -> bytes:
+    chunks = [bytes([SET_VERSION]), struct.pack(">q", len(ranges))]
+    for version, start, end in ranges:
+        if version == 4:
+            # IPv4 映射为 ::ffff:a.b.c.d
+            start |= 0xFFFF << 32
+            end |= 0xFFFF << 32
+        chunks.append(start.to_bytes(16, "big"))
+        chunks.append(end.to_bytes(16, "big"))
+    return b"".join(chunks)
+
+
+def encode(normalized_lines, behavior: str) -> bytes:
+    """
+    把 mihomo text 格式的规则编码为 .mrs 内容
+    behavior: "domain" 或 "ipcidr"；无效条目会被跳过，没有有效条目时抛出 MrsError
+    """
+    if behavior not in BEHAVIORS:
+        raise MrsError(f"unsupported behavior: {behavior}")
+
+    count = 0
+    if behavior == "domain":
+        keys: set[bytes] = set()
+        for line in normalized_lines:
+            domain_keys = _domain_keys(line.strip())
+            if domain_keys is None:
+                continue
+            count += 1
+            # 键按字符反转后以字节序排序，与 mihomo 一致
+            keys.update(key[::-1].encode("utf-8") for key in domain_keys)
+        payload = _encode_domain_set(sorted(keys)) if keys else b""
+    else:
+        ranges: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+        for line in normalized_lines:
+            try:
+                version, start, end = cidr.parse_network(line)
+            except ValueError:
+                continue
+            count += 1
+            ranges[version].append((start, end))
+        payload = _encode_ip_set(
+            [
+                (version, start, end)
+                for version in (4, 6)
+                for start, end in cidr.merge_ranges(ranges[version])
+            ]
+        )
+
+    if count == 0:
+        raise MrsError("empty rule")
+
+    extra = b""
+    data = b"".join(
+        [
+            MAGIC,
+            bytes([BEHAVIORS[behavior]]),
+            struct.pack(">qq", count, len(extra)),
+            extra,
+            payload,
+        ]
+    )
+    return _compress(data)
+
+
+def write(normalized_lines, behavior: str, output_path: str) -> int:
+    """编码并写入 .mrs 文件，返回写入的字节数。"""
+    data = encode(normalized_lines, behavior)
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+class _Reader:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.offset = 0
+
+    def read(self, size: int) -> bytes:
+        if self.offset + size > len(self.data):
+            raise MrsError("unexpected end of data")
+        chunk = self.data[self.offset : self.offset + size]
+        self.offset += size
+        return chunk
+
+    def int64(self) -> int:
+        value = struct.unpack(">q", self.read(8))[0]
+        if value < 0:
+            raise MrsError(f"invalid length: {value}")
+        return value
+
+
+def _decode_domain_set(reader: _Reader) -> list[str]:
+    if reader.read(1)[0] != SET_VERSION:
+        raise MrsError("unsupported domain set version")
+    leaves = reader.read(reader.int64() * 8)
+    label_bitmap = reader.read(reader.int64() * 8)
+    labels = reader.read(reader.int64())
+    try:
+        keys = succinct_set_keys(leaves, label_bitmap, labels)
+    except ValueError as e:
+        raise MrsError(str(e)) from None
+    return sorted(key.decode("utf-8")[::-1] for key in keys)
+
+
+def _decode_ip_set(reader: _Reader) -> list[str]:
+    if reader.read(1)[0] != SET_VERSION:
+        raise MrsError("unsupported ipcidr set version")
+    networks = []
+    for _ in range(reader.int64()):
+        start = int.from_bytes(reader.read(16), "big")
+        end = int.from_bytes(reader.read(16), "big")
+        version = 6
+        if start >> 32 == 0xFFFF and end >> 32 == 0xFFFF:
+            version, start, end = 4, start & 0xFFFFFFFF, end & 0xFFFFFFFF
+        networks.extend(
+            cidr.format_network(version, network, prefix_len)
+            for network, prefix_len in cidr.range_to_prefixes(
+                start, end, cidr.BITS[version]
+            )
+        )
+    return networks
+
+
+def decode(data: bytes) -> tuple[str, int, list[str]]:
+    """
+    解析 .mrs 内容，返回 (behavior, 规则数, 条目)
+    domain 返回域名树中的全部键（'+.' 开头表示匹配子域名），ipcidr 返回最少的 CIDR 列表
+    """
+    reader = _Reader(_decompress(data))
+    if reader.read(4) != MAGIC:
+        raise MrsError("invalid mrs magic")
+    behavior_byte = reader.read(1)[0]
+    behavior = next((k for k, v in BEHAVIORS.items() if v == behavior_byte), None)
+    if behavior is None:
+        raise MrsError(f"unsupported behavior: {behavior_byte}")
+    count = reader.int64()
+    reader.read(reader.int64())
+
+    if behavior == "domain":
+        entries = _decode_domain_set(reader) if count else []
+    else:
+        entries = _decode_ip_set(reader)
+    return behavior, count, entries
+
+
+def read(path: str) -> tuple[str, int, list[str]]:
+    with open(path, "rb") as f:
+        return decode(f.read())
@@ -0,0 +1,90 @@
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+
+import config
+import metrics
+import ruleset
+
+"""
+逐文件转换的进程池
+
+各格式的转换是纯 Python 的 CPU 密集工作，线程之间受 GIL 限制只能用到一个核心。
+这里把每个文件的转换交给整个构建共用的进程池，按文件大小从大到小提交，
+避免 Guard.conf 这类大文件排在一堆小文件之后拖长总耗时。
+规则文件在主进程中解析（ruleset.load 的缓存让每个文件只解析一次），
+任务参数是解析后的 Ruleset，子进程只负责转换与写出。
+单个文件不再拆分：转换是对规则的一次线性处理，拆开后主进程需要收集并拼接各块的结果
+再写出，这部分工作与省下的相当；最大的文件最先开始，其余文件由其他进程并行处理，
+总耗时已接近 max(最大文件, 总量 / 进程数)。
+转换函数与参数必须能被 pickle（模块级函数、Ruleset 与文件路径），结果与串行执行完全相同。
+config.PROCESS_WORKERS 不大于 1 时在当前线程中依次执行，不启动子进程。
+"""
+
+_executor: concurrent.futures.ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _context():
+    # 构建在多个线程中进行，fork 多线程进程可能死锁，使用 forkserver（不支持时使用 spawn）
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn"
+    )
+
+
+def get_executor() -> concurrent.futures.ProcessPoolExecutor | None:
+    """返回共用的进程池，第一次调用时创建；不使用子进程时返回 None。"""
+    global _executor
+    if config.PROCESS_WORKERS <= 1:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                config.PROCESS_WORKERS, mp_context=_context()
+            )
+        return _executor
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+
+def _job_size(job: tuple) -> int:
+    source = job[0]
+    # 已解析的规则集按其源文件大小排序
+    if isinstance(source, ruleset.Ruleset):
+        source = source.path
+    try:
+        return os.path.getsize(source)
+    except (OSError, TypeError):
+        return 0
+
+
+def run(func, jobs):
+    """
+    对每个 job（参数元组，第一个参数为输入文件路径或已解析的 Ruleset）调用 func(*job)，
+    按完成顺序逐个返回 (job, 结果)，子进程中记录的指标计入当前阶段
+    """
+    jobs = sorted(jobs, key=_job_size, reverse=True)
+    executor = get_executor()
+    if executor is None or len(jobs) <= 1:
+        for job in jobs:
+            yield job, func(*job)
+        return
+
+    futures = {executor.submit(metrics.capture, func, *job): job for job in jobs}
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            result, captured = future.result()
+            metrics.merge(captured)
+            yield futures[future], result
+    finally:
+        # 提前结束（例如出错）时不再运行尚未开始的任务
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,355 @@
+import argparse
+import bisect
+import collections
+import heapq
+import os
+import re
+import socket
+import sys
+import time
+from typing import NamedTuple
+
+import cidr
+import ruleset
+from domain_trie import SuffixTrie
+
+"""
+进程内的规则匹配
+
+加载 Source 格式的规则文件并建立索引，回答“某个域名或 IP 会命中哪个规则集的哪条规则”：
+  - DOMAIN：完整域名哈希表
+  - DOMAIN-SUFFIX：按反转标签组织的后缀树
+  - DOMAIN-KEYWORD：Aho-Corasick 自动机
+  - IP-CIDR / IP-CIDR6：互不重叠的有序区间，二分查找
+同一查询命中多个规则集时，返回加载顺序最靠前的规则集（与代理客户端按顺序匹配一致）。
+"""
+
+
+class Match(NamedTuple):
+    list_name: str
+    rule: str
+
+
+def _trie_pattern(words) -> str:
+    """把多个关键字合并为按公共前缀展开的正则，比简单的 a|b|c 匹配更快。"""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def walk(node: dict) -> str:
+        branches = [
+            re.escape(ch) + walk(child) for ch, child in sorted(node.items()) if ch
+        ]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # 当前位置已是某个关键字的结尾，后续部分可选
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return walk(trie)
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多模式匹配，返回命中的所有关键字中值最小的一个。"""
+
+    def __init__(self) -> None:
+        self.goto: list[dict[str, int]] = [{}]
+        self.best: list = [None]
+        self.fail: list[int] = [0]
+        self.keywords: set[str] = set()
+        # 由 re 在 C 层快速排除不含任何关键字的文本，绝大多数查询不需要进入自动机
+        self.prefilter: re.Pattern | None = None
+
+    def add(self, keyword: str, value) -> None:
+        self.keywords.add(keyword)
+        state = 0
+        for ch in keyword:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][ch] = next_state
+                self.goto.append({})
+                self.best.append(None)
+                self.fail.append(0)
+            state = next_state
+        if self.best[state] is None or value < self.best[state]:
+            self.best[state] = value
+
+    def build(self) -> None:
+        """计算失败指针并合并失败链上的输出，同时补全为完整的转移表，匹配时不再回溯。"""
+        goto, fail, best = self.goto, self.fail, self.best
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in goto[state].items():
+                queue.append(next_state)
+                # 按广度优先处理，失败状态的转移表此时已经补全
+                target = goto[fail[state]].get(ch, 0)
+                fail[next_state] = target
+                inherited = best[target]
+                if inherited is not None and (
+                    best[next_state] is None or inherited < best[next_state]
+                ):
+                    best[next_state] = inherited
+            for ch, next_state in goto[fail[state]].items():
+                goto[state].setdefault(ch, next_state)
+
+        if self.keywords:
+            self.prefilter = re.compile(_trie_pattern(self.keywords))
+
+    def search(self, text: str):
+        if self.prefilter is None or self.prefilter.search(text) is None:
+            return None
+        goto, best = self.goto, self.best
+        state = 0
+        found = None
+        for ch in text:
+            state = goto[state].get(ch, 0)
+            value = best[state]
+            if value is not None and (found is None or value < found):
+                found = value
+        return found
+
+
+class RangeIndex:
+    """整数区间索引：重叠区间取值最小者，拆分为互不重叠的有序区间后二分查找。"""
+
+    def __init__(self) -> None:
+        self.ranges: list[tuple[int, int, object]] = []
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        self.values: list = []
+
+    def add(self, start: int, end: int, value) -> None:
+        self.ranges.append((start, end, value))
+
+    def build(self) -> None:
+        ranges = sorted(self.ranges, key=lambda r: r[0])
+        bounds = sorted({r[0] for r in ranges} | {r[1] + 1 for r in ranges})
+
+        starts, ends, values = [], [], []
+        active: list = []  # (value, end)
+        i = 0
+        for lo, hi in zip(bounds, bounds[1:]):
+            while i < len(ranges) and ranges[i][0] <= lo:
+                heapq.heappush(active, (ranges[i][2], ranges[i][1]))
+                i += 1
+            # 已经结束的区间延迟出堆
+            while active and active[0][1] < lo:
+                heapq.heappop(active)
+            if not active:
+                continue
+            value = active[0][0]
+            if values and values[-1] == value and ends[-1] + 1 == lo:
+                ends[-1] = hi - 1
+            else:
+                starts.append(lo)
+                ends.append(hi - 1)
+                values.append(value)
+
+        self.starts, self.ends, self.values = starts, ends, values
+
+    def find(self, point: int):
+        i = bisect.bisect_right(self.starts, point) - 1
+        if i >= 0 and point <= self.ends[i]:
+            return self.values[i]
+        return None
+
+    def covering(self, start: int, end: int):
+        """[start, end] 被已有区间完全覆盖时返回起点处的值，否则返回 None。"""
+        i = bisect.bisect_right(self.starts, start) - 1
+        if i < 0 or start > self.ends[i]:
+            return None
+        value = self.values[i]
+        while self.ends[i] < end:
+            i += 1
+            if i == len(self.starts) or self.starts[i] != self.ends[i - 1] + 1:
+                return None
+        return value
+
+
+def parse_ip(text: str) -> tuple[int, int] | None:
+    """解析 IP 地址，返回 (版本, 整数值)，不是 IP 时返回 None。"""
+    try:
+        if ":" in text:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, text), "big")
+        if text[-1:].isdigit():
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), "big")
+    except OSError:
+        pass
+    return None
+
+
+class Matcher:
+    def __init__(self) -> None:
+        self.matches: list[Match] = []
+        self.exact: dict[str, int] = {}
+        self.suffix = SuffixTrie()
+        self.keyword_rules: list[tuple[str, int]] = []
+        self.keywords = KeywordAutomaton()
+        self.networks = {4: RangeIndex(), 6: RangeIndex()}
+        # 无法在这里匹配的规则类型（如 PROCESS-NAME）及其数量
+        self.unsupported: dict[str, int] = {}
+
+    def add_ruleset(self, rs: ruleset.Ruleset) -> None:
+        """按加载顺序确定优先级，先加载的规则集优先。"""
+        for rule in rs.rules:
+            if not rule.value:
+                continue
+            value = len(self.matches)
+            rule_type = rule.type
+            if rule_type == "DOMAIN":
+                self.exact.setdefault(rule.value.lower(), value)
+            elif rule_type == "DOMAIN-SUFFIX":
+                self.suffix.insert(rule.value.lower(), value)
+            elif rule_type == "DOMAIN-KEYWORD":
+                self.keyword_rules.append((rule.value.lower(), value))
+            elif rule_type in ("IP-CIDR", "IP-CIDR6"):
+                try:
+                    version, start, end = cidr.parse_network(rule.value)
+                except ValueError:
+                    print(f"[Matcher] Invalid rule in {rs.name}: {rule.line}")
+                    continue
+                self.networks[version].add(start, end, value)
+            else:
+                self.unsupported[rule_type] = self.unsupported.get(rule_type, 0) + 1
+                continue
+            self.matches.append(Match(rs.name, rule.line))
+
+    def build(self) -> "Matcher":
+        """建立关键字自动机与区间索引，继续添加规则集后可以再次调用。"""
+        self.keywords = KeywordAutomaton()
+        for keyword, value in self.keyword_rules:
+            self.keywords.add(keyword, value)
+        self.keywords.build()
+        for index in self.networks.values():
+            index.build()
+        return self
+
+    def match_domain(self, domain: str, *, include_exact: bool = True) -> Match | None:
+        """include_exact 为 False 时忽略 DOMAIN 规则，用于判断整个后缀是否被覆盖。"""
+        domain = domain.rstrip(".").lower()
+        found = self.exact.get(domain) if include_exact else None
+        # 沿后缀树逐级向下，取所有覆盖该域名的后缀中优先级最高的一条
+        # （节点中 None 键保存后缀规则的值，见 domain_trie._END）
+        node = self.suffix.root
+        for label in reversed(domain.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            value = node.get(None)
+            if value is not None and (found is None or value < found):
+                found = value
+        keyword = self.keywords.search(domain)
+        if keyword is not None and (found is None or keyword < found):
+            found = keyword
+        return None if found is None else self.matches[found]
+
+    def match_keyword(self, keyword: str) -> Match | None:
+        """返回包含于 keyword 中的关键字规则，即能覆盖 DOMAIN-KEYWORD,keyword 的规则。"""
+        found = self.keywords.search(keyword.lower())
+        return None if found is None else self.matches[found]
+
+    def match_ip(self, version: int, address: int) -> Match | None:
+        found = self.networks[version].find(address)
+        return None if found is None else self.matches[found]
+
+    def match_network(self, version: int, start: int, end: int) -> Match | None:
+        """整个网段都被已有规则覆盖时，返回网段起点命中的规则。"""
+        found = self.networks[version].covering(start, end)
+        return None if found is None else self.matches[found]
+
+    def match(self, query: str) -> Match | None:
+        ip = parse_ip(query)
+        if ip is not None:
+            return self.match_ip(*ip)
+        return self.match_domain(query)
+
+
+def load(paths) -> Matcher:
+    """加载规则文件或目录（目录内的 .conf 按文件名排序），顺序即优先级。"""
+    matcher = Matcher()
+    for path in paths:
+        if os.path.isdir(path):
+            for rs in ruleset.load_dir(path):
+                matcher.add_ruleset(rs)
+        else:
+            matcher.add_ruleset(ruleset.load(path))
+    return matcher.build()
+
+
+def main(argv=None) -> int:
+    import config
+
+    parser = argparse.ArgumentParser(
+        description="Print which list and rule each hostname or IP matches"
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        default="-",
+        help="file with one hostname or IP per line (default: stdin)",
+    )
+    parser.add_argument(
+        "-l",
+        "--list",
+        action="append",
+        dest="lists",
+        help="rule file or directory to load, in priority order (default: List)",
+    )
+    parser.add_argument(
+        "-m",
+        "--matched-only",
+        action="store_true",
+        help="only print queries that match a rule",
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    matcher = load(args.lists or [config.RULESET_DIR])
+    print(
+        f"[Matcher] Loaded {len(matcher.matches)} rules in {time.perf_counter() - started:.2f}s",
+        file=sys.stderr,
+    )
+    for rule_type, count in sorted(matcher.unsupported.items()):
+        print(f"[Matcher] Ignored {count} {rule_type} rules", file=sys.stderr)
+
+    source = (
+        sys.stdin
+        if args.input == "-"
+        else open(args.input, "r", encoding="utf-8", errors="replace")
+    )
+    out = sys.stdout
+    total = matched = 0
+    started = time.perf_counter()
+    with source:
+        buffer = []
+        for line in source:
+            query = line.strip()
+            if not query or query.startswith("#"):
+                continue
+            total += 1
+            result = matcher.match(query)
+            if result is not None:
+                matched += 1
+                buffer.append(f"{query}\t{result.list_name}\t{result.rule}\n")
+            elif not args.matched_only:
+                buffer.append(f"{query}\t-\t-\n")
+            if len(buffer) >= 4096:
+                out.write("".join(buffer))
+                buffer.clear()
+        out.write("".join(buffer))
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"[Matcher] {total} queries, {matched} matched in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f}/s)",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
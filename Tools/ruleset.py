@@ -0,0 +1,168 @@
+import os
+import threading
+from dataclasses import dataclass, fields
+from functools import cached_property
+from typing import NamedTuple
+
+import metrics
+import until
+
+"""
+规则集的统一解析模型
+
+每个 Source 规则文件只解析一次，各格式的生成器（Clash / sing-box / Surge / mihomo / smartdns / Web）
+都从这里取数据，而不是各自重新读取、清洗、判断格式。
+"""
+
+KIND_DOMAINSET = "domainset"
+KIND_IPCIDR = "ipcidr"
+KIND_CLASSICAL = "classical"
+
+
+class Rule(NamedTuple):
+    type: str
+    value: str
+    options: tuple[str, ...]
+    line: str
+
+
+def _looks_like_cidr(s: str) -> bool:
+    return "/" in s and any(c.isdigit() for c in s)
+
+
+def detect_kind(lines: list[str]) -> str:
+    """返回 domainset / ipcidr / classical。"""
+    if not lines or any("," in line for line in lines):
+        return KIND_CLASSICAL
+    if all(_looks_like_cidr(line) for line in lines):
+        return KIND_IPCIDR
+    return KIND_DOMAINSET
+
+
+def parse_line(line: str, kind: str) -> Rule:
+    if kind == KIND_DOMAINSET:
+        # domainset: '.example.com' 为后缀匹配，其余为完整域名
+        if line.startswith("."):
+            return Rule("DOMAIN-SUFFIX", line[1:], (), line)
+        return Rule("DOMAIN", line, (), line)
+
+    if kind == KIND_IPCIDR:
+        return Rule("IP-CIDR6" if ":" in line else "IP-CIDR", line, (), line)
+
+    parts = line.split(",")
+    if len(parts) < 2:
+        return Rule(parts[0].strip(), "", (), line)
+    return Rule(
+        parts[0].strip(),
+        parts[1].strip(),
+        tuple(part.strip() for part in parts[2:]),
+        line,
+    )
+
+
+@dataclass
+class Ruleset:
+    name: str
+    path: str
+    header: str | None
+    lines: list[str]
+    kind: str
+
+    @property
+    def is_domainset(self) -> bool:
+        return self.kind == KIND_DOMAINSET
+
+    def __getstate__(self) -> dict:
+        # 发送到进程池时只带上字段，rules 等缓存的派生结果在需要时重新计算
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+    @cached_property
+    def rules(self) -> list[Rule]:
+        kind = self.kind
+        return [parse_line(line, kind) for line in self.lines]
+
+    @cached_property
+    def sorted_lines(self) -> list[str]:
+        return sorted(self.lines)
+
+    @cached_property
+    def rule_types(self) -> frozenset[str]:
+        return frozenset(rule.type for rule in self.rules)
+
+
+def parse(path: str) -> Ruleset:
+    # 在字节上查找注释与空行，只解码保留的规则
+    with until.map_file(path) as data:
+        header_end = until.leading_comment_end(data)
+        header = (
+            data[:header_end].decode("utf-8", errors="ignore").replace("\r\n", "\n")
+        )
+        lines = until.decode_clean_lines(data, header_end)
+
+    name = os.path.basename(path).rsplit(".", 1)[0]
+    return Ruleset(
+        name=name,
+        path=path,
+        header=header or None,
+        lines=lines,
+        kind=detect_kind(lines),
+    )
+
+
+def count_rules(lines) -> int:
+    """按与 parse 相同的规则（去掉空行与注释）统计写出的内容中的规则条数。"""
+    return sum(
+        1 for line in lines if (stripped := line.strip()) and not stripped.startswith("#")
+    )
+
+
+_cache: dict[str, tuple[tuple[int, int], Ruleset]] = {}
+_cache_lock = threading.Lock()
+_path_locks: dict[str, threading.Lock] = {}
+
+
+def load(path: str, *, cache: bool = True) -> Ruleset:
+    """解析规则文件，同一文件（按 mtime 与大小判断未变化）在整个构建中只解析一次。"""
+    rs = _load(os.path.abspath(path), cache)
+    # 读入的规则数计入当前构建阶段，命中缓存时同样计入
+    metrics.add(rules_in=len(rs.lines))
+    return rs
+
+
+def _load(path: str, cache: bool) -> Ruleset:
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        path_lock = _path_locks.setdefault(path, threading.Lock())
+
+    # 多个生成器线程同时请求同一文件时，只让一个线程解析
+    with path_lock:
+        with _cache_lock:
+            cached = _cache.get(path)
+            if cached and cached[0] == stamp:
+                return cached[1]
+
+        ruleset = parse(path)
+
+        if cache:
+            with _cache_lock:
+                _cache[path] = (stamp, ruleset)
+        return ruleset
+
+
+def load_dir(dir_path: str, extension: str = ".conf") -> list[Ruleset]:
+    return [
+        load(os.path.join(dir_path, filename))
+        for filename in sorted(os.listdir(dir_path))
+        if filename.endswith(extension)
+    ]
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+        _path_locks.clear()
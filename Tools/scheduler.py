@@ -0,0 +1,130 @@
+import concurrent.futures
+import os
+import traceback
+from typing import NamedTuple
+
+import metrics
+
+"""
+按依赖关系调度构建阶段
+
+每个阶段声明自己读取的输入文件与生成的输出文件，某个阶段的输入由另一个阶段输出时，
+它就依赖于那个阶段；不由任何阶段产出的输入（如 List 中复制来的静态规则）视为已经就绪。
+一个阶段的所有依赖完成后立即开始运行，不必等待无关的阶段，同时运行的阶段数有上限。
+阶段失败时，依赖它的阶段（直接或间接）都会被跳过，其余阶段照常运行。
+"""
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+
+class Stage(NamedTuple):
+    name: str
+    func: object
+    inputs: tuple[str, ...]
+    outputs: tuple[str, ...]
+
+
+class Scheduler:
+    def __init__(self, workers: int | None = None) -> None:
+        self.workers = workers
+        self.stages: dict[str, Stage] = {}
+
+    def add(self, name: str, func, inputs=(), outputs=()) -> None:
+        if name in self.stages:
+            raise ValueError(f"duplicate stage: {name}")
+        self.stages[name] = Stage(
+            name,
+            func,
+            tuple(os.path.normpath(path) for path in inputs),
+            tuple(os.path.normpath(path) for path in outputs),
+        )
+
+    def outputs(self) -> list[str]:
+        """已添加的所有阶段的输出，用于声明依赖全部产物的阶段（如生成索引页）。"""
+        return [path for stage in self.stages.values() for path in stage.outputs]
+
+    def dependencies(self) -> dict[str, set[str]]:
+        """返回每个阶段所依赖的阶段，同一文件由多个阶段产出或存在循环依赖时抛出 ValueError。"""
+        producers: dict[str, str] = {}
+        for stage in self.stages.values():
+            for path in stage.outputs:
+                if producers.setdefault(path, stage.name) != stage.name:
+                    raise ValueError(
+                        f"{path} is produced by both {producers[path]} and {stage.name}"
+                    )
+
+        dependencies = {
+            stage.name: {
+                producers[path]
+                for path in stage.inputs
+                if path in producers and producers[path] != stage.name
+            }
+            for stage in self.stages.values()
+        }
+
+        # 拓扑排序检查循环依赖
+        remaining = {name: set(deps) for name, deps in dependencies.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(
+                    f"dependency cycle between stages: {', '.join(sorted(remaining))}"
+                )
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return dependencies
+
+    def run(self) -> dict[str, str]:
+        """运行所有阶段，返回每个阶段的状态（ok / failed / skipped）。"""
+        dependencies = self.dependencies()
+        dependents: dict[str, set[str]] = {name: set() for name in self.stages}
+        for name, deps in dependencies.items():
+            for dep in deps:
+                dependents[dep].add(name)
+
+        waiting = {name: set(deps) for name, deps in dependencies.items()}
+        status: dict[str, str] = {}
+
+        def skip(name: str, reason: str) -> None:
+            for child in sorted(dependents[name]):
+                if child in waiting:
+                    del waiting[child]
+                    status[child] = STATUS_SKIPPED
+                    print(f"[Scheduler] Skip {child}: {reason} failed")
+                    skip(child, reason)
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            running: dict[concurrent.futures.Future, str] = {}
+
+            def submit_ready() -> None:
+                # 按添加顺序提交，先添加的阶段先开始
+                for name in [name for name, deps in waiting.items() if not deps]:
+                    del waiting[name]
+                    stage = self.stages[name]
+                    running[executor.submit(metrics.track(stage.func, name))] = name
+
+            submit_ready()
+            while running:
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        status[name] = STATUS_OK
+                    else:
+                        status[name] = STATUS_FAILED
+                        print(f"[Scheduler] {name} failed: {error}")
+                        traceback.print_exception(error)
+                        skip(name, name)
+                    for child in dependents[name]:
+                        if child in waiting:
+                            waiting[child].discard(name)
+                submit_ready()
+
+        return {name: status[name] for name in self.stages}
@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import NamedTuple
+from urllib.parse import urlparse
+
+import cidr
+import ruleset
+from rule_matcher import Match, Matcher
+
+"""
+规则遮蔽与策略冲突分析
+
+按 Config 中 RULE-SET / rule-providers 的引用顺序依次加载规则集：检查每条规则之前，
+索引中只包含排在它前面的规则集。若某条规则能匹配的所有请求都已被前面的规则命中，
+这条规则永远不会生效（被遮蔽），删除它不影响结果；若遮蔽它的规则属于另一个策略，
+则记为冲突（原本想走的策略实际不会生效）。
+"""
+
+INLINE_TYPES = ("DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", "IP-CIDR", "IP-CIDR6")
+INLINE_NAME = "(inline)"
+
+
+class PolicyList(NamedTuple):
+    name: str
+    policy: str
+    # 内联规则（直接写在配置中的规则）
+    lines: tuple[str, ...] = ()
+
+
+class Finding(NamedTuple):
+    list_name: str
+    policy: str
+    rule: str
+    by: Match
+    by_policy: str
+
+    @property
+    def conflict(self) -> bool:
+        return self.policy != self.by_policy
+
+
+def _list_name(url: str) -> str:
+    return os.path.basename(urlparse(url).path).rsplit(".", 1)[0]
+
+
+def read_surge_order(path: str) -> list[PolicyList]:
+    """读取 Surge 配置 [Rule] 段中规则集与内联规则的顺序。"""
+    order = []
+    section = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                section = line
+                continue
+            if section != "[Rule]" or not line or line.startswith(("#", "//")):
+                continue
+            parts = [part.strip() for part in line.split(",")]
+            if len(parts) < 3:
+                continue
+            if parts[0] in ("RULE-SET", "DOMAIN-SET"):
+                # RULE-SET,SYSTEM / RULE-SET,LAN 等内置规则集无法分析
+                if "://" in parts[1]:
+                    order.append(PolicyList(_list_name(parts[1]), parts[2]))
+            elif parts[0] in INLINE_TYPES:
+                order.append(
+                    PolicyList(INLINE_NAME, parts[2], (f"{parts[0]},{parts[1]}",))
+                )
+    return order
+
+
+_YAML_KEY = re.compile(r"^([^\s#][^:]*):")
+_YAML_PROVIDER = re.compile(r"^\s+([^\s:#]+):\s*\{.*?\burl:\s*([^\s,}]+)")
+_YAML_RULE = re.compile(r"^\s*-\s*(.+?)\s*$")
+
+
+def read_mihomo_order(path: str) -> list[PolicyList]:
+    """读取 mihomo 配置 rules 中规则集（通过 rule-providers 对应到文件）与内联规则的顺序。"""
+    providers: dict[str, str] = {}
+    rules: list[str] = []
+    section = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.lstrip().startswith("#"):
+                continue
+            if key := _YAML_KEY.match(line):
+                section = key.group(1)
+                continue
+            if section == "rule-providers" and (m := _YAML_PROVIDER.match(line)):
+                providers[m.group(1)] = _list_name(m.group(2).strip("'\""))
+            elif section == "rules" and (m := _YAML_RULE.match(line)):
+                rules.append(m.group(1).strip("'\""))
+
+    order = []
+    for rule in rules:
+        parts = [part.strip() for part in rule.split(",")]
+        if len(parts) < 3:
+            continue
+        if parts[0] == "RULE-SET":
+            if parts[1] in providers:
+                order.append(PolicyList(providers[parts[1]], parts[2]))
+            else:
+                print(f"[Shadow] Unknown rule provider in {path}: {parts[1]}")
+        elif parts[0] in INLINE_TYPES:
+            order.append(PolicyList(INLINE_NAME, parts[2], (f"{parts[0]},{parts[1]}",)))
+    return order
+
+
+def read_order(path: str) -> list[PolicyList]:
+    if path.endswith((".yaml", ".yml")):
+        return read_mihomo_order(path)
+    return read_surge_order(path)
+
+
+def _load_list(item: PolicyList, list_dirs) -> ruleset.Ruleset | None:
+    if item.lines:
+        lines = list(item.lines)
+        return ruleset.Ruleset(item.name, "", None, lines, ruleset.detect_kind(lines))
+    for list_dir in list_dirs:
+        path = os.path.join(list_dir, f"{item.name}.conf")
+        if os.path.exists(path):
+            return ruleset.load(path)
+    return None
+
+
+def _covering(matcher: Matcher, rule: ruleset.Rule) -> Match | None:
+    """返回排在前面、能完全覆盖 rule 的规则。"""
+    if rule.type == "DOMAIN":
+        return matcher.match_domain(rule.value)
+    if rule.type == "DOMAIN-SUFFIX":
+        # 后缀规则还匹配所有子域名，同名的 DOMAIN 规则不能覆盖它
+        return matcher.match_domain(rule.value, include_exact=False)
+    if rule.type == "DOMAIN-KEYWORD":
+        return matcher.match_keyword(rule.value)
+    if rule.type in ("IP-CIDR", "IP-CIDR6"):
+        try:
+            version, start, end = cidr.parse_network(rule.value)
+        except ValueError:
+            return None
+        return matcher.match_network(version, start, end)
+    return None
+
+
+def analyze(order: list[PolicyList], list_dirs) -> tuple[list[Finding], dict]:
+    """返回 (被遮蔽的规则, 按规则集汇总的统计)。"""
+    matcher = Matcher()
+    policies: dict[Match, str] = {}
+    findings: list[Finding] = []
+    summary: dict[str, dict] = {}
+
+    for item in order:
+        rs = _load_list(item, list_dirs)
+        if rs is None:
+            print(f"[Shadow] Skip missing list: {item.name}")
+            continue
+
+        stats = summary.setdefault(
+            item.name,
+            {
+                "policy": item.policy,
+                "rules": 0,
+                "shadowed": 0,
+                "conflicts": 0,
+                "bytes": 0,
+            },
+        )
+        stats["rules"] += len(rs.rules)
+
+        # 只在已加载的（排在前面的）规则集中查找
+        if matcher.matches:
+            for rule in rs.rules:
+                if not rule.value:
+                    continue
+                by = _covering(matcher, rule)
+                if by is None:
+                    continue
+                finding = Finding(item.name, item.policy, rule.line, by, policies[by])
+                findings.append(finding)
+                stats["shadowed"] += 1
+                stats["bytes"] += len(rule.line.encode("utf-8")) + 1
+                if finding.conflict:
+                    stats["conflicts"] += 1
+
+        before = len(matcher.matches)
+        matcher.add_ruleset(rs)
+        for match in matcher.matches[before:]:
+            policies.setdefault(match, item.policy)
+        matcher.build()
+
+    return findings, summary
+
+
+def main(argv=None) -> int:
+    import config
+
+    parser = argparse.ArgumentParser(
+        description="Report rules that never fire because an earlier list already covers them"
+    )
+    parser.add_argument(
+        "configs",
+        nargs="*",
+        help="Surge .conf or mihomo .yaml files (default: Config/surge.conf and Config/mihomo.yaml)",
+    )
+    parser.add_argument(
+        "-l",
+        "--list-dir",
+        action="append",
+        dest="list_dirs",
+        help="directory to look up <name>.conf in (default: Public/List/Source, then List)",
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        default=20,
+        help="shadowed rules to print per list, 0 for all (default: 20)",
+    )
+    parser.add_argument("--json", help="write the full report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    configs = args.configs or [
+        os.path.join(config.PROCESS_DIR, "Config", "surge.conf"),
+        os.path.join(config.PROCESS_DIR, "Config", "mihomo.yaml"),
+    ]
+    list_dirs = args.list_dirs or [config.OUT_SOURCE_RULESET_DIR, config.RULESET_DIR]
+
+    report = {}
+    for config_path in configs:
+        started = time.perf_counter()
+        order = read_order(config_path)
+        findings, summary = analyze(order, list_dirs)
+        elapsed = time.perf_counter() - started
+
+        total = sum(stats["rules"] for stats in summary.values())
+        print(
+            f"[Shadow] {os.path.relpath(config_path)}: {len(findings)} of {total} rules shadowed, "
+            f"{sum(f.conflict for f in findings)} conflicts, "
+            f"{sum(stats['bytes'] for stats in summary.values())} bytes prunable ({elapsed:.2f}s)"
+        )
+        for name, stats in summary.items():
+            if not stats["shadowed"]:
+                continue
+            print(
+                f"  {name} ({stats['policy']}): {stats['shadowed']}/{stats['rules']} shadowed, "
+                f"{stats['conflicts']} conflicts, {stats['bytes']} bytes"
+            )
+            shown = [f for f in findings if f.list_name == name]
+            if args.limit:
+                shown = shown[: args.limit]
+            for f in shown:
+                mark = "conflict" if f.conflict else "redundant"
+                print(
+                    f"    {mark}: {f.rule} <- {f.by.list_name}: {f.by.rule} ({f.by_policy})"
+                )
+
+        report[config_path] = {
+            "lists": summary,
+            "findings": [
+                {
+                    "list": f.list_name,
+                    "policy": f.policy,
+                    "rule": f.rule,
+                    "by_list": f.by.list_name,
+                    "by_rule": f.by.rule,
+                    "by_policy": f.by_policy,
+                    "conflict": f.conflict,
+                }
+                for f in findings
+            ],
+        }
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+import itertools
+import operator
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+"""
+上游域名列表的流式解析
+
+支持 domainset、Adblock Plus / AdGuard（||example.com^、@@ 例外规则）、hosts（0.0.0.0 example.com）
+与 dnsmasq（address=/example.com/、server=/example.com/）语法。来源的格式只根据开头的几 KB
+探测，之后按批解析：只用切片 / partition / split 等字符串方法切分，不使用正则；一批中常见写法的
+域名拼接后用一次 translate 检查字符，只有检查不通过的批次才逐行解析。
+
+解析结果为 domainset 条目（'.example.com' 匹配其所有子域名，'example.com' 只匹配自身）；
+例外规则不直接输出，而是把被放行的域名加入 exceptions，由调用方在合并所有来源后按后缀移除。
+新的格式通过 register 注册即可参与探测。
+"""
+
+# 探测格式时读取的字节数
+DETECT_BYTES = 8192
+# 没有任何行符合其他格式时使用的格式
+DEFAULT_FORMAT = "domainset"
+
+
+class SourceFormat(NamedTuple):
+    name: str
+    # 判断一行（已去掉首尾空白，不是空行或注释）是否属于该格式
+    sniff: Callable[[str], bool]
+    # (行的批次, exceptions) -> domainset 条目
+    parse: Callable[[Iterable[list[str]], set[str]], Iterator[str]]
+
+
+FORMATS: dict[str, SourceFormat] = {}
+
+
+def register(name: str, sniff: Callable[[str], bool]):
+    def decorator(parse):
+        FORMATS[name] = SourceFormat(name, sniff, parse)
+        return parse
+
+    return decorator
+
+
+def detect(head: str) -> str:
+    """返回开头内容中符合行数最多的格式。"""
+    lines = head.splitlines()
+    # 最后一行可能被截断
+    if len(head) >= DETECT_BYTES and len(lines) > 1:
+        lines.pop()
+
+    counts = dict.fromkeys(FORMATS, 0)
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(("#", "!", "[")):
+            continue
+        for fmt in FORMATS.values():
+            if fmt.name != DEFAULT_FORMAT and fmt.sniff(line):
+                counts[fmt.name] += 1
+
+    best = max(counts, key=counts.get)
+    return best if counts[best] else DEFAULT_FORMAT
+
+
+def parse(
+    fmt: str, batches: Iterable[list[str]], exceptions: set[str]
+) -> Iterator[str]:
+    """batches 为行的批次（如 download.iter_line_batches 的结果）。"""
+    return FORMATS[fmt].parse(batches, exceptions)
+
+
+_HOST_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789-._"
+# 删除域名中允许出现的字符，结果为空说明是合法的域名
+_DELETE_HOST_CHARS = str.maketrans(dict.fromkeys(_HOST_CHARS))
+# 同上，另外允许批次中用于拼接的换行符
+_DELETE_HOST_LINES_CHARS = str.maketrans(dict.fromkeys(_HOST_CHARS + "\n"))
+
+
+def is_hostname(text: str) -> bool:
+    """只含小写字母、数字、'-'、'_' 与 '.'，至少有两级且没有空的标签。"""
+    return (
+        "." in text
+        and not text.startswith(".")
+        and not text.endswith(".")
+        and ".." not in text
+        and not text.translate(_DELETE_HOST_CHARS)
+    )
+
+
+def _split_hostnames(text: str) -> list[str] | None:
+    """text 为换行分隔的名称，全部是合法域名时返回转为小写的域名列表，否则返回 None。"""
+    text = text.lower()
+    if (
+        text.translate(_DELETE_HOST_LINES_CHARS)
+        or text.startswith(".")
+        or text.endswith(".")
+        or "\n." in text
+        or ".\n" in text
+        or ".." in text
+    ):
+        return None
+    names = text.split("\n")
+    # 没有 '.' 的名称（如 localhost、空行）不合法
+    if not all(map(operator.contains, names, itertools.repeat("."))):
+        return None
+    return names
+
+
+def clean_hostnames(names: list[str]) -> list[str] | None:
+    """整批检查，全部是合法域名时返回转为小写的域名，否则返回 None。"""
+    return _split_hostnames("\n".join(names)) if names else []
+
+
+def strip_hostnames(lines: list[str], prefix: str, suffix: str) -> list[str] | None:
+    """
+    每一行都是 prefix + 域名 + suffix 时返回转为小写的域名，否则返回 None
+    只在拼接后的整批文本上计数与替换，不逐行处理
+    """
+    if not lines:
+        return []
+    text = "\n" + "\n".join(lines) + "\n"
+    count = len(lines)
+    if text.count("\n" + prefix) != count:
+        return None
+    text = text.replace("\n" + prefix, "\n")
+    if suffix:
+        if text.count(suffix + "\n") != count:
+            return None
+        text = text.replace(suffix + "\n", "\n")
+    # 行中其他位置残留的前后缀字符会在检查字符时被拒绝
+    return _split_hostnames(text[1:-1])
+
+
+def _parse_domainset_lines(lines):
+    # 替换不可见字符表
+    trans_table = str.maketrans({"\u200b": None, "\u200c": None})
+
+    for line in lines:
+        if not line.isascii():
+            line = line.translate(trans_table)
+        line = line.split("#", 1)[0].strip()
+        if line:
+            yield line.lower()
+
+
+# 需要 strip 或去除注释的字符
+_DOMAINSET_SPECIAL = ("#", " ", "\t", "\x0b", "\x0c", "\x1c", "\x1d", "\x1e", "\x1f")
+
+
+@register(DEFAULT_FORMAT, lambda line: True)
+def parse_domainset(batches, exceptions):
+    for batch in batches:
+        text = "\n".join(batch)
+        # 没有注释、多余空白与非 ASCII 字符时每行就是一个条目
+        if text.isascii() and not any(c in text for c in _DOMAINSET_SPECIAL):
+            # 与其他格式一致，域名统一为小写
+            if not text.islower():
+                batch = text.lower().split("\n")
+            yield from filter(None, batch)
+        else:
+            yield from _parse_domainset_lines(batch)
+
+
+# 不改变“整个域名被拦截”含义的 Adblock 选项
+ADBLOCK_DOMAIN_OPTIONS = frozenset(("important", "all", "document", "doc"))
+
+
+def adblock_domain(rule: str) -> str | None:
+    """从 '||example.com^' 或 '||example.com^$important' 中取出域名，其余规则返回 None。"""
+    domain, sep, rest = rule[2:].partition("^")
+    if not sep:
+        return None
+    if rest and rest != "|":
+        if not rest.startswith("$"):
+            return None
+        options = rest[1:].split(",")
+        if not ADBLOCK_DOMAIN_OPTIONS.issuperset(options):
+            return None
+    domain = domain.lower()
+    return domain if is_hostname(domain) else None
+
+
+def _parse_adblock_lines(lines, exceptions):
+    for line in lines:
+        line = line.strip()
+        if line.startswith("||"):
+            if domain := adblock_domain(line):
+                yield "." + domain
+        elif line.startswith("@@||"):
+            if domain := adblock_domain(line[2:]):
+                exceptions.add(domain)
+
+
+@register("adblock", lambda line: line.startswith(("||", "@@||")))
+def parse_adblock(batches, exceptions):
+    for batch in batches:
+        domains = strip_hostnames(batch, "||", "^")
+        if domains is not None:
+            yield from ["." + domain for domain in domains]
+            continue
+        # 常见写法 ||example.com^ 整批处理，其余行（注释、例外、带选项的规则等）逐行解析
+        rules = [line[2:-1] for line in batch if line[:2] == "||" and line[-1:] == "^"]
+        domains = clean_hostnames(rules)
+        if domains is None:
+            yield from _parse_adblock_lines(batch, exceptions)
+            continue
+        yield from ["." + domain for domain in domains]
+        if len(rules) < len(batch):
+            yield from _parse_adblock_lines(
+                [line for line in batch if not (line[:2] == "||" and line[-1:] == "^")],
+                exceptions,
+            )
+
+
+# hosts 文件中表示拦截的地址
+HOSTS_SINK_ADDRESSES = frozenset(("0.0.0.0", "127.0.0.1", "::", "::1"))
+HOSTS_IGNORED_NAMES = frozenset(("localhost.localdomain", "local", "0.0.0.0"))
+
+
+def _sniff_hosts(line: str) -> bool:
+    parts = line.split(None, 2)
+    return len(parts) > 1 and parts[0] in HOSTS_SINK_ADDRESSES
+
+
+def _parse_hosts_lines(lines):
+    for line in lines:
+        parts = line.split("#", 1)[0].split()
+        if len(parts) < 2 or parts[0] not in HOSTS_SINK_ADDRESSES:
+            continue
+        for name in parts[1:]:
+            name = name.lower()
+            if name not in HOSTS_IGNORED_NAMES and is_hostname(name):
+                yield name
+
+
+@register("hosts", _sniff_hosts)
+def parse_hosts(batches, exceptions):
+    for batch in batches:
+        address = batch[0].partition(" ")[0] if batch else ""
+        if address in HOSTS_SINK_ADDRESSES:
+            names = strip_hostnames(batch, address + " ", "")
+            if names is not None:
+                if not HOSTS_IGNORED_NAMES.isdisjoint(names):
+                    names = [name for name in names if name not in HOSTS_IGNORED_NAMES]
+                yield from names
+                continue
+        # 常见写法 '0.0.0.0 example.com' 整批处理，其余行逐行解析
+        fields = [line.partition(" ") for line in batch]
+        names = clean_hostnames(
+            [name for address, _, name in fields if address in HOSTS_SINK_ADDRESSES]
+        )
+        if names is None:
+            yield from _parse_hosts_lines(batch)
+            continue
+        if not HOSTS_IGNORED_NAMES.isdisjoint(names):
+            names = [name for name in names if name not in HOSTS_IGNORED_NAMES]
+        yield from names
+        if len(names) < len(batch):
+            yield from _parse_hosts_lines(
+                [
+                    line
+                    for line, (address, _, _) in zip(batch, fields)
+                    if address not in HOSTS_SINK_ADDRESSES
+                ]
+            )
+
+
+DNSMASQ_DIRECTIVES = ("address=/", "server=/", "local=/")
+
+
+def dnsmasq_domains(line: str) -> list[str]:
+    """从 'address=/a.com/b.com/0.0.0.0' 等指令中取出所有域名，不是这类指令时返回空列表。"""
+    if not line.startswith(DNSMASQ_DIRECTIVES):
+        return []
+    # ['address', 'a.com', 'b.com', '0.0.0.0']，最后一段是目标地址（可以为空）
+    parts = line.split("/")
+    return [domain for domain in parts[1:-1] if domain and domain != "#"]
+
+
+# 表示拦截的目标地址，server= 只有目标为空（只在本地解析）时才表示拦截
+DNSMASQ_SINK_TARGETS = HOSTS_SINK_ADDRESSES | {"", "#"}
+
+
+def _parse_dnsmasq_lines(lines):
+    for line in lines:
+        line = line.strip()
+        domains = dnsmasq_domains(line)
+        if not domains:
+            continue
+        target = line.rpartition("/")[2]
+        if target and (
+            line.startswith("server=") or target not in DNSMASQ_SINK_TARGETS
+        ):
+            continue
+        # 指令同时作用于子域名，按后缀输出
+        for domain in domains:
+            yield "." + domain.lower()
+
+
+def _is_simple_dnsmasq(line: str) -> bool:
+    domain, sep, target = line[9:].partition("/")
+    return line[:9] == "address=/" and bool(sep) and target in DNSMASQ_SINK_TARGETS
+
+
+@register("dnsmasq", lambda line: line.startswith(DNSMASQ_DIRECTIVES))
+def parse_dnsmasq(batches, exceptions):
+    for batch in batches:
+        # 整批都是同一目标地址的 'address=/example.com/0.0.0.0'
+        target = batch[0].rpartition("/")[2] if batch else None
+        if target in DNSMASQ_SINK_TARGETS:
+            domains = strip_hostnames(batch, "address=/", "/" + target)
+            if domains is not None:
+                yield from ["." + domain for domain in domains]
+                continue
+        # 常见写法 'address=/example.com/0.0.0.0' 整批处理，其余行逐行解析
+        domains = clean_hostnames(
+            [
+                domain
+                for domain, sep, target in [
+                    line[9:].partition("/") for line in batch if line[:9] == "address=/"
+                ]
+                if sep and target in DNSMASQ_SINK_TARGETS
+            ]
+        )
+        if domains is None:
+            yield from _parse_dnsmasq_lines(batch)
+            continue
+        yield from ["." + domain for domain in domains]
+        if len(domains) < len(batch):
+            yield from _parse_dnsmasq_lines(
+                [line for line in batch if not _is_simple_dnsmasq(line)]
+            )
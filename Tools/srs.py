@@ -0,0 +1,282 @@
+import struct
+import zlib
+
+import cidr
+import mrs
+
+"""
+sing-box 二进制规则集 (.srs) 的读写
+
+文件格式：魔数 b"SRS" | 版本(1 字节) | zlib 压缩的规则数据。
+规则数据：规则数(uvarint)，每条规则为 类型(0=默认规则) | 若干规则项 | 0xFF | invert(1 字节)。
+每个规则项以 1 字节的项类型开头，长度一律使用 uvarint，定长整数为大端序。
+"""
+
+MAGIC = b"SRS"
+VERSION = 2
+
+ITEM_DOMAIN = 2
+ITEM_DOMAIN_KEYWORD = 3
+ITEM_SOURCE_IP_CIDR = 5
+ITEM_IP_CIDR = 6
+ITEM_SOURCE_PORT = 7
+ITEM_PORT = 9
+ITEM_PROCESS_NAME = 11
+ITEM_PROCESS_PATH = 12
+ITEM_FINAL = 0xFF
+
+# 规则项的写入顺序与 sing-box 一致
+STRING_ITEMS = {
+    "domain_keyword": ITEM_DOMAIN_KEYWORD,
+    "process_name": ITEM_PROCESS_NAME,
+    "process_path": ITEM_PROCESS_PATH,
+}
+CIDR_ITEMS = {"source_ip_cidr": ITEM_SOURCE_IP_CIDR, "ip_cidr": ITEM_IP_CIDR}
+PORT_ITEMS = {"source_port": ITEM_SOURCE_PORT, "port": ITEM_PORT}
+
+# 域名后缀在字典树中的前缀标记
+PREFIX_LABEL = "\r"
+ROOT_LABEL = "\n"
+
+
+class SrsError(ValueError):
+    pass
+
+
+def _uvarint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _bytes(data: bytes) -> bytes:
+    return _uvarint(len(data)) + data
+
+
+def _strings(values) -> bytes:
+    return _uvarint(len(values)) + b"".join(_bytes(v.encode("utf-8")) for v in values)
+
+
+def _domain_matcher(domains, domain_suffixes) -> bytes:
+    """与 sing-box domain.NewMatcher 一致：后缀优先，同名的完整域名会被跳过。"""
+    keys: set[str] = set()
+    seen: set[str] = set()
+    for suffix in domain_suffixes:
+        if not suffix or suffix in seen:
+            continue
+        seen.add(suffix)
+        if suffix.startswith("."):
+            keys.add(PREFIX_LABEL + suffix)
+        else:
+            keys.add(ROOT_LABEL + suffix)
+    for domain in domains:
+        if not domain or domain in seen:
+            continue
+        seen.add(domain)
+        keys.add(domain)
+
+    # 与 mrs 使用同一种简洁字典树，只是数组长度使用 uvarint
+    leaves, label_bitmap, labels = mrs.build_succinct_set(
+        sorted(key[::-1].encode("utf-8") for key in keys)
+    )
+    return b"".join(
+        [
+            b"\x01",
+            _uvarint(len(leaves) // 8),
+            leaves,
+            _uvarint(len(label_bitmap) // 8),
+            label_bitmap,
+            _bytes(labels),
+        ]
+    )
+
+
+def _ip_set(values) -> bytes:
+    ranges: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+    for value in values:
+        try:
+            version, start, end = cidr.parse_network(value)
+        except ValueError:
+            raise SrsError(f"invalid ip cidr: {value}") from None
+        ranges[version].append((start, end))
+
+    chunks = []
+    for version in (4, 6):
+        size = cidr.BITS[version] // 8
+        for start, end in cidr.merge_ranges(ranges[version]):
+            chunks.append(_bytes(start.to_bytes(size, "big")))
+            chunks.append(_bytes(end.to_bytes(size, "big")))
+    return b"\x01" + struct.pack(">Q", len(chunks) // 2) + b"".join(chunks)
+
+
+def _ports(values) -> bytes:
+    ports = []
+    for value in values:
+        try:
+            port = int(value)
+        except ValueError:
+            raise SrsError(f"invalid port: {value}") from None
+        if not 0 <= port <= 0xFFFF:
+            raise SrsError(f"invalid port: {value}")
+        ports.append(struct.pack(">H", port))
+    return _uvarint(len(ports)) + b"".join(ports)
+
+
+def _encode_rule(rule: dict) -> bytes:
+    chunks = [b"\x00"]
+    if rule.get("domain") or rule.get("domain_suffix"):
+        chunks.append(bytes([ITEM_DOMAIN]))
+        chunks.append(
+            _domain_matcher(rule.get("domain", []), rule.get("domain_suffix", []))
+        )
+    if rule.get("domain_keyword"):
+        chunks.append(bytes([ITEM_DOMAIN_KEYWORD]) + _strings(rule["domain_keyword"]))
+    for name, item in CIDR_ITEMS.items():
+        if rule.get(name):
+            chunks.append(bytes([item]) + _ip_set(rule[name]))
+    for name, item in PORT_ITEMS.items():
+        if rule.get(name):
+            chunks.append(bytes([item]) + _ports(rule[name]))
+    for name in ("process_name", "process_path"):
+        if rule.get(name):
+            chunks.append(bytes([STRING_ITEMS[name]]) + _strings(rule[name]))
+    chunks.append(bytes([ITEM_FINAL, 0]))
+    return b"".join(chunks)
+
+
+def encode(rules: list[dict]) -> bytes:
+    """把 sing-box headless 规则（与 JSON 规则集中 rules 的元素相同）编码为 .srs 内容"""
+    data = _uvarint(len(rules)) + b"".join(_encode_rule(rule) for rule in rules)
+    return MAGIC + bytes([VERSION]) + zlib.compress(data, 9)
+
+
+def write(rules: list[dict], output_path: str) -> int:
+    data = encode(rules)
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+class _Reader:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.offset = 0
+
+    def read(self, size: int) -> bytes:
+        if self.offset + size > len(self.data):
+            raise SrsError("unexpected end of data")
+        chunk = self.data[self.offset : self.offset + size]
+        self.offset += size
+        return chunk
+
+    def byte(self) -> int:
+        return self.read(1)[0]
+
+    def uvarint(self) -> int:
+        value = shift = 0
+        while True:
+            b = self.byte()
+            value |= (b & 0x7F) << shift
+            if b < 0x80:
+                return value
+            shift += 7
+
+    def bytes(self) -> bytes:
+        return self.read(self.uvarint())
+
+    def strings(self) -> list[str]:
+        return [self.bytes().decode("utf-8") for _ in range(self.uvarint())]
+
+
+def _decode_domain(reader: _Reader) -> tuple[list[str], list[str]]:
+    if reader.byte() != 1:
+        raise SrsError("unsupported domain matcher version")
+    leaves = reader.read(reader.uvarint() * 8)
+    bitmap = reader.read(reader.uvarint() * 8)
+    labels = reader.bytes()
+
+    try:
+        keys = mrs.succinct_set_keys(leaves, bitmap, labels)
+    except ValueError as e:
+        raise SrsError(str(e)) from None
+
+    domains, suffixes = [], []
+    for key in keys:
+        key = key.decode("utf-8")[::-1]
+        # '\r.example.com' 只匹配子域名，'\nexample.com' 匹配自身及子域名
+        if key.startswith((PREFIX_LABEL, ROOT_LABEL)):
+            suffixes.append(key[1:])
+        else:
+            domains.append(key)
+    return sorted(domains), sorted(suffixes)
+
+
+def _decode_ip_set(reader: _Reader) -> list[str]:
+    if reader.byte() != 1:
+        raise SrsError("unsupported ip set version")
+    networks = []
+    for _ in range(struct.unpack(">Q", reader.read(8))[0]):
+        start, end = reader.bytes(), reader.bytes()
+        version = 4 if len(start) == 4 else 6
+        networks.extend(
+            cidr.format_network(version, network, prefix_len)
+            for network, prefix_len in cidr.range_to_prefixes(
+                int.from_bytes(start, "big"),
+                int.from_bytes(end, "big"),
+                cidr.BITS[version],
+            )
+        )
+    return networks
+
+
+def decode(data: bytes) -> list[dict]:
+    """
+    解析 .srs 内容，返回 headless 规则列表
+    域名会还原为 domain / domain_suffix，IP 返回合并后最少的 CIDR 列表
+    """
+    if data[:3] != MAGIC:
+        raise SrsError("invalid srs magic")
+    if not 1 <= data[3] <= 3:
+        raise SrsError(f"unsupported srs version: {data[3]}")
+    reader = _Reader(zlib.decompress(data[4:]))
+
+    names = {
+        v: k
+        for items in (STRING_ITEMS, CIDR_ITEMS, PORT_ITEMS)
+        for k, v in items.items()
+    }
+    rules = []
+    for _ in range(reader.uvarint()):
+        if reader.byte() != 0:
+            raise SrsError("only default rules are supported")
+        rule: dict = {}
+        while (item := reader.byte()) != ITEM_FINAL:
+            if item == ITEM_DOMAIN:
+                domains, suffixes = _decode_domain(reader)
+                if domains:
+                    rule["domain"] = domains
+                if suffixes:
+                    rule["domain_suffix"] = suffixes
+            elif item in STRING_ITEMS.values():
+                rule[names[item]] = reader.strings()
+            elif item in CIDR_ITEMS.values():
+                rule[names[item]] = _decode_ip_set(reader)
+            elif item in PORT_ITEMS.values():
+                rule[names[item]] = [
+                    struct.unpack(">H", reader.read(2))[0]
+                    for _ in range(reader.uvarint())
+                ]
+            else:
+                raise SrsError(f"unsupported rule item: {item}")
+        if reader.byte():
+            rule["invert"] = True
+        rules.append(rule)
+    return rules
+
+
+def read(path: str) -> list[dict]:
+    with open(path, "rb") as f:
+        return decode(f.read())
@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 构建脚本以 python Tools/x.py 运行，模块之间按顶层模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import download  # noqa: E402
+
+
+class Reply:
+    """单次响应；delay 为发送响应头前等待的秒数。"""
+
+    def __init__(self, status=200, body=b"", headers=None, delay=0.0) -> None:
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.delay = delay
+
+
+class StandInServer:
+    """
+    本地替身服务器，按路径依次返回预先设定的响应（用完后重复最后一个），
+    记录收到的请求与同时处理中的最大请求数，用于注入延迟与错误
+    """
+
+    def __init__(self) -> None:
+        self.routes: dict[str, list[Reply]] = {}
+        self.requests: list[tuple[str, dict]] = []
+        self.active = 0
+        self.max_active = 0
+        # 每个请求的 (开始, 结束) 时间，用于计算多个服务器合计的并发数
+        self.intervals: list[tuple[float, float]] = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._handle(self)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, args=(0.05,), daemon=True
+        )
+        self.thread.start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def route(self, path: str, *replies: Reply) -> str:
+        self.routes[path] = list(replies)
+        return self.url(path)
+
+    def hits(self, path: str) -> list[dict]:
+        return [headers for p, headers in self.requests if p == path]
+
+    def _handle(self, handler) -> None:
+        length = int(handler.headers.get("Content-Length") or 0)
+        if length:
+            handler.rfile.read(length)
+        with self.lock:
+            self.requests.append((handler.path, dict(handler.headers)))
+            replies = self.routes.get(handler.path) or [Reply(404)]
+            reply = replies.pop(0) if len(replies) > 1 else replies[0]
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        started = time.monotonic()
+        try:
+            time.sleep(reply.delay)
+            handler.send_response(reply.status)
+            for name, value in reply.headers.items():
+                handler.send_header(name, value)
+            handler.send_header("Content-Length", str(len(reply.body)))
+            handler.end_headers()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        finally:
+            # 客户端读完内容前记下结束时间，之后的请求不会与这次请求重叠
+            with self.lock:
+                self.active -= 1
+                self.intervals.append((started, time.monotonic()))
+        try:
+            handler.wfile.write(reply.body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    server = StandInServer()
+    yield server
+    server.close()
+
+
+def max_overlap(intervals) -> int:
+    """同时进行中的区间数的最大值。"""
+    events = sorted(
+        [(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals],
+        key=lambda event: (event[0], event[1]),
+    )
+    active = peak = 0
+    for _, delta in events:
+        active += delta
+        peak = max(peak, active)
+    return peak
+
+
+@pytest.fixture
+def http_cache(tmp_path, monkeypatch):
+    """独立的下载缓存目录，重置本次构建内已验证的 URL。"""
+    monkeypatch.setattr(config, "HTTP_CACHE_DIR", str(tmp_path / "http"))
+    monkeypatch.setattr(config, "OFFLINE", False)
+    monkeypatch.setattr(download, "_validated", set())
+    return tmp_path / "http"
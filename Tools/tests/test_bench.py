@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import bench
+
+
+def result(wall: float, peak_rss_kib: int = 10_000) -> dict:
+    return {"wall": wall, "cpu": wall, "peak_rss_kib": peak_rss_kib}
+
+
+def test_compare():
+    baseline = {"surge@10k": result(1.0), "clash@10k": result(1.0)}
+
+    assert bench.compare({"surge@10k": result(1.1)}, baseline, 0.2) == []
+    assert bench.compare({"surge@10k": result(1.3)}, baseline, 0.2) == [
+        "surge@10k wall: 1.0 -> 1.3 (+30%)"
+    ]
+    # 没有基线的项目不比较
+    assert bench.compare({"web@10k": result(9.0)}, baseline, 0.2) == []
+    # 绝对差值过小视为计时噪声
+    assert (
+        bench.compare({"surge@10k": result(0.01)}, {"surge@10k": result(0.001)}, 0.2)
+        == []
+    )
+    assert bench.compare({"clash@10k": result(1.0, 20_000)}, baseline, 0.2) == [
+        "clash@10k peak_rss_kib: 10000 -> 20000 (+100%)"
+    ]
+
+
+@pytest.fixture
+def fake_run(tmp_path, monkeypatch):
+    """不生成数据、不启动子进程，按阶段返回预先设定的结果。"""
+    results = {}
+    monkeypatch.setattr(bench, "prepare", lambda size: str(tmp_path))
+    monkeypatch.setattr(bench, "run_isolated", lambda stage, work_dir: results[stage])
+    return results
+
+
+def run(tmp_path, *extra) -> int:
+    return bench.main(
+        [
+            "--sizes",
+            "10k",
+            "--stages",
+            "surge,clash",
+            "--output",
+            str(tmp_path / "results.json"),
+            "--baseline",
+            str(tmp_path / "baseline.json"),
+            *extra,
+        ]
+    )
+
+
+def test_regression_exits_non_zero(tmp_path, fake_run, capsys):
+    fake_run.update(surge=result(1.0), clash=result(1.0))
+    assert run(tmp_path) == 0
+    assert "No baseline" in capsys.readouterr().out
+    assert run(tmp_path, "--update-baseline") == 0
+
+    fake_run["surge"] = result(1.1)
+    assert run(tmp_path) == 0
+
+    fake_run["surge"] = result(1.5)
+    assert run(tmp_path) == 1
+    assert "Regression: surge@10k wall" in capsys.readouterr().out
+    assert run(tmp_path, "--threshold", "0.6") == 0
+
+    # 退化的结果仍会写出，基线保持不变
+    with open(tmp_path / "results.json", encoding="utf-8") as f:
+        assert json.load(f)["results"]["surge@10k"]["wall"] == 1.5
+    with open(tmp_path / "baseline.json", encoding="utf-8") as f:
+        assert json.load(f)["results"]["surge@10k"]["wall"] == 1.0
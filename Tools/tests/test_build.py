@@ -0,0 +1,21 @@
+import build
+from incremental import Manifest
+
+
+def test_init_without_running_as_script(tmp_path, monkeypatch):
+    out_dir = tmp_path / "Public"
+    (out_dir / "List").mkdir(parents=True)
+    (out_dir / "List" / "old.conf").write_text("a.com\n")
+    monkeypatch.setattr(build, "OUT_DIR", str(out_dir))
+    manifest = Manifest(str(tmp_path / "manifest.json"), str(tmp_path))
+    manifest.record("old", [], [str(out_dir / "List" / "old.conf")])
+
+    build.init(build.parser.parse_args([]), manifest)
+    assert (out_dir / "List" / "old.conf").exists()
+    assert "old" in manifest.entries
+
+    build.init(build.parser.parse_args(["--clean"]), manifest)
+    assert not (out_dir / "List" / "old.conf").exists()
+    assert not manifest.entries
+    for dir_name in build.INIT_DIR_NAME:
+        assert (out_dir / dir_name).is_dir()
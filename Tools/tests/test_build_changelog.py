@@ -0,0 +1,142 @@
+import gzip
+import json
+
+import pytest
+
+import build_changelog
+import config
+import incremental
+import ruleset
+
+
+@pytest.fixture(autouse=True)
+def serial(monkeypatch):
+    monkeypatch.setattr(config, "PROCESS_WORKERS", 1)
+    ruleset.clear_cache()
+    yield
+    ruleset.clear_cache()
+
+
+class Layout:
+    def __init__(self, tmp_path) -> None:
+        self.list_dir = tmp_path / "List"
+        self.delta_dir = self.list_dir / "Delta"
+        self.snapshot_dir = tmp_path / "snapshots"
+
+    def write(self, name: str, text: str) -> str:
+        path = self.list_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+        return incremental.file_digest(str(path))
+
+    def build(self) -> dict:
+        build_changelog.build(
+            str(self.list_dir), str(self.delta_dir), str(self.snapshot_dir)
+        )
+        with open(self.delta_dir / "changelog.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    def snapshot(self, name: str) -> list[str]:
+        with gzip.open(self.snapshot_dir / f"{name}.gz", "rt", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def delta(self, name: str) -> list[str]:
+        return (self.delta_dir / f"{name}.diff").read_text().splitlines()
+
+
+@pytest.fixture
+def layout(tmp_path):
+    return Layout(tmp_path)
+
+
+def test_first_build_writes_snapshots(layout):
+    first = layout.write("Surge/A.conf", "# header\nb.com\na.com\n")
+    singbox = json.dumps({"version": 2, "rules": [{"domain": ["a.com", "b.com"]}]})
+    layout.write("sing-box/A.json", singbox)
+
+    changelog = layout.build()
+
+    assert changelog["version"] == build_changelog.CHANGELOG_VERSION
+    assert changelog["delta_semantics"] == "set"
+    assert changelog["lists"]["Surge/A.conf"] == {
+        "rules": 2,
+        "added": 0,
+        "removed": 0,
+        "hash": first,
+        "previous_hash": None,
+    }
+    assert changelog["lists"]["sing-box/A.json"]["rules"] == 2
+    assert layout.snapshot("Surge/A.conf") == ["a.com", "b.com"]
+    assert layout.snapshot("sing-box/A.json") == ["domain,a.com", "domain,b.com"]
+    assert not (layout.delta_dir / "Surge").exists()
+
+
+def test_delta_and_hash_chain(layout):
+    first = layout.write("Surge/A.conf", "a.com\nb.com\n")
+    layout.build()
+    second = layout.write("Surge/A.conf", "a.com\nc.com\nd.com\n")
+
+    entry = layout.build()["lists"]["Surge/A.conf"]
+
+    assert entry == {
+        "rules": 3,
+        "added": 2,
+        "removed": 1,
+        "hash": second,
+        "previous_hash": first,
+        "delta": "Surge/A.conf.diff",
+    }
+    assert layout.delta("Surge/A.conf") == [
+        "# Surge/A.conf",
+        f"# Previous: {first}",
+        f"# Current: {second}",
+        "-b.com",
+        "+c.com",
+        "+d.com",
+    ]
+    assert layout.snapshot("Surge/A.conf") == ["a.com", "c.com", "d.com"]
+
+    # 下一次构建以本次的哈希为起点，未变化时不再有 .diff
+    entry = layout.build()["lists"]["Surge/A.conf"]
+    assert entry == {
+        "rules": 3,
+        "added": 0,
+        "removed": 0,
+        "hash": second,
+        "previous_hash": second,
+    }
+    assert not (layout.delta_dir / "Surge" / "A.conf.diff").exists()
+
+
+def test_reorder_and_duplicates_are_not_a_delta(layout):
+    layout.write("Surge/A.conf", "a.com\nb.com\n")
+    layout.build()
+    changed = layout.write("Surge/A.conf", "b.com\na.com\na.com\n")
+
+    entry = layout.build()["lists"]["Surge/A.conf"]
+
+    # 集合没有变化；规则数与生成器一致，包括重复行
+    assert entry["rules"] == 3
+    assert (entry["added"], entry["removed"]) == (0, 0)
+    assert entry["hash"] == changed
+    assert "delta" not in entry
+
+
+def test_removed_list(layout):
+    first = layout.write("Surge/A.conf", "a.com\nb.com\n")
+    layout.write("Surge/B.conf", "c.com\n")
+    layout.build()
+    (layout.list_dir / "Surge" / "A.conf").unlink()
+
+    changelog = layout.build()
+
+    assert changelog["lists"]["Surge/A.conf"] == {
+        "rules": 0,
+        "added": 0,
+        "removed": 2,
+        "hash": None,
+        "previous_hash": first,
+    }
+    assert not (layout.snapshot_dir / "Surge" / "A.conf.gz").exists()
+    # 之后的构建中不再出现
+    assert "Surge/A.conf" not in layout.build()["lists"]
@@ -0,0 +1,100 @@
+import gzip
+import os
+import time
+
+import pytest
+
+import build_compress
+import config
+import metrics
+from incremental import Manifest
+
+TEXT = b"".join(b"DOMAIN-SUFFIX,example%d.com\n" % i for i in range(500))
+
+
+@pytest.fixture(autouse=True)
+def serial(monkeypatch):
+    # 在当前进程中压缩，才能统计 compress_file 的调用
+    monkeypatch.setattr(config, "PROCESS_WORKERS", 1)
+
+
+@pytest.fixture
+def out_dir(tmp_path):
+    out = tmp_path / "List"
+    (out / "Surge").mkdir(parents=True)
+    (out / "Surge" / "Test.conf").write_bytes(TEXT)
+    (out / "mihomo").mkdir()
+    (out / "mihomo" / "Test.mrs").write_bytes(os.urandom(256))
+    (out / "sing-box").mkdir()
+    (out / "sing-box" / "Test.srs").write_bytes(os.urandom(256))
+    (out / "Tiny.txt").write_bytes(b"a\n")
+    return out
+
+
+def test_gzip_is_deterministic(tmp_path):
+    first = build_compress._gzip_compress(TEXT)
+    time.sleep(1.1)
+    second = build_compress._gzip_compress(TEXT)
+
+    assert first == second
+    # gzip 头中的 MTIME 字段
+    assert first[4:8] == b"\0\0\0\0"
+    assert gzip.decompress(first) == TEXT
+
+
+def test_compress(out_dir):
+    build_compress.build(str(out_dir), ("gz", "zst"))
+
+    files = sorted(
+        os.path.relpath(os.path.join(root, name), out_dir).replace(os.sep, "/")
+        for root, _, names in os.walk(out_dir)
+        for name in names
+    )
+    # .mrs / .srs 本身已经压缩；过小的文件压缩后反而更大，不保留
+    assert files == [
+        "Surge/Test.conf",
+        "Surge/Test.conf.gz",
+        "Surge/Test.conf.zst",
+        "Tiny.txt",
+        "mihomo/Test.mrs",
+        "sing-box/Test.srs",
+    ]
+    assert gzip.decompress((out_dir / "Surge" / "Test.conf.gz").read_bytes()) == TEXT
+
+
+def test_sibling_that_is_not_smaller_is_removed(out_dir):
+    stale = out_dir / "Tiny.txt.gz"
+    stale.write_bytes(b"stale")
+
+    assert build_compress.compress_file(str(out_dir / "Tiny.txt"), ("gz",)) == []
+    assert not stale.exists()
+
+
+def test_unchanged_files_are_skipped(out_dir, tmp_path, monkeypatch):
+    manifest = Manifest(str(tmp_path / "manifest.json"), str(tmp_path))
+    calls = []
+    compress_file = build_compress.compress_file
+
+    def counting(path, formats):
+        calls.append(os.path.basename(path))
+        return compress_file(path, formats)
+
+    monkeypatch.setattr(build_compress, "compress_file", counting)
+
+    build_compress.build(str(out_dir), ("gz",), manifest)
+    assert sorted(calls) == ["Test.conf", "Tiny.txt"]
+
+    calls.clear()
+    with metrics.stage("test:compress") as stage:
+        build_compress.build(str(out_dir), ("gz",), manifest)
+    assert calls == []
+    # 跳过的文件仍计入压缩统计
+    assert stage.compression["gz"]["files"] == 1
+    assert stage.compression["gz"]["bytes"] == len(TEXT)
+
+    (out_dir / "Surge" / "Test.conf").write_bytes(TEXT + b"DOMAIN,new.com\n")
+    build_compress.build(str(out_dir), ("gz",), manifest)
+    assert calls == ["Test.conf"]
+    assert gzip.decompress((out_dir / "Surge" / "Test.conf.gz").read_bytes()).endswith(
+        b"DOMAIN,new.com\n"
+    )
@@ -0,0 +1,82 @@
+import os
+import stat
+
+import pytest
+
+import build_mrs
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="stub mihomo is a shell script")
+
+# 记录每次调用，把输入内容与规则类型写入输出文件
+STUB_MIHOMO = """#!/bin/sh
+echo "$2 $4" >> "$STUB_LOG"
+{ echo "$2"; cat "$4"; } > "$5"
+"""
+
+
+@pytest.fixture
+def stub_mihomo(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "mihomo"
+    script.write_text(STUB_MIHOMO)
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    log = tmp_path / "mihomo.log"
+    log.touch()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("STUB_LOG", str(log))
+    monkeypatch.setattr(build_mrs, "_cache_indexes", {})
+    return log
+
+
+def write_lists(ruleset_dir, count: int) -> None:
+    ruleset_dir.mkdir(exist_ok=True)
+    for i in range(count):
+        (ruleset_dir / f"Domain{i}.conf").write_text(
+            f".example{i}.com\nexample{i}.net\n"
+        )
+        (ruleset_dir / f"IP{i}.conf").write_text(f"IP-CIDR,10.{i}.0.0/16,no-resolve\n")
+
+
+def run_build(tmp_path, out_name: str) -> dict[str, bytes]:
+    out_dir = tmp_path / out_name
+    build_mrs.build(
+        tmp_path / "Source",
+        out_dir,
+        workers=4,
+        cache_dir=str(tmp_path / "cache"),
+        encoder="mihomo",
+    )
+    return {path.name: path.read_bytes() for path in sorted(out_dir.glob("*.mrs"))}
+
+
+def test_parallel_compile_is_served_from_cache(tmp_path, stub_mihomo):
+    write_lists(tmp_path / "Source", 4)
+
+    first = run_build(tmp_path, "first")
+    assert len(first) == 8
+    assert first["Domain1.mrs"] == b"domain\n+.example1.com\nexample1.net\n"
+    assert first["IP2.mrs"] == b"ipcidr\n10.2.0.0/16\n"
+    assert len(stub_mihomo.read_text().splitlines()) == 8
+
+    second = run_build(tmp_path, "second")
+    assert second == first
+    assert len(stub_mihomo.read_text().splitlines()) == 8
+
+
+def test_prune_removes_unused_cache_entries(tmp_path, stub_mihomo):
+    ruleset_dir = tmp_path / "Source"
+    write_lists(ruleset_dir, 2)
+    run_build(tmp_path, "first")
+    cache_dir = tmp_path / "cache"
+    assert len(list(cache_dir.glob("*.mrs"))) == 4
+
+    (ruleset_dir / "Domain0.conf").write_text(".changed.com\n")
+    (ruleset_dir / "IP1.conf").unlink()
+    run_build(tmp_path, "second")
+    build_mrs.prune_cache(str(cache_dir), os.listdir(ruleset_dir))
+
+    # Domain0 的旧条目与已删除的 IP1 的条目被删除
+    assert len(list(cache_dir.glob("*.mrs"))) == 3
+    run_build(tmp_path, "third")
+    assert len(stub_mihomo.read_text().splitlines()) == 5
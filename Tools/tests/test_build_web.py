@@ -0,0 +1,98 @@
+import json
+import os
+
+import pytest
+
+import build_web
+import metrics
+from incremental import Manifest
+
+
+def write(path, text: str) -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def rule_counts(html: str) -> dict[str, int]:
+    """从生成的文件树中取出 {文件名: 规则数}。"""
+    counts = {}
+    name = None
+    for line in html.splitlines():
+        if line.startswith("<a href="):
+            name = line.split(">", 1)[1].split("<", 1)[0]
+        elif line.startswith('<code class="rule-count">'):
+            counts[name] = int(line.split(">", 1)[1].split(" ", 1)[0])
+    return counts
+
+
+@pytest.fixture
+def public(tmp_path):
+    write(tmp_path / "List" / "Surge" / "Recorded.conf", "a.com\nb.com\n")
+    write(
+        tmp_path / "List" / "Surge" / "Copied.conf",
+        "# NAME: Copied\n\nDOMAIN,a.com\r\n  # comment\nDOMAIN,b.com\nDOMAIN,c.com",
+    )
+    write(
+        tmp_path / "List" / "sing-box" / "Test.json",
+        json.dumps(
+            {"version": 2, "rules": [{"domain": ["a.com"], "port": ["1", "2"]}]}
+        ),
+    )
+    write(tmp_path / "List" / "changelog.json", json.dumps({"files": {}}))
+    write(tmp_path / "Config" / "surge.conf", "[General]\n")
+    return tmp_path
+
+
+def test_rule_counts(public):
+    manifest = Manifest(str(public / "manifest.json"), str(public))
+    # 生成器记录的条数优先于读取文件
+    manifest.note_rules({str(public / "List" / "Surge" / "Recorded.conf"): 5})
+
+    with metrics.stage("test:web") as stage:
+        html = build_web.generate_file_tree_html(str(public), manifest=manifest)
+
+    assert rule_counts(html) == {"Recorded.conf": 5, "Copied.conf": 3, "Test.json": 3}
+    # 没有记录的文件直接数行，不计入读入的规则数
+    assert stage.counters["rules_in"] == 0
+
+
+def test_stale_count_is_not_used(public):
+    manifest = Manifest(str(public / "manifest.json"), str(public))
+    recorded = public / "List" / "Surge" / "Recorded.conf"
+    manifest.note_rules({str(recorded): 5})
+    write(recorded, "a.com\nb.com\nc.com\nd.com\n")
+
+    html = build_web.generate_file_tree_html(str(public), manifest=manifest)
+
+    assert rule_counts(html)["Recorded.conf"] == 4
+
+
+@pytest.mark.skipif(
+    build_web.MarkdownIt is None, reason="markdown-it-py is not installed"
+)
+def test_html_cache(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+
+    html = build_web.render_markdown_to_html("# Title\n", cache_dir=cache_dir)
+    assert html == "<h1>Title</h1>\n"
+    assert len(os.listdir(cache_dir)) == 1
+
+    # 命中缓存时不再渲染
+    def fail():
+        raise AssertionError("rendered again")
+
+    monkeypatch.setattr(build_web, "_local_markdown", fail)
+    assert build_web.render_markdown_to_html("# Title\n", cache_dir=cache_dir) == html
+
+    # 内容或渲染器不同则不使用缓存
+    with pytest.raises(AssertionError):
+        build_web.render_markdown_to_html("# Other\n", cache_dir=cache_dir)
+    monkeypatch.setattr(build_web, "render_with_github", lambda md, token: "<p>gh</p>")
+    assert (
+        build_web.render_markdown_to_html(
+            "# Title\n", renderer="github", cache_dir=cache_dir
+        )
+        == "<p>gh</p>"
+    )
+    assert len(os.listdir(cache_dir)) == 2
@@ -0,0 +1,116 @@
+import ipaddress
+import random
+
+import pytest
+
+import cidr
+
+
+def reference(networks, exclude=()) -> list[str]:
+    """用 ipaddress 计算 cidr.collapse 的期望结果。"""
+    result = []
+    for version in (4, 6):
+        remaining = list(
+            ipaddress.collapse_addresses(
+                ipaddress.ip_network(n, strict=False)
+                for n in networks
+                if ipaddress.ip_network(n, strict=False).version == version
+            )
+        )
+        for item in exclude:
+            excluded = ipaddress.ip_network(item, strict=False)
+            if excluded.version != version:
+                continue
+            next_remaining = []
+            for network in remaining:
+                if excluded.supernet_of(network):
+                    continue
+                if network.supernet_of(excluded):
+                    next_remaining.extend(network.address_exclude(excluded))
+                else:
+                    next_remaining.append(network)
+            remaining = next_remaining
+        result.extend(str(n) for n in ipaddress.collapse_addresses(remaining))
+    return result
+
+
+def test_merge_ipv4():
+    networks = ["1.0.0.0/25", "1.0.0.128/25", "1.0.1.0/24", "1.0.3.0/24", "1.0.2.7"]
+
+    assert cidr.collapse(networks) == reference(networks)
+    assert cidr.collapse(networks) == ["1.0.0.0/23", "1.0.2.7/32", "1.0.3.0/24"]
+
+
+def test_merge_ipv6():
+    networks = ["2001:db8::/33", "2001:db8:8000::/33", "2001:db9::/32", "240e::/20"]
+
+    assert cidr.collapse(networks) == reference(networks)
+    assert cidr.collapse(networks) == ["2001:db8::/31", "240e::/20"]
+
+
+def test_host_bits_are_cleared():
+    assert cidr.collapse(["10.1.2.3/8"]) == ["10.0.0.0/8"]
+
+
+def test_exclusion_inside_prefix():
+    networks = ["10.0.0.0/22"]
+    exclude = ["10.0.1.0/24", "10.0.2.0/24"]
+
+    assert cidr.collapse(networks, exclude) == reference(networks, exclude)
+    assert cidr.collapse(networks, exclude) == ["10.0.0.0/24", "10.0.3.0/24"]
+
+
+def test_exclusion_inside_ipv6_prefix():
+    networks = ["2001:db8::/32"]
+    exclude = ["2001:db8:1::/48"]
+
+    assert cidr.collapse(networks, exclude) == reference(networks, exclude)
+
+
+def test_exclusion_of_whole_range():
+    networks = ["10.0.0.0/24", "2001:db8::/32"]
+
+    for exclude in (["10.0.0.0/24"], ["10.0.0.0/8", "2001:db8::/32"]):
+        assert cidr.collapse(networks, exclude) == reference(networks, exclude)
+    assert cidr.collapse(networks, ["10.0.0.0/24"]) == ["2001:db8::/32"]
+    assert cidr.collapse(networks, ["10.0.0.0/8", "2001:db8::/32"]) == []
+
+
+def test_invalid_networks_are_reported():
+    invalid = []
+
+    result = cidr.collapse(
+        ["1.0.0.0/24", "1.0.0.0/33", "not-an-ip"], (), invalid.append
+    )
+
+    assert result == ["1.0.0.0/24"]
+    assert invalid == ["1.0.0.0/33", "not-an-ip"]
+
+
+def test_range_to_prefixes_is_minimal():
+    start = int(ipaddress.IPv4Address("10.0.0.1"))
+    end = int(ipaddress.IPv4Address("10.0.2.254"))
+
+    prefixes = cidr.range_to_prefixes(start, end, 32)
+
+    expected = ipaddress.summarize_address_range(
+        ipaddress.IPv4Address(start), ipaddress.IPv4Address(end)
+    )
+    assert [
+        cidr.format_network(4, network, prefix_len) for network, prefix_len in prefixes
+    ] == [str(n) for n in expected]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_ipaddress(seed):
+    rng = random.Random(seed)
+
+    def network(version: int) -> str:
+        if version == 4:
+            return f"10.{rng.randrange(4)}.{rng.randrange(256)}.0/{rng.randint(20, 28)}"
+        return f"2001:db8:{rng.randrange(4):x}{rng.randrange(16):x}::/{rng.randint(40, 60)}"
+
+    networks = [network(rng.choice((4, 6))) for _ in range(rng.randint(1, 40))]
+    exclude = [network(rng.choice((4, 6))) for _ in range(rng.randint(0, 8))]
+
+    assert cidr.collapse(networks, exclude) == reference(networks, exclude)
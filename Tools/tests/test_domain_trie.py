@@ -0,0 +1,54 @@
+import build_form_dnsmasq_china_list
+import domain_trie
+from conftest import Reply
+
+
+def domainset_matches(entries, host: str) -> bool:
+    """Surge DOMAIN-SET / mihomo / sing-box 的匹配语义。"""
+    return any(
+        host == entry.lstrip(".") or (entry.startswith(".") and host.endswith(entry))
+        for entry in entries
+    )
+
+
+def test_minimize_drops_only_covered_entries():
+    entries = [
+        ".apple.com",
+        "www.apple.com",
+        ".cdn.apple.com",
+        "itunes.apple.cn",
+        "aod.itunes.apple.cn",
+        "apple.com",
+    ]
+
+    kept, dropped = domain_trie.minimize_domainset(entries)
+
+    assert kept == [".apple.com", "itunes.apple.cn", "aod.itunes.apple.cn"]
+    assert dropped == 3
+
+
+def test_minimize_keeps_subdomains_of_exact_entries():
+    entries = ["itunes.apple.com", "aod.itunes.apple.com", "google.cn", "www.google.cn"]
+
+    kept, _ = domain_trie.minimize_domainset(entries)
+
+    for host in entries:
+        assert domainset_matches(kept, host)
+
+
+def test_dnsmasq_list_keeps_covered_subdomains(stand_in, http_cache, tmp_path):
+    url = stand_in.route(
+        "/apple.china.conf",
+        Reply(
+            body=b"server=/itunes.apple.com/114.114.114.114\n"
+            b"server=/aod.itunes.apple.com/114.114.114.114\n"
+            b"server=/itunes.apple.com/114.114.114.114\n"
+        ),
+    )
+
+    build_form_dnsmasq_china_list.download_and_process("ChinaApple", url, tmp_path)
+
+    lines = (tmp_path / "ChinaApple.conf").read_text(encoding="utf-8").splitlines()
+    entries = [line for line in lines if line and not line.startswith("#")]
+    assert entries == ["aod.itunes.apple.com", "itunes.apple.com"]
+    assert domainset_matches(entries, "aod.itunes.apple.com")
@@ -0,0 +1,199 @@
+import concurrent.futures
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+import config
+import download
+from conftest import Reply, StandInServer, max_overlap
+
+
+def read(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_first_download_is_cached(stand_in, http_cache):
+    url = stand_in.route(
+        "/list.txt", Reply(body=b"a.com\nb.com\n", headers={"ETag": '"v1"'})
+    )
+
+    path = download.fetch_path(url)
+
+    assert read(path) == b"a.com\nb.com\n"
+    meta = download._load_meta(download._cache_paths(url)[1])
+    assert meta["etag"] == '"v1"'
+    assert meta["size"] == 12
+    # 同一次构建内不再重复请求
+    assert download.fetch_path(url) == path
+    assert len(stand_in.hits("/list.txt")) == 1
+
+
+def test_not_modified_keeps_cached_body(stand_in, http_cache, monkeypatch):
+    last_modified = "Wed, 01 Jan 2025 00:00:00 GMT"
+    url = stand_in.route(
+        "/list.txt",
+        Reply(
+            body=b"a.com\n", headers={"ETag": '"v1"', "Last-Modified": last_modified}
+        ),
+        Reply(304),
+    )
+    download.fetch_path(url)
+
+    # 新的一次构建，缓存已过期
+    monkeypatch.setattr(download, "_validated", set())
+    monkeypatch.setattr(config, "HTTP_CACHE_TTL", 0)
+    path = download.fetch_path(url)
+
+    assert read(path) == b"a.com\n"
+    revalidation = stand_in.hits("/list.txt")[1]
+    assert revalidation["If-None-Match"] == '"v1"'
+    assert revalidation["If-Modified-Since"] == last_modified
+
+
+def test_offline_uses_cache(stand_in, http_cache, monkeypatch):
+    url = stand_in.route("/list.txt", Reply(body=b"a.com\n"))
+    download.fetch_path(url)
+
+    monkeypatch.setattr(download, "_validated", set())
+    monkeypatch.setattr(config, "HTTP_CACHE_TTL", 0)
+    monkeypatch.setattr(config, "OFFLINE", True)
+
+    assert read(download.fetch_path(url)) == b"a.com\n"
+    assert len(stand_in.hits("/list.txt")) == 1
+
+
+def test_offline_without_cache_fails(stand_in, http_cache, monkeypatch):
+    url = stand_in.route("/list.txt", Reply(body=b"a.com\n"))
+    monkeypatch.setattr(config, "OFFLINE", True)
+
+    with pytest.raises(download.OfflineError):
+        download.fetch_path(url)
+    assert not stand_in.requests
+
+
+@pytest.fixture
+def backoff(monkeypatch):
+    """不等待，记录每次重试的 (attempt, retry_after)。"""
+    delays = []
+
+    def record(attempt, retry_after=None):
+        delays.append((attempt, retry_after))
+        return 0
+
+    monkeypatch.setattr(download, "backoff_delay", record)
+    return delays
+
+
+def test_retries_server_errors(stand_in, http_cache, backoff):
+    url = stand_in.route("/list.txt", Reply(503), Reply(500), Reply(body=b"a.com\n"))
+
+    assert read(download.fetch_path(url)) == b"a.com\n"
+    assert len(stand_in.hits("/list.txt")) == 3
+    assert backoff == [(0, None), (1, None)]
+
+
+def test_honours_retry_after(stand_in, backoff):
+    url = stand_in.route(
+        "/api", Reply(429, headers={"Retry-After": "2"}), Reply(body=b"ok")
+    )
+
+    assert download.request("GET", url).content == b"ok"
+    assert backoff == [(0, 2.0)]
+
+
+def test_gives_up_after_retries(stand_in, backoff, monkeypatch):
+    monkeypatch.setattr(config, "HTTP_RETRIES", 2)
+    url = stand_in.route("/api", Reply(502))
+
+    with pytest.raises(download.RetryableStatus):
+        download.request("GET", url)
+    assert len(stand_in.hits("/api")) == 3
+
+
+def test_backoff_delay(monkeypatch):
+    monkeypatch.setattr(config, "HTTP_BACKOFF", 1)
+    monkeypatch.setattr(config, "HTTP_BACKOFF_MAX", 8)
+
+    for attempt in range(6):
+        expected = min(8, 2**attempt)
+        assert expected / 2 <= download.backoff_delay(attempt) <= expected
+    assert download.backoff_delay(0, retry_after=5) >= 5
+    assert download.backoff_delay(0, retry_after=100) <= 8
+
+
+def test_concurrency_limits(stand_in, monkeypatch):
+    monkeypatch.setattr(config, "HTTP_MAX_PER_HOST", 2)
+    monkeypatch.setattr(download, "_global_slots", threading.BoundedSemaphore(3))
+    monkeypatch.setattr(download, "_host_slots", {})
+    other = StandInServer()
+    try:
+        urls = [
+            server.route("/slow", Reply(body=b"x", delay=0.2))
+            for server in (stand_in, other)
+        ]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=12) as executor:
+            responses = list(
+                executor.map(lambda url: download.request("GET", url), urls * 6)
+            )
+
+        assert all(response.content == b"x" for response in responses)
+        assert stand_in.max_active == 2
+        assert other.max_active == 2
+        assert max_overlap(stand_in.intervals + other.intervals) == 3
+    finally:
+        other.close()
+
+
+def test_read_timeout(stand_in, backoff, monkeypatch):
+    monkeypatch.setattr(config, "HTTP_READ_TIMEOUT", 0.2)
+    monkeypatch.setattr(config, "HTTP_RETRIES", 1)
+    url = stand_in.route("/hang", Reply(body=b"late", delay=1))
+
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        download.request("GET", url)
+    assert time.monotonic() - started < 0.9
+    assert len(stand_in.hits("/hang")) == 2
+
+
+def cache_then_fail(stand_in, monkeypatch, *replies) -> str:
+    url = stand_in.route("/list.txt", Reply(body=b"a.com\n"))
+    download.fetch_path(url)
+    stand_in.route("/list.txt", *replies)
+    monkeypatch.setattr(download, "_validated", set())
+    monkeypatch.setattr(config, "HTTP_CACHE_TTL", 0)
+    monkeypatch.setattr(config, "HTTP_RETRIES", 1)
+    return url
+
+
+def test_retryable_error_falls_back_to_cache(
+    stand_in, http_cache, backoff, monkeypatch
+):
+    url = cache_then_fail(stand_in, monkeypatch, Reply(503))
+
+    assert read(download.fetch_path(url)) == b"a.com\n"
+    assert len(stand_in.hits("/list.txt")) == 3
+
+
+def test_client_error_is_not_masked_by_cache(
+    stand_in, http_cache, backoff, monkeypatch
+):
+    url = cache_then_fail(stand_in, monkeypatch, Reply(404))
+
+    with pytest.raises(requests.HTTPError) as info:
+        download.fetch_path(url)
+    assert info.value.response.status_code == 404
+    # 4xx 不重试
+    assert len(stand_in.hits("/list.txt")) == 2
+
+
+def test_unexpected_not_modified_without_cache(stand_in, http_cache):
+    url = stand_in.route("/list.txt", Reply(304))
+
+    with pytest.raises(requests.HTTPError):
+        download.fetch_path(url)
+    assert not os.path.exists(download._cache_paths(url)[0])
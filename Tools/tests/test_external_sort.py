@@ -0,0 +1,138 @@
+import os
+import random
+import re
+import threading
+
+import pytest
+
+import build_guard
+import domain_trie
+import external_sort
+from conftest import Reply
+from external_sort import ExternalSorter
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    # 内存上限为 1 字节时，每一批都会写成一个分段
+    monkeypatch.setattr(external_sort, "BATCH_SIZE", 10)
+
+
+def domains(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    names = [
+        f"{'.' if rng.random() < 0.3 else ''}{rng.choice('abcdefgh')}{rng.randrange(200)}"
+        f".{rng.choice(('com', 'net', 'cn'))}"
+        for _ in range(count)
+    ]
+    # 包含重复行
+    return names + names[: count // 4]
+
+
+def test_in_memory(tmp_path):
+    lines = domains(100)
+
+    with ExternalSorter(1 << 20, tmp_dir=tmp_path) as sorter:
+        assert sorter.update(lines) == len(lines)
+        assert list(sorter) == sorted(set(lines))
+        assert sorter.runs == []
+        assert sorter.count == len(set(lines))
+
+
+def test_spills(tmp_path, small_batches):
+    lines = domains(40)
+
+    with ExternalSorter(1, tmp_dir=tmp_path) as sorter:
+        sorter.update(lines)
+        assert 1 < len(sorter.runs) <= external_sort.MAX_FANIN
+        assert list(sorter) == sorted(set(lines))
+        assert sorter.count == len(set(lines))
+        tmp_dir = sorter.tmp_dir
+    assert not os.path.exists(tmp_dir)
+
+
+@pytest.mark.parametrize("fanin", [external_sort.MAX_FANIN, 3])
+def test_multi_pass_merge(tmp_path, small_batches, monkeypatch, fanin):
+    monkeypatch.setattr(external_sort, "MAX_FANIN", fanin)
+    lines = domains(2000)
+
+    with ExternalSorter(1, tmp_dir=tmp_path) as sorter:
+        sorter.update(lines)
+        assert len(sorter.runs) > fanin
+        assert list(sorter) == sorted(set(lines))
+        # 归并后剩下的分段数不超过上限，中间分段已删除
+        assert len(sorter.runs) <= fanin
+        assert sorted(os.listdir(sorter.tmp_dir)) == sorted(
+            os.path.basename(path) for path in sorter.runs
+        )
+
+
+def test_key(tmp_path, small_batches):
+    lines = domains(500)
+
+    with ExternalSorter(1, key=domain_trie.suffix_sort_key, tmp_dir=tmp_path) as sorter:
+        sorter.update(lines)
+        assert list(sorter) == sorted(
+            set(lines), key=lambda line: (domain_trie.suffix_sort_key(line), line)
+        )
+
+
+def test_concurrent_updates(tmp_path, small_batches):
+    parts = [domains(300, seed) for seed in range(4)]
+
+    with ExternalSorter(1, tmp_dir=tmp_path) as sorter:
+        threads = [threading.Thread(target=sorter.update, args=(p,)) for p in parts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert list(sorter) == sorted({line for part in parts for line in part})
+
+
+GUARD_SOURCES = {
+    "/domains.txt": "# comment\n.ads.example.com\ntracker.example.net\n"
+    + "".join(f"a{i}.example.org\n" for i in range(300)),
+    "/hosts.txt": "0.0.0.0 tracker.example.net\n127.0.0.1 b.ads.example.com\n"
+    + "".join(f"0.0.0.0 h{i}.example.cn\n" for i in range(300)),
+    "/adblock.txt": "! title\n||example.org^\n||allowed.example.cn^\n"
+    "@@||h1.example.cn^\n" + "".join(f"||x{i}.example.io^\n" for i in range(300)),
+}
+
+
+def test_external_guard_matches_in_memory(
+    stand_in, http_cache, tmp_path, small_batches, monkeypatch
+):
+    sources = [
+        stand_in.route(path, Reply(body=body.encode()))
+        for path, body in GUARD_SOURCES.items()
+    ]
+    in_memory, external = tmp_path / "memory", tmp_path / "external"
+    in_memory.mkdir()
+    external.mkdir()
+
+    build_guard.build(sources, str(in_memory))
+    merges = []
+    merge = ExternalSorter._merge
+
+    def counting(self, paths):
+        merges.append(len(paths))
+        return merge(self, paths)
+
+    monkeypatch.setattr(ExternalSorter, "_merge", counting)
+    build_guard.build(sources, str(external), sort_memory=1)
+    # 按后缀排序的分段超过一次归并的上限，先分批归并
+    assert merges[0] == external_sort.MAX_FANIN
+    assert len(merges) > 2
+
+    def body(path) -> list[str]:
+        text = (path / "Guard.conf").read_text(encoding="utf-8")
+        return re.sub(r"Last Updated: \S+", "", text).splitlines()
+
+    lines = body(external)
+    assert lines == body(in_memory)
+    rules = [line for line in lines if not line.startswith("#")]
+    assert rules == sorted(set(rules))
+    assert ".example.org" in rules and "a1.example.org" not in rules
+    assert "b.ads.example.com" not in rules
+    assert "h1.example.cn" not in rules and "h2.example.cn" in rules
+    assert "msmp.abchina.com.cn" in rules
@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+import build_surge
+from incremental import SHARED_CODE, Manifest
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return Manifest(str(tmp_path / "manifest.json"), str(tmp_path))
+
+
+def write(path, text: str) -> str:
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def reload(manifest: Manifest, tmp_path) -> Manifest:
+    manifest.save()
+    return Manifest(manifest.path, str(tmp_path))
+
+
+def test_fresh_after_record(manifest, tmp_path):
+    source = write(tmp_path / "a.conf", "a.com\n")
+    output = write(tmp_path / "a.out", "a.com\n")
+
+    assert not manifest.is_fresh("a", [source], "config")
+    manifest.record("a", [source], [output], "config")
+
+    manifest = reload(manifest, tmp_path)
+    assert manifest.is_fresh("a", [source], "config")
+
+
+def test_stale_on_change(manifest, tmp_path):
+    source = write(tmp_path / "a.conf", "a.com\n")
+    output = write(tmp_path / "a.out", "a.com\n")
+    manifest.record("a", [source], [output], "config")
+
+    assert not manifest.is_fresh("a", [source], "other config")
+
+    write(tmp_path / "a.conf", "b.com\n")
+    assert not manifest.is_fresh("a", [source], "config")
+
+    write(tmp_path / "a.conf", "a.com\n")
+    assert manifest.is_fresh("a", [source], "config")
+    write(tmp_path / "a.out", "changed\n")
+    assert not manifest.is_fresh("a", [source], "config")
+
+    os.remove(output)
+    assert not manifest.is_fresh("a", [source], "config")
+
+
+def test_removes_outputs_no_longer_produced(manifest, tmp_path):
+    source = write(tmp_path / "a.conf", "a.com\n")
+    json_path = write(tmp_path / "a.json", "{}")
+    srs_path = write(tmp_path / "a.srs", "srs")
+    manifest.record("a", [source], [json_path, srs_path])
+
+    manifest.record("a", [source], [json_path])
+
+    assert os.path.exists(json_path)
+    assert not os.path.exists(srs_path)
+
+
+def test_prune_removes_outputs_of_untouched_entries(manifest, tmp_path):
+    for name in ("a", "b"):
+        source = write(tmp_path / f"{name}.conf", "a.com\n")
+        manifest.record(name, [source], [write(tmp_path / f"{name}.out", "x")])
+
+    # 下一次构建中 b 的源文件已被删除
+    manifest = reload(manifest, tmp_path)
+    assert manifest.is_fresh("a", [str(tmp_path / "a.conf")])
+    manifest.prune()
+
+    assert os.path.exists(tmp_path / "a.out")
+    assert not os.path.exists(tmp_path / "b.out")
+    assert set(manifest.entries) == {"a"}
+
+
+def test_stabilize_keeps_last_updated(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.json"), str(tmp_path), True)
+    header = "# Last Updated: 2025-01-01T00:00:00+08:00\n"
+    output = write(tmp_path / "a.conf", header + "a.com\n")
+    manifest.record("a", [], [output])
+
+    write(tmp_path / "a.conf", header.replace("01T", "02T") + "a.com\n")
+    manifest.record("a", [], [output])
+    assert (tmp_path / "a.conf").read_text() == header + "a.com\n"
+
+    write(tmp_path / "a.conf", header.replace("01T", "02T") + "b.com\n")
+    manifest.record("a", [], [output])
+    assert "2025-01-02" in (tmp_path / "a.conf").read_text()
+
+
+def test_shared_code_is_an_input(manifest, tmp_path):
+    """ruleset.py / until.py / config.py 改动后，已生成的产物不再是最新的。"""
+    source_dir = tmp_path / "Source"
+    source_dir.mkdir()
+    write(source_dir / "a.conf", "DOMAIN,a.com\n")
+    out_dir = tmp_path / "Surge"
+
+    build_surge.build(str(source_dir), str(out_dir), manifest)
+    key, source = "surge:a.conf", str(source_dir / "a.conf")
+    inputs = [source, build_surge.__file__, *SHARED_CODE]
+    assert manifest.is_fresh(key, inputs)
+
+    assert set(manifest.entries[key]["inputs"]) >= {
+        manifest._rel(path) for path in SHARED_CODE
+    }
@@ -0,0 +1,31 @@
+import build_china_ip
+import metrics
+from conftest import Reply
+
+
+def test_counted_counts_while_streaming():
+    consumed = []
+
+    def lines():
+        for line in ("a", "b", "a"):
+            consumed.append(line)
+            yield line
+
+    counted = metrics.Counted(lines())
+    assert counted.count == 0
+    assert set(counted) == {"a", "b"}
+    assert counted.count == 3
+    assert consumed == ["a", "b", "a"]
+
+
+def test_upstream_rules_are_counted(stand_in, http_cache, tmp_path):
+    sources = [
+        stand_in.route("/a.txt", Reply(body=b"1.0.1.0/24\n1.0.2.0/23\n# comment\n")),
+        stand_in.route("/b.txt", Reply(body=b"1.0.1.0/24\n8.8.8.0/24\n")),
+    ]
+
+    with metrics.stage("test:china-ip") as stage:
+        build_china_ip.build(sources, tmp_path)
+
+    assert stage.counters["rules_in"] == 4
+    assert stage.counters["rules_out"] == 3
@@ -0,0 +1,103 @@
+import shutil
+import subprocess
+
+import pytest
+
+import mrs
+
+DOMAIN_RULES = ["+.a.com", ".b.com", "c.com", "www.c.com", "+.xn--fiqs8s", "d.com"]
+IPCIDR_RULES = [
+    "10.0.0.0/25",
+    "10.0.0.128/25",
+    "192.168.1.1",
+    "2001:db8::/33",
+    "2001:db8:8000::/33",
+    "2400:3200::/32",
+]
+
+
+def payload(rules, behavior: str) -> bytes:
+    return mrs._decompress(mrs.encode(rules, behavior))
+
+
+def test_domain_keys():
+    assert mrs._domain_keys("+.a.com") == ["a.com", "+.a.com"]
+    assert mrs._domain_keys(".b.com") == ["+.b.com"]
+    assert mrs._domain_keys("C.com") == ["c.com"]
+    assert mrs._domain_keys("a..com") is None
+    assert mrs._domain_keys("a.com.") is None
+
+
+def test_domain_round_trip():
+    behavior, count, entries = mrs.decode(
+        mrs.encode(["+.a.com", ".b.com", "c.com"], "domain")
+    )
+
+    assert behavior == "domain"
+    assert count == 3
+    assert entries == ["+.a.com", "+.b.com", "a.com", "c.com"]
+
+
+def test_ipcidr_round_trip():
+    behavior, count, entries = mrs.decode(mrs.encode(IPCIDR_RULES, "ipcidr"))
+
+    assert behavior == "ipcidr"
+    assert count == 6
+    # 相邻网段经 cidr.merge_ranges 合并
+    assert entries == [
+        "10.0.0.0/24",
+        "192.168.1.1/32",
+        "2001:db8::/32",
+        "2400:3200::/32",
+    ]
+
+
+def test_ipv4_is_stored_mapped():
+    data = payload(["1.2.3.0/24"], "ipcidr")
+
+    # 魔数、behavior、规则数、扩展数据长度、版本、区间数之后是 16 字节的起止地址
+    start, end = data[30:46], data[46:62]
+    assert start == bytes(10) + b"\xff\xff" + bytes((1, 2, 3, 0))
+    assert end == bytes(10) + b"\xff\xff" + bytes((1, 2, 3, 255))
+
+
+def test_empty_rule():
+    with pytest.raises(mrs.MrsError, match="empty rule"):
+        mrs.encode(["", "not a domain.", "a..com"], "domain")
+    with pytest.raises(mrs.MrsError, match="empty rule"):
+        mrs.encode(["not-a-network"], "ipcidr")
+
+
+def test_domain_layout():
+    # 单个键 'b.a'（'a.b' 反转）：四个节点，只有最后一个是叶子（0b1000）；
+    # 前三个节点各有一个子节点，最后一个没有（位图 0101011，低位在前）
+    assert payload(["a.b"], "domain") == (
+        b"MRS\x01\x00"
+        + (1).to_bytes(8, "big")
+        + bytes(8)
+        + b"\x01"
+        + (1).to_bytes(8, "big")
+        + (0b1000).to_bytes(8, "big")
+        + (1).to_bytes(8, "big")
+        + (0b1101010).to_bytes(8, "big")
+        + (3).to_bytes(8, "big")
+        + b"b.a"
+    )
+
+
+@pytest.mark.skipif(shutil.which("mihomo") is None, reason="mihomo is not installed")
+@pytest.mark.parametrize(
+    "rules, behavior", [(DOMAIN_RULES, "domain"), (IPCIDR_RULES, "ipcidr")]
+)
+def test_matches_mihomo_converter(tmp_path, rules, behavior):
+    source = tmp_path / "rules.txt"
+    source.write_text("\n".join(rules) + "\n", encoding="utf-8")
+    output = tmp_path / "rules.mrs"
+    subprocess.run(
+        ["mihomo", "convert-ruleset", behavior, "text", str(source), str(output)],
+        check=True,
+        capture_output=True,
+    )
+
+    # 压缩参数可能不同，比较解压后的内容
+    assert payload(rules, behavior) == mrs._decompress(output.read_bytes())
@@ -0,0 +1,87 @@
+import os
+import re
+
+import pytest
+
+import build_clash
+import build_singbox
+import build_smartdns
+import build_surge
+import config
+import process_pool
+import ruleset
+
+SOURCES = {
+    "Guard.conf": "".join(
+        f".ad{i}.example.com\nad{i}.example.net\n" for i in range(3000)
+    ),
+    "Domainset.conf": "# NAME: Domainset\n.cn\nexample.cn\n.\n",
+    "China.conf": "".join(f"1.{i}.0.0/16\n" for i in range(200)) + "240e::/20\n",
+    "Classical.conf": "DOMAIN,a.com\nDOMAIN-SUFFIX,b.com\nDOMAIN-KEYWORD,c\n"
+    "IP-CIDR,10.0.0.0/8,no-resolve\nPROCESS-NAME,curl\nPORT,443\n",
+}
+# 每次构建都会变化的只有文件头中的生成时间
+LAST_UPDATED = re.compile(rb"Last Updated: \S+")
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ruleset.clear_cache()
+    yield
+    ruleset.clear_cache()
+    process_pool.shutdown()
+
+
+def build(source_dir: str, out_dir: str) -> dict[str, bytes]:
+    build_clash.build(source_dir, os.path.join(out_dir, "Clash"))
+    build_surge.build(source_dir, os.path.join(out_dir, "Surge"))
+    build_singbox.build(source_dir, os.path.join(out_dir, "sing-box"))
+    smartdns_dir = os.path.join(out_dir, "smartdns")
+    build_smartdns.build(
+        {
+            os.path.join(source_dir, name): os.path.join(smartdns_dir, name)
+            for name in ("Guard.conf", "Domainset.conf")
+        },
+        smartdns_dir,
+    )
+
+    tree = {}
+    for root, _, files in os.walk(out_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                tree[os.path.relpath(path, out_dir)] = LAST_UPDATED.sub(
+                    b"Last Updated: -", f.read()
+                )
+    return tree
+
+
+def test_pool_output_matches_serial(tmp_path, monkeypatch):
+    source_dir = tmp_path / "Source"
+    source_dir.mkdir()
+    for name, text in SOURCES.items():
+        (source_dir / name).write_text(text, encoding="utf-8")
+
+    monkeypatch.setattr(config, "PROCESS_WORKERS", 1)
+    serial = build(str(source_dir), str(tmp_path / "serial"))
+    assert process_pool._executor is None
+
+    monkeypatch.setattr(config, "PROCESS_WORKERS", 3)
+    pooled = build(str(source_dir), str(tmp_path / "pooled"))
+    assert process_pool._executor is not None
+
+    # Clash、Surge 各 4 个，sing-box 的 JSON 与 .srs 各 4 个，smartdns 2 个
+    assert len(serial) == 18
+    assert pooled == serial
+
+
+def test_jobs_are_sorted_by_source_size(tmp_path):
+    paths = []
+    for name, text in SOURCES.items():
+        (tmp_path / name).write_text(text, encoding="utf-8")
+        paths.append(str(tmp_path / name))
+    jobs = [(ruleset.load(path), "out") for path in paths]
+
+    order = [job[0].name for job, _ in process_pool.run(lambda rs, out: None, jobs)]
+
+    assert order == ["Guard", "China", "Classical", "Domainset"]
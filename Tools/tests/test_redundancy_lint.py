@@ -0,0 +1,63 @@
+import redundancy_lint
+
+
+def lint(tmp_path, text: str) -> dict[int, int]:
+    path = tmp_path / "List.conf"
+    path.write_text(text, encoding="utf-8")
+    _, entries = redundancy_lint.read_entries(str(path))
+    findings = redundancy_lint.lint_entries(str(path), entries)
+    return {finding.lineno: finding.by_lineno for finding in findings}
+
+
+def test_domain_rules(tmp_path):
+    text = """\
+DOMAIN-SUFFIX,example.com
+DOMAIN,www.example.com
+DOMAIN-SUFFIX,cdn.example.com
+domain-suffix,EXAMPLE.com
+DOMAIN-KEYWORD,tracker
+DOMAIN,tracker.example.org
+DOMAIN-KEYWORD,adtracker
+DOMAIN,example.org
+"""
+    assert lint(tmp_path, text) == {2: 1, 3: 1, 4: 1, 6: 5, 7: 5}
+
+
+def test_cidr_with_same_options(tmp_path):
+    text = """\
+IP-CIDR,91.108.8.0/21,no-resolve
+IP-CIDR,91.108.8.0/22,no-resolve
+IP-CIDR,91.108.16.0/22,no-resolve
+IP-CIDR6,2001:b28::/32,no-resolve
+IP-CIDR6,2001:b28:f23d::/48,no-resolve
+"""
+    assert lint(tmp_path, text) == {2: 1, 5: 4}
+
+
+def test_cidr_with_different_options(tmp_path):
+    text = """\
+IP-CIDR,91.108.8.0/21,no-resolve
+IP-CIDR,91.108.8.0/22
+IP-CIDR,10.0.0.0/8
+IP-CIDR,10.1.0.0/16,no-resolve
+IP-CIDR,10.0.0.0/8,no-resolve
+IP-CIDR,172.16.0.0/12,src
+IP-CIDR,172.16.0.0/16
+"""
+    # 不带 no-resolve 的规则覆盖带 no-resolve 的规则，反之则不然；其他参数须相同
+    assert lint(tmp_path, text) == {4: 3, 5: 3}
+
+
+def test_fix_keeps_comments(tmp_path):
+    path = tmp_path / "List.conf"
+    path.write_text(
+        "# header\nIP-CIDR,10.0.0.0/8\n\n# comment\nIP-CIDR,10.1.0.0/16\n",
+        encoding="utf-8",
+    )
+
+    assert redundancy_lint.main([str(path), "--fix"]) == 0
+
+    assert (
+        path.read_text(encoding="utf-8")
+        == "# header\nIP-CIDR,10.0.0.0/8\n\n# comment\n"
+    )
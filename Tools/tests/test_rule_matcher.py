@@ -0,0 +1,89 @@
+import ruleset
+from rule_matcher import Match, Matcher
+
+
+def make(name: str, *lines: str) -> ruleset.Ruleset:
+    return ruleset.Ruleset(name, f"{name}.conf", None, list(lines), "classical")
+
+
+def build(*rulesets) -> Matcher:
+    matcher = Matcher()
+    for rs in rulesets:
+        matcher.add_ruleset(rs)
+    return matcher.build()
+
+
+def test_exact():
+    matcher = build(make("A", "DOMAIN,Example.com"))
+
+    assert matcher.match("example.com") == Match("A", "DOMAIN,Example.com")
+    assert matcher.match("EXAMPLE.COM.") == Match("A", "DOMAIN,Example.com")
+    assert matcher.match("www.example.com") is None
+
+
+def test_suffix():
+    matcher = build(make("A", "DOMAIN-SUFFIX,example.com"))
+
+    assert matcher.match("example.com") == Match("A", "DOMAIN-SUFFIX,example.com")
+    assert matcher.match("a.b.example.com") == Match("A", "DOMAIN-SUFFIX,example.com")
+    assert matcher.match("notexample.com") is None
+    assert matcher.match_domain("example.com", include_exact=False) is not None
+
+
+def test_keyword():
+    matcher = build(make("A", "DOMAIN-KEYWORD,track", "DOMAIN-KEYWORD,ads"))
+
+    assert matcher.match("a.tracker.net") == Match("A", "DOMAIN-KEYWORD,track")
+    assert matcher.match("loads.example.org") == Match("A", "DOMAIN-KEYWORD,ads")
+    assert matcher.match("example.org") is None
+    assert matcher.match_keyword("mytracking") == Match("A", "DOMAIN-KEYWORD,track")
+
+
+def test_cidr():
+    matcher = build(
+        make("A", "IP-CIDR,10.0.0.0/8,no-resolve", "IP-CIDR6,2001:db8::/32")
+    )
+
+    assert matcher.match("10.1.2.3") == Match("A", "IP-CIDR,10.0.0.0/8,no-resolve")
+    assert matcher.match("2001:db8::1") == Match("A", "IP-CIDR6,2001:db8::/32")
+    assert matcher.match("11.0.0.1") is None
+    assert matcher.match("2001:db9::1") is None
+    assert matcher.match_network(4, 0x0A000000, 0x0A0000FF) is not None
+    assert matcher.match_network(4, 0x09FFFFFF, 0x0A0000FF) is None
+
+
+def test_unsupported_types_are_counted():
+    matcher = build(make("A", "PROCESS-NAME,curl", "PROCESS-NAME,wget", "FINAL"))
+
+    assert matcher.unsupported == {"PROCESS-NAME": 2}
+    assert matcher.matches == []
+
+
+def test_earlier_list_wins():
+    """与代理客户端按顺序匹配一致：先加载的规则集优先，不论规则类型。"""
+    matcher = build(
+        make("Reject", "DOMAIN-KEYWORD,ads", "IP-CIDR,10.0.0.0/16"),
+        make("Direct", "DOMAIN,ads.example.com", "IP-CIDR,10.0.0.0/8"),
+        make("Proxy", "DOMAIN-SUFFIX,example.com"),
+    )
+
+    assert matcher.match("ads.example.com") == Match("Reject", "DOMAIN-KEYWORD,ads")
+    assert matcher.match("www.example.com") == Match(
+        "Proxy", "DOMAIN-SUFFIX,example.com"
+    )
+    assert matcher.match("10.0.1.1") == Match("Reject", "IP-CIDR,10.0.0.0/16")
+    assert matcher.match("10.1.0.1") == Match("Direct", "IP-CIDR,10.0.0.0/8")
+
+
+def test_earlier_rule_wins_within_list():
+    matcher = build(
+        make("A", "DOMAIN-SUFFIX,b.example.com", "DOMAIN-SUFFIX,example.com"),
+        make("B", "DOMAIN-SUFFIX,c.b.example.com"),
+    )
+
+    assert matcher.match("c.b.example.com") == Match("A", "DOMAIN-SUFFIX,b.example.com")
+    # 更短的后缀先出现时同样优先
+    matcher = build(
+        make("A", "DOMAIN-SUFFIX,example.com", "DOMAIN-SUFFIX,b.example.com")
+    )
+    assert matcher.match("b.example.com") == Match("A", "DOMAIN-SUFFIX,example.com")
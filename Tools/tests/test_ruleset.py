@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+import ruleset
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ruleset.clear_cache()
+    yield
+    ruleset.clear_cache()
+
+
+def write(path, text: str) -> str:
+    path.write_text(text, encoding="utf-8", newline="")
+    return str(path)
+
+
+def test_detect_kind():
+    assert ruleset.detect_kind([".example.com", "example.net"]) == "domainset"
+    assert ruleset.detect_kind(["1.0.1.0/24", "2001:db8::/32"]) == "ipcidr"
+    assert ruleset.detect_kind(["DOMAIN,example.com", ".example.net"]) == "classical"
+    assert ruleset.detect_kind([]) == "classical"
+
+
+def test_parse_line():
+    assert ruleset.parse_line(".example.com", "domainset") == ruleset.Rule(
+        "DOMAIN-SUFFIX", "example.com", (), ".example.com"
+    )
+    assert ruleset.parse_line("example.com", "domainset").type == "DOMAIN"
+    assert ruleset.parse_line("2001:db8::/32", "ipcidr").type == "IP-CIDR6"
+    assert ruleset.parse_line(
+        "IP-CIDR, 1.0.1.0/24 , no-resolve", "classical"
+    ) == ruleset.Rule(
+        "IP-CIDR", "1.0.1.0/24", ("no-resolve",), "IP-CIDR, 1.0.1.0/24 , no-resolve"
+    )
+    assert ruleset.parse_line("FINAL", "classical").value == ""
+
+
+def test_comments_and_blank_lines(tmp_path):
+    path = write(
+        tmp_path / "Test.conf",
+        "# NAME: Test\r\n# AUTHOR: x\r\n\r\n"
+        "DOMAIN,example.com\r\n  # comment\r\n\r\n  DOMAIN-SUFFIX,example.net  \r\n",
+    )
+
+    rs = ruleset.load(path)
+
+    assert rs.name == "Test"
+    assert rs.header == "# NAME: Test\n# AUTHOR: x\n"
+    assert rs.lines == ["DOMAIN,example.com", "DOMAIN-SUFFIX,example.net"]
+    assert rs.kind == "classical"
+    assert rs.rule_types == {"DOMAIN", "DOMAIN-SUFFIX"}
+
+
+def test_domainset_file(tmp_path):
+    path = write(tmp_path / "Set.conf", ".b.example.com\na.example.com\n")
+
+    rs = ruleset.load(path)
+
+    assert rs.is_domainset
+    assert rs.header is None
+    assert rs.sorted_lines == [".b.example.com", "a.example.com"]
+    assert [rule.type for rule in rs.rules] == ["DOMAIN-SUFFIX", "DOMAIN"]
+
+
+def test_cache_is_invalidated_on_change(tmp_path):
+    path = write(tmp_path / "Test.conf", "a.example.com\n")
+
+    first = ruleset.load(path)
+    assert ruleset.load(path) is first
+
+    write(tmp_path / "Test.conf", "b.example.com\n")
+    # 大小相同时依靠 mtime 判断
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    second = ruleset.load(path)
+    assert second is not first
+    assert second.lines == ["b.example.com"]
+
+
+def test_load_without_cache(tmp_path):
+    path = write(tmp_path / "Test.conf", "a.example.com\n")
+
+    assert ruleset.load(path, cache=False) is not ruleset.load(path, cache=False)
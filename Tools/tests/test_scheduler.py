@@ -0,0 +1,143 @@
+import threading
+
+import pytest
+
+from scheduler import STATUS_FAILED, STATUS_OK, STATUS_SKIPPED, Scheduler
+
+
+class Log:
+    """记录各阶段开始与结束的顺序。"""
+
+    def __init__(self) -> None:
+        self.events: list[tuple[str, str]] = []
+        self.lock = threading.Lock()
+
+    def stage(self, name: str, error: Exception | None = None):
+        def run():
+            with self.lock:
+                self.events.append(("start", name))
+            if error is not None:
+                raise error
+            with self.lock:
+                self.events.append(("end", name))
+
+        return run
+
+    def index(self, event: str, name: str) -> int:
+        return self.events.index((event, name))
+
+    def ran(self) -> set[str]:
+        return {name for event, name in self.events if event == "start"}
+
+
+def test_dependencies_from_inputs_and_outputs():
+    scheduler = Scheduler()
+    scheduler.add("copy", None, ["List/a.conf"], ["Source/a.conf"])
+    scheduler.add("surge", None, ["Source/a.conf"], ["Surge/a.conf"])
+    scheduler.add("clash", None, ["Source/./a.conf"], ["Clash/a.yaml"])
+    scheduler.add("web", None, scheduler.outputs(), ["index.html"])
+
+    assert scheduler.dependencies() == {
+        "copy": set(),
+        "surge": {"copy"},
+        "clash": {"copy"},
+        "web": {"copy", "surge", "clash"},
+    }
+
+
+def test_run_respects_dependencies():
+    log = Log()
+    scheduler = Scheduler(workers=4)
+    scheduler.add("web", log.stage("web"), ["Surge/a.conf", "Clash/a.yaml"])
+    scheduler.add("surge", log.stage("surge"), ["Source/a.conf"], ["Surge/a.conf"])
+    scheduler.add("clash", log.stage("clash"), ["Source/a.conf"], ["Clash/a.yaml"])
+    scheduler.add("copy", log.stage("copy"), ["List/a.conf"], ["Source/a.conf"])
+
+    assert scheduler.run() == {name: STATUS_OK for name in scheduler.stages}
+    for first, then in [
+        ("copy", "surge"),
+        ("copy", "clash"),
+        ("surge", "web"),
+        ("clash", "web"),
+    ]:
+        assert log.index("end", first) < log.index("start", then)
+
+
+def test_independent_stages_overlap():
+    """没有依赖关系的阶段同时运行，不等待彼此。"""
+    both_started = threading.Barrier(2, timeout=5)
+    scheduler = Scheduler(workers=2)
+    scheduler.add("a", both_started.wait, outputs=["a"])
+    scheduler.add("b", both_started.wait, outputs=["b"])
+
+    assert scheduler.run() == {"a": STATUS_OK, "b": STATUS_OK}
+
+
+def test_duplicate_stage_is_rejected():
+    scheduler = Scheduler()
+    scheduler.add("a", None)
+
+    with pytest.raises(ValueError, match="duplicate stage"):
+        scheduler.add("a", None)
+
+
+def test_duplicate_producer_is_rejected():
+    scheduler = Scheduler()
+    scheduler.add("a", None, outputs=["Surge/a.conf"])
+    scheduler.add("b", None, outputs=["Surge/./a.conf"])
+
+    with pytest.raises(ValueError, match="produced by both a and b"):
+        scheduler.dependencies()
+    with pytest.raises(ValueError):
+        scheduler.run()
+
+
+def test_cycle_is_rejected():
+    log = Log()
+    scheduler = Scheduler()
+    scheduler.add("free", log.stage("free"), outputs=["free"])
+    scheduler.add("a", log.stage("a"), ["c"], ["a"])
+    scheduler.add("b", log.stage("b"), ["a"], ["b"])
+    scheduler.add("c", log.stage("c"), ["b"], ["c"])
+
+    with pytest.raises(ValueError, match="dependency cycle between stages: a, b, c"):
+        scheduler.run()
+    # 检查在运行任何阶段之前完成
+    assert not log.events
+
+
+def test_own_output_is_not_a_dependency():
+    scheduler = Scheduler()
+    scheduler.add("a", None, ["a.conf"], ["a.conf"])
+
+    assert scheduler.dependencies() == {"a": set()}
+
+
+def test_failure_skips_transitive_dependents(capsys):
+    log = Log()
+    scheduler = Scheduler(workers=2)
+    scheduler.add("copy", log.stage("copy"), outputs=["Source/a.conf"])
+    scheduler.add(
+        "surge",
+        log.stage("surge", RuntimeError("boom")),
+        ["Source/a.conf"],
+        ["Surge/a.conf"],
+    )
+    scheduler.add("compress", log.stage("compress"), ["Surge/a.conf"], ["a.gz"])
+    scheduler.add("web", log.stage("web"), ["a.gz", "Clash/a.yaml"], ["index.html"])
+    scheduler.add("clash", log.stage("clash"), ["Source/a.conf"], ["Clash/a.yaml"])
+    scheduler.add("other", log.stage("other"), outputs=["other"])
+
+    assert scheduler.run() == {
+        "copy": STATUS_OK,
+        "surge": STATUS_FAILED,
+        "compress": STATUS_SKIPPED,
+        "web": STATUS_SKIPPED,
+        "clash": STATUS_OK,
+        "other": STATUS_OK,
+    }
+    assert log.ran() == {"copy", "surge", "clash", "other"}
+    out = capsys.readouterr().out
+    assert "[Scheduler] surge failed: boom" in out
+    assert "[Scheduler] Skip compress: surge failed" in out
+    assert "[Scheduler] Skip web: surge failed" in out
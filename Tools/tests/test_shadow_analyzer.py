@@ -0,0 +1,119 @@
+import pytest
+
+import ruleset
+import shadow_analyzer
+from rule_matcher import Match
+from shadow_analyzer import INLINE_NAME, PolicyList
+
+SURGE = """\
+[General]
+loglevel = notify
+
+[Rule]
+# 注释
+RULE-SET,SYSTEM,DIRECT
+RULE-SET,https://example.com/List/Reject.conf,REJECT
+DOMAIN-SUFFIX,example.org,Proxy
+RULE-SET,https://example.com/List/Direct.conf,DIRECT
+RULE-SET,https://example.com/List/Proxy.conf,Proxy
+FINAL,Proxy
+"""
+
+MIHOMO = """\
+mode: rule
+rule-providers:
+  Reject: {type: http, behavior: classical, url: "https://example.com/List/Reject.conf"}
+  Direct: {type: http, behavior: classical, url: https://example.com/List/Direct.conf}
+  Proxy: {type: http, behavior: classical, url: https://example.com/List/Proxy.conf}
+rules:
+  - RULE-SET,Reject,REJECT
+  - DOMAIN-SUFFIX,example.org,Proxy
+  # - RULE-SET,Proxy,Proxy
+  - RULE-SET,Direct,DIRECT
+  - RULE-SET,Proxy,Proxy
+  - MATCH,Proxy
+"""
+
+EXPECTED_ORDER = [
+    PolicyList("Reject", "REJECT"),
+    PolicyList(INLINE_NAME, "Proxy", ("DOMAIN-SUFFIX,example.org",)),
+    PolicyList("Direct", "DIRECT"),
+    PolicyList("Proxy", "Proxy"),
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ruleset.clear_cache()
+    yield
+    ruleset.clear_cache()
+
+
+@pytest.fixture
+def list_dir(tmp_path):
+    lists = {
+        "Reject": "DOMAIN-KEYWORD,adservice\nIP-CIDR,10.0.0.0/16\n",
+        "Direct": "DOMAIN,www.example.org\nDOMAIN-SUFFIX,cn\nIP-CIDR,10.0.1.0/24\n",
+        "Proxy": "DOMAIN-SUFFIX,google.cn\nDOMAIN,adservice.google.com\n"
+        "DOMAIN-SUFFIX,google.com\n",
+    }
+    for name, text in lists.items():
+        (tmp_path / f"{name}.conf").write_text(text, encoding="utf-8")
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("name, text", [("surge.conf", SURGE), ("mihomo.yaml", MIHOMO)])
+def test_read_order(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+
+    assert shadow_analyzer.read_order(str(path)) == EXPECTED_ORDER
+
+
+def test_reports_shadowed_rules(list_dir):
+    findings, summary = shadow_analyzer.analyze(EXPECTED_ORDER, [list_dir])
+
+    found = {f.rule: f for f in findings}
+    assert set(found) == {
+        "DOMAIN,www.example.org",
+        "IP-CIDR,10.0.1.0/24",
+        "DOMAIN-SUFFIX,google.cn",
+        "DOMAIN,adservice.google.com",
+    }
+    # 被另一策略的规则遮蔽，原本想走的策略不会生效
+    assert found["DOMAIN,www.example.org"].by == Match(
+        INLINE_NAME, "DOMAIN-SUFFIX,example.org"
+    )
+    assert found["DOMAIN,www.example.org"].conflict
+    assert found["IP-CIDR,10.0.1.0/24"].by == Match("Reject", "IP-CIDR,10.0.0.0/16")
+    assert found["DOMAIN,adservice.google.com"].by_policy == "REJECT"
+    assert found["DOMAIN-SUFFIX,google.cn"].by == Match("Direct", "DOMAIN-SUFFIX,cn")
+    assert found["DOMAIN-SUFFIX,google.cn"].conflict
+    assert summary["Proxy"] == {
+        "policy": "Proxy",
+        "rules": 3,
+        "shadowed": 2,
+        "conflicts": 2,
+        "bytes": len("DOMAIN-SUFFIX,google.cn\nDOMAIN,adservice.google.com\n"),
+    }
+
+
+def test_same_policy_is_redundant_not_conflict(list_dir):
+    order = [PolicyList("Direct", "DIRECT"), PolicyList("Proxy", "DIRECT")]
+
+    findings, summary = shadow_analyzer.analyze(order, [list_dir])
+
+    assert [(f.rule, f.conflict) for f in findings] == [
+        ("DOMAIN-SUFFIX,google.cn", False)
+    ]
+    assert summary["Proxy"]["conflicts"] == 0
+
+
+def test_missing_list_is_skipped(list_dir, capsys):
+    findings, summary = shadow_analyzer.analyze(
+        [PolicyList("Missing", "DIRECT"), *EXPECTED_ORDER], [list_dir]
+    )
+
+    assert "Missing" not in summary
+    assert "Skip missing list: Missing" in capsys.readouterr().out
+    assert len(findings) == 4
@@ -0,0 +1,161 @@
+import pytest
+
+import build_guard
+import source_parsers
+from conftest import Reply
+
+
+def parse(fmt: str, text: str, batch_size: int = 1000) -> tuple[list[str], set[str]]:
+    lines = text.split("\n")
+    batches = [lines[i : i + batch_size] for i in range(0, len(lines), batch_size)]
+    exceptions: set[str] = set()
+    return list(source_parsers.parse(fmt, batches, exceptions)), exceptions
+
+
+@pytest.mark.parametrize(
+    "head, expected",
+    [
+        ("example.com\n.example.net\n", "domainset"),
+        ("! Title: x\n[Adblock Plus]\n||example.com^\n@@||a.com^\n", "adblock"),
+        ("# hosts\n127.0.0.1 localhost\n0.0.0.0 example.com\n", "hosts"),
+        ("address=/example.com/0.0.0.0\nserver=/example.net/\n", "dnsmasq"),
+        # 按符合的行数取多数
+        ("||a.com^\n0.0.0.0 b.com\n0.0.0.0 c.com\n", "hosts"),
+        ("", "domainset"),
+    ],
+)
+def test_detect(head, expected):
+    assert source_parsers.detect(head) == expected
+
+
+@pytest.mark.parametrize("batch_size", [1000, 1])
+def test_domainset(batch_size):
+    text = (
+        "Example.COM\n.Sub.Example.net\n# comment\n\n"
+        "  spaced.com  # note\nzero\u200bwidth.com\n"
+    )
+
+    assert parse("domainset", text, batch_size)[0] == [
+        "example.com",
+        ".sub.example.net",
+        "spaced.com",
+        "zerowidth.com",
+    ]
+
+
+def test_domainset_fast_path_is_lowercased():
+    assert parse("domainset", "A.com\nb.COM")[0] == ["a.com", "b.com"]
+
+
+@pytest.mark.parametrize("batch_size", [1000, 1])
+def test_adblock(batch_size):
+    text = "\n".join(
+        [
+            "! comment",
+            "||Example.com^",
+            "||important.com^$important",
+            "||all.com^$all,doc",
+            "||third-party.com^$third-party",
+            "||script.com^$script",
+            "||path.com/ads^",
+            "||pipe.com^|",
+            "@@||allowed.com^",
+            "@@||allowed-option.com^$important",
+            "example.net",
+        ]
+    )
+
+    domains, exceptions = parse("adblock", text, batch_size)
+
+    assert domains == [".example.com", ".important.com", ".all.com", ".pipe.com"]
+    assert exceptions == {"allowed.com", "allowed-option.com"}
+
+
+@pytest.mark.parametrize("batch_size", [1000, 1])
+def test_hosts(batch_size):
+    text = "\n".join(
+        [
+            "# comment",
+            "127.0.0.1 localhost",
+            "0.0.0.0 0.0.0.0",
+            "0.0.0.0 ads.example.com",
+            "127.0.0.1 Tracker.example.net",
+            "0.0.0.0\tmulti.example.com  other.example.com # note",
+            "::1 ip6.example.com",
+            "192.168.1.1 router.example.com",
+            "0.0.0.0 localhost.localdomain",
+        ]
+    )
+
+    assert parse("hosts", text, batch_size)[0] == [
+        "ads.example.com",
+        "tracker.example.net",
+        "multi.example.com",
+        "other.example.com",
+        "ip6.example.com",
+    ]
+
+
+def test_hosts_uniform_batch():
+    text = "127.0.0.1 a.example.com\n127.0.0.1 B.example.com\n127.0.0.1 local"
+
+    assert parse("hosts", text)[0] == ["a.example.com", "b.example.com"]
+
+
+@pytest.mark.parametrize("batch_size", [1000, 1])
+def test_dnsmasq(batch_size):
+    text = "\n".join(
+        [
+            "# comment",
+            "address=/Ads.example.com/0.0.0.0",
+            "address=/nxdomain.example.com/",
+            "address=/hash.example.com/#",
+            "address=/a.example.net/b.example.net/127.0.0.1",
+            "address=/redirect.example.com/192.168.1.1",
+            "server=/local.example.com/",
+            "server=/forward.example.com/114.114.114.114",
+            "local=/lan.example.com/",
+        ]
+    )
+
+    assert parse("dnsmasq", text, batch_size)[0] == [
+        ".ads.example.com",
+        ".nxdomain.example.com",
+        ".hash.example.com",
+        ".a.example.net",
+        ".b.example.net",
+        ".local.example.com",
+        ".lan.example.com",
+    ]
+
+
+def test_dnsmasq_uniform_batch():
+    text = "address=/a.example.com/0.0.0.0\naddress=/b.example.com/0.0.0.0"
+
+    assert parse("dnsmasq", text)[0] == [".a.example.com", ".b.example.com"]
+
+
+@pytest.mark.parametrize("sort_memory", [0, 1 << 20], ids=["memory", "external"])
+def test_guard_reports_overridden_exceptions(
+    stand_in, http_cache, tmp_path, capsys, sort_memory
+):
+    sources = [
+        stand_in.route(
+            "/adblock.txt",
+            Reply(
+                body=b"||example.com^\n||a.example.net^\n"
+                b"@@||a.example.com^\n@@||a.example.net^\n"
+            ),
+        )
+    ]
+
+    build_guard.build(sources, str(tmp_path), sort_memory)
+
+    out = capsys.readouterr().out
+    assert (
+        "1 exceptions have no effect, a broader blocking suffix covers them: a.example.com"
+        in out
+    )
+    rules = (tmp_path / "Guard.conf").read_text().splitlines()
+    assert ".example.com" in rules
+    assert ".a.example.net" not in rules
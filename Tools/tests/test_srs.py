@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+import build_singbox
+import ruleset
+import srs
+
+CLASSICAL = """\
+DOMAIN,www.example.com
+DOMAIN-SUFFIX,example.org
+DOMAIN-KEYWORD,tracker
+IP-CIDR,10.0.0.0/8,no-resolve
+IP-CIDR,192.168.1.0/24,no-resolve
+IP-CIDR6,2001:db8::/32,no-resolve
+SRC-IP-CIDR,172.16.0.0/12
+PROCESS-NAME,curl
+PROCESS-PATH,/usr/bin/wget
+PORT,443
+PORT,8080
+SRC-PORT,53
+"""
+
+DOMAINSET = """\
+.example.com
+example.net
+"""
+
+
+def normalize(rules: list[dict]) -> list[dict]:
+    """JSON 中端口为字符串，.srs 中为整数；其余按排序后的列表比较。"""
+    return [
+        {
+            key: sorted(int(v) if key.endswith("port") else v for v in values)
+            for key, values in rule.items()
+        }
+        for rule in rules
+    ]
+
+
+def convert(tmp_path, text: str):
+    conf_path = tmp_path / "Test.conf"
+    conf_path.write_text(text, encoding="utf-8")
+    json_path = tmp_path / "out" / "Test.json"
+    srs_path = tmp_path / "out" / "Test.srs"
+    result = build_singbox.parse_conf_to_singbox(
+        ruleset.load(str(conf_path)), str(json_path), str(srs_path)
+    )
+    return result, json_path, srs_path
+
+
+@pytest.mark.parametrize("text", [CLASSICAL, DOMAINSET], ids=["classical", "domainset"])
+def test_srs_matches_json(tmp_path, text):
+    result, json_path, srs_path = convert(tmp_path, text)
+
+    assert result is not None
+    rules = json.loads(json_path.read_text(encoding="utf-8"))["rules"]
+    assert normalize(srs.read(str(srs_path))) == normalize(rules)
+
+
+def test_every_rule_type_is_encoded(tmp_path):
+    _, json_path, srs_path = convert(tmp_path, CLASSICAL)
+
+    rule = srs.read(str(srs_path))[0]
+    assert set(rule) == set(build_singbox.RULE_TYPE_MAPPING.values())
+    assert rule["port"] == [443, 8080]
+    assert rule["source_port"] == [53]
+    assert json.loads(json_path.read_text())["rules"][0]["port"] == ["443", "8080"]
+
+
+def test_ip_ranges_are_merged():
+    rules = [{"ip_cidr": ["10.0.0.0/25", "10.0.0.128/25", "2001:db8::/33"]}]
+
+    assert srs.decode(srs.encode(rules)) == [
+        {"ip_cidr": ["10.0.0.0/24", "2001:db8::/33"]}
+    ]
+
+
+class RecordingManifest:
+    def __init__(self) -> None:
+        self.outputs = {}
+
+    def is_fresh(self, key, input_paths=(), config=None) -> bool:
+        return False
+
+    def record(self, key, input_paths=(), output_paths=(), config=None, rules=None):
+        self.outputs[key] = list(output_paths)
+
+
+def test_failed_srs_is_removed_and_not_recorded(tmp_path):
+    source_dir = tmp_path / "Source"
+    source_dir.mkdir()
+    (source_dir / "Bad.conf").write_text("DOMAIN,example.com\nPORT,http\n")
+    out_dir = tmp_path / "sing-box"
+    out_dir.mkdir()
+    # 上次构建留下的 .srs
+    (out_dir / "Bad.srs").write_bytes(b"stale")
+
+    manifest = RecordingManifest()
+    build_singbox.build(str(source_dir), str(out_dir), manifest)
+
+    assert not (out_dir / "Bad.srs").exists()
+    assert manifest.outputs["sing-box:Bad.conf"] == [str(out_dir / "Bad.json")]
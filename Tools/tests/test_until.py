@@ -0,0 +1,111 @@
+import re
+
+import pytest
+
+import until
+
+
+# 改为在字节上处理之前（7dbca31）按文本逐行读取的实现，作为对照
+def reference_read_clean_lines(file_path: str) -> list[str]:
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        return [
+            line.strip()
+            for line in f
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+def reference_clear_comment(src_file, dest_file) -> None:
+    with open(src_file, "r", encoding="utf-8") as src:
+        lines = src.readlines()
+
+    cleaned_lines = []
+    for line in lines:
+        match = re.match(r"^[^#]*", line)
+        if match:
+            cleaned_lines.append(match.group(0).rstrip() + "\n")
+        else:
+            cleaned_lines.append("\n")
+
+    cleaned_lines = [line for line in cleaned_lines if line.strip()]
+
+    with open(dest_file, "w", encoding="utf-8", newline="\n") as dest:
+        dest.writelines(filter(None, cleaned_lines))
+
+
+def reference_deduplicate(src_file, dest_file) -> None:
+    lines_seen = set()
+    output_lines = []
+
+    with open(src_file, "r", encoding="utf-8") as file:
+        for line in file:
+            stripped_line = line.strip()
+            if (
+                stripped_line == ""
+                or stripped_line.startswith("#")
+                or stripped_line not in lines_seen
+            ):
+                output_lines.append(line)
+                if stripped_line != "":
+                    lines_seen.add(stripped_line)
+
+    with open(dest_file, "w", encoding="utf-8", newline="\n") as file:
+        file.writelines(output_lines)
+
+
+CORPUS = {
+    "clean": "a.com\nb.com\na.com\n",
+    "no trailing newline": "a.com\nb.com\na.com",
+    "header": "# NAME: Test\n# AUTHOR: x\na.com\nb.com\na.com\n",
+    "crlf": "# NAME: Test\r\na.com\r\nb.com\r\n\r\na.com\r\n",
+    "crlf without trailing newline": "a.com\r\nb.com\r\na.com",
+    "bom": "\ufeffa.com\nb.com\na.com\n",
+    "bom before header": "\ufeff# NAME: Test\na.com\na.com\n",
+    "blank lines and comments": "\n\na.com\n  # comment\n\n  b.com  \n\tb.com\n#end",
+    "inline comment": "a.com # comment\nb.com#x\n# only\n",
+    "unicode": "例子.中国\nexample.中国\n例子.中国\n",
+    # str.splitlines() 会在这些字符处分行，逐行读取文件时不会
+    "line separators": "a\x0bb.com\nc\x0cd.com\ne\x1cf.com\ng\x85h.com\ni j.com\n"
+    "k l.com\na\x0bb.com\n",
+    "empty": "",
+    "only newlines": "\n\n",
+}
+
+
+@pytest.fixture(params=CORPUS, ids=list(CORPUS))
+def source(request, tmp_path):
+    path = tmp_path / "source.conf"
+    path.write_bytes(CORPUS[request.param].encode("utf-8"))
+    return str(path)
+
+
+def read(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_read_clean_lines(source):
+    assert until.read_clean_lines(source) == reference_read_clean_lines(source)
+
+
+def test_clear_comment(source, tmp_path):
+    until.clear_comment(source, str(tmp_path / "new"))
+    reference_clear_comment(source, str(tmp_path / "old"))
+
+    assert read(tmp_path / "new") == read(tmp_path / "old")
+
+
+def test_deduplicate(source, tmp_path):
+    until.deduplicate(source, str(tmp_path / "new"))
+    reference_deduplicate(source, str(tmp_path / "old"))
+
+    assert read(tmp_path / "new") == read(tmp_path / "old")
+
+
+def test_deduplicate_in_place(source):
+    expected = source + ".expected"
+    reference_deduplicate(source, expected)
+
+    until.deduplicate(source, source)
+
+    assert read(source) == read(expected)
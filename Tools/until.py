@@ -1,6 +1,15 @@
 import concurrent.futures
+import contextlib
 import datetime
-import re
+import mmap
+
+import metrics
+
+# 正文中出现注释、空行或 str.strip() 会去掉的 ASCII 空白时，需要逐行处理
+# 逐个用 in 查找（memchr），比一次正则字符类扫描快得多
+_NEEDS_CLEANING = (b"#", b"\n\n", b" ", b"\t", b"\r", b"\x0b", b"\x0c") + tuple(
+    bytes([c]) for c in range(0x1C, 0x20)
+)
 
 
 def now_cn_iso8601() -> str:
@@ -32,14 +41,66 @@ def make_build_header(title: str, build_from: list[str]) -> str:
 """
 
 
+@contextlib.contextmanager
+def map_file(file_path: str):
+    """只读映射整个文件，得到可切片、可查找的字节缓冲区；空文件得到 b""。"""
+    with open(file_path, "rb") as f:
+        if not f.seek(0, 2):
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def leading_comment_end(data, pos: int = 0) -> int:
+    """从 pos 开始连续的注释行（strip 后以 # 开头）结束处的字节偏移。"""
+    size = len(data)
+    while pos < size:
+        end = data.find(b"\n", pos)
+        end = size if end == -1 else end + 1
+        if not data[pos:end].strip().startswith(b"#"):
+            break
+        pos = end
+    return pos
+
+
+def _split_lines(data) -> list[bytes]:
+    """只按 LF 分行并去掉 CRLF 留下的 CR，末尾的换行之后不产生空行。"""
+    lines = data.split(b"\n")
+    if not lines[-1]:
+        lines.pop()
+    return [line[:-1] if line.endswith(b"\r") else line for line in lines]
+
+
+def _is_clean(body) -> bool:
+    """body 是否只有纯 ASCII 的规则，每行一条（没有注释、空行与首尾空白）。"""
+    return body.isascii() and not any(c in body for c in _NEEDS_CLEANING)
+
+
+def decode_clean_lines(data, start: int = 0) -> list[str]:
+    """
+    返回 data[start:] 中去掉空白后的非空、非注释行
+    生成的规则文件在文件头之后只有纯 ASCII 的规则，每行一条：
+    在字节上确认这一点后整块解码、一次分行，不再逐行 strip 与判断；
+    否则整块解码后逐行处理，结果与逐行读取相同
+    """
+    body = data[leading_comment_end(data, start) :].strip(b"\n")
+    text = body.decode("utf-8", errors="ignore")
+    if _is_clean(body):
+        return text.split("\n") if text else []
+    # 只按 LF 分行：str.splitlines() 还会在 VT、FF、NEL、U+2028 等字符处分行，
+    # 与逐行读取文件的结果不同；strip() 去掉 CRLF 留下的 CR
+    return [
+        stripped
+        for line in text.split("\n")
+        if (stripped := line.strip()) and not stripped.startswith("#")
+    ]
+
+
 def read_clean_lines(file_path: str) -> list[str]:
     """读取文件，去掉空行与整行注释（以 # 开头），并 strip。"""
-    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-        return [
-            line.strip()
-            for line in f
-            if line.strip() and not line.lstrip().startswith("#")
-        ]
+    with map_file(file_path) as data:
+        return decode_clean_lines(data)
 
 
 def extract_leading_comment_header(lines: list[str]) -> str | None:
@@ -78,50 +139,67 @@ def prepend_text_to_file_binary(path: str, text: str) -> None:
 
 
 def clear_comment(src_file, dest_file) -> None:
-    with open(src_file, "r", encoding="utf-8") as src:
-        lines = src.readlines()
-
-    cleaned_lines = []
-    for line in lines:
-        match = re.match(r"^[^#]*", line)
-        if match:
-            cleaned_lines.append(match.group(0).rstrip() + "\n")
-        else:
-            cleaned_lines.append("\n")
-
-    cleaned_lines = [line for line in cleaned_lines if line.strip()]
+    # "#" 不会出现在 UTF-8 多字节字符中，直接按字节截断，无需解码
+    with map_file(src_file) as data:
+        cleaned_lines = [
+            cleaned
+            for line in data[:].split(b"\n")
+            if (cleaned := line.split(b"#", 1)[0].rstrip())
+        ]
 
-    with open(dest_file, "w", encoding="utf-8", newline="\n") as dest:
-        dest.writelines(filter(None, cleaned_lines))
+    with open(dest_file, "wb") as dest:
+        dest.writelines(line + b"\n" for line in cleaned_lines)
 
     print(f"[Util] Clearing comments for {src_file}")
 
 
 def deduplicate(src_file, dest_file) -> None:
-    lines_seen = set()
-    output_lines = []
-
-    with open(src_file, "r", encoding="utf-8") as file:
-        for line in file:
+    with map_file(src_file) as data:
+        body_start = leading_comment_end(data)
+        header_lines = _split_lines(data[:body_start])
+        body = data[body_start:]
+        ends_with_newline = data[-1:] == b"\n"
+    body_lines = _split_lines(body)
+
+    if _is_clean(body) and not body.startswith(b"\n"):
+        # 文件头之后每行都是规则，直接按行去重
+        output_lines = header_lines + list(dict.fromkeys(body_lines))
+        last_dropped = (
+            not ends_with_newline
+            and bool(body_lines)
+            and body_lines.index(body_lines[-1]) < len(body_lines) - 1
+        )
+    else:
+        lines_seen = set()
+        output_lines = []
+        last_dropped = False
+        for line in header_lines + body_lines:
             stripped_line = line.strip()
-            if (
-                stripped_line == ""
-                or stripped_line.startswith("#")
-                or stripped_line not in lines_seen
-            ):
+            last_dropped = False
+            if not stripped_line or stripped_line[0] == 35:  # "#"
+                output_lines.append(line)
+            elif stripped_line not in lines_seen:
                 output_lines.append(line)
-                if stripped_line != "":
-                    lines_seen.add(stripped_line)
+                lines_seen.add(stripped_line)
+            else:
+                last_dropped = True
 
-    with open(dest_file, "w", encoding="utf-8", newline="\n") as file:
-        file.writelines(output_lines)
+    # 换行统一为 \n；没有换行的最后一行作为重复行去掉时，保留下来的各行都以换行结尾
+    with open(dest_file, "wb") as file:
+        file.write(b"\n".join(output_lines))
+        if output_lines and (ends_with_newline or last_dropped):
+            file.write(b"\n")
 
     print(f"[Util] Deduplication for {src_file}")
 
 
 def run_in_threads(functions) -> None:
+    """并发运行所有函数，全部结束后若有函数抛出异常，则抛出第一个异常。"""
+    # 工作线程在调用方上下文的副本中运行，指标会计入调用方所在的阶段
     with concurrent.futures.ThreadPoolExecutor() as executor:
-        executor.map(lambda f: f(), functions)
+        futures = [executor.submit(metrics.bind(f)) for f in functions]
+    for future in futures:
+        future.result()
 
 
 if __name__ == "__main__":